@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Start an asyncio (aiohttp) server that processes github webhook events and send lark
+notifications. Requires aiohttp (pip install aiohttp).
+
+Payloads are decoded, and events handled if there are no event workers, in the
+default executor, so that the event loop keeps serving other deliveries. Lark messages
+are queued and posted by AsyncLarkBotClient, so a slow lark response does not hold up
+other deliveries.
+"""
+
+import asyncio
+import sys
+
+from aiohttp import web
+
+from lark_bot.async_lark_bot_client import AsyncLarkBotClient
+from lark_bot.delivery_dedupe import DeliveryDedupeCache
+from lark_bot.event_worker_pool import DEFAULT_MAX_QUEUE_SIZE
+from lark_bot.github_webhook_request_handler import GitHubHookIpManager
+from lark_bot.github_event_handler import GithubEventHandler
+from lark_bot.lark_bot_client import DEFAULT_POOL_SIZE
+from lark_bot.lark_delivery import RateLimiter
+from lark_bot.webhook_ingestor import WebhookIngestor, EVENT_DIR
+
+from argparse import ArgumentParser
+
+# github webhook payloads are capped at 25 MB
+MAX_PAYLOAD_SIZE = 25 * 1024 * 1024
+
+
+def get_args():
+    parser = ArgumentParser(description="Github To Lark Dev Bot Server (asyncio)")
+    parser.add_argument("lark_bot_url", help="Lark bot Url")
+    parser.add_argument(
+        "-u",
+        "--user_config_file",
+        default="user_list",
+        help="File path to the lark user id list. A .jsonl or .db/.sqlite file is "
+        "read as json lines or SQLite, see lark_bot.user_store",
+    )
+    parser.add_argument("-p", "--port", type=int, default=9002, help="Server port")
+    parser.add_argument("-l", "--log_event", default=False, action="store_true")
+    parser.add_argument(
+        "-e", "--event_log_dir", default=EVENT_DIR, help="Directory to log events"
+    )
+    parser.add_argument(
+        "--event_log_compression",
+        choices=["gzip", "zstd"],
+        default=None,
+        help="Compress the event log segments, zstd requires zstandard",
+    )
+    parser.add_argument(
+        "--event_workers",
+        type=int,
+        default=1,
+        help="Number of background threads processing events. The request is "
+        "acknowledged with 202 once the event is queued. If 0, events are "
+        "processed before responding to github.",
+    )
+    parser.add_argument(
+        "--event_queue_size",
+        type=int,
+        default=DEFAULT_MAX_QUEUE_SIZE,
+        help="Max number of queued events before responding 503 to github",
+    )
+    parser.add_argument(
+        "--allow_subnet",
+        action="append",
+        default=[],
+        help="Subnet (CIDR) allowed to post events in addition to github hooks, "
+        "e.g. a github enterprise or proxy range. Can be repeated.",
+    )
+    parser.add_argument(
+        "--lark_connections",
+        type=int,
+        default=DEFAULT_POOL_SIZE,
+        help="Max number of concurrent connections to lark",
+    )
+    parser.add_argument(
+        "--no_lark_rate_limit",
+        default=False,
+        action="store_true",
+        help="Do not rate limit lark messages, e.g. to benchmark against a local "
+        "lark stand-in. Lark rejects messages over its limits.",
+    )
+    parser.add_argument(
+        "--lark_outbox_dir",
+        default=None,
+        help="Directory to persist lark messages until they are delivered, so that "
+        "they are resent after a restart",
+    )
+    parser.add_argument(
+        "--delivery_cache_file",
+        default=None,
+        help="File to persist seen X-GitHub-Delivery ids, so that redeliveries are "
+        "still skipped after a restart",
+    )
+    parser.add_argument(
+        "--coalesce_window",
+        type=float,
+        default=0,
+        help="Seconds to wait for related updates of an issue/PR to merge them into "
+        "one lark card. If 0, every update is posted right away.",
+    )
+    return parser.parse_args()
+
+
+INGESTOR = web.AppKey("ingestor", WebhookIngestor)
+IP_MANAGER = web.AppKey("ip_manager", GitHubHookIpManager)
+LARK_CLIENT = web.AppKey("lark_client", AsyncLarkBotClient)
+
+
+async def handle_webhook(request: web.Request) -> web.Response:
+    ingestor = request.app[INGESTOR]
+    if not request.app[IP_MANAGER].check_from_github(request.remote):
+        sys.stderr.write(f"Got POST from outside github: {request.remote}. Return 403.\n")
+        return web.json_response({"error": "Unauthorized IP"}, status=403)
+
+    event_name = request.headers.get("X-GitHub-Event")
+    delivery_id = request.headers.get("X-GitHub-Delivery")
+    response = ingestor.precheck(event_name, delivery_id)
+    if response is None:
+        try:
+            body = await request.read()
+            response = await asyncio.get_running_loop().run_in_executor(
+                None, ingestor.ingest, event_name, delivery_id, body
+            )
+        except BaseException:
+            # e.g. the client disconnected, so that a redelivery is processed
+            ingestor.release(delivery_id)
+            raise
+    else:
+        # read the unused body, which would otherwise be parsed as the next request
+        await request.release()
+    status, body, headers = response
+    return web.json_response(body, status=status, headers=headers)
+
+
+async def handle_stats(request: web.Request) -> web.Response:
+    # only for the allowed subnets, as the stats expose the delivery state
+    if not request.app[IP_MANAGER].check_from_github(request.remote):
+        return web.json_response({"error": "Unauthorized IP"}, status=403)
+    return web.json_response(request.app[INGESTOR].stats())
+
+
+async def handle_health(_: web.Request) -> web.Response:
+    return web.Response(status=200)
+
+
+async def start_lark_client(app: web.Application):
+    await app[LARK_CLIENT].start()
+
+
+async def shutdown(app: web.Application):
+    # drain the queued events and coalesced updates, then deliver their lark messages
+    await asyncio.get_running_loop().run_in_executor(None, app[INGESTOR].shutdown)
+    await app[LARK_CLIENT].aclose()
+
+
+def create_app(
+    ingestor: WebhookIngestor,
+    ip_manager: GitHubHookIpManager,
+    lark_client: AsyncLarkBotClient,
+) -> web.Application:
+    app = web.Application(client_max_size=MAX_PAYLOAD_SIZE)
+    app[INGESTOR] = ingestor
+    app[IP_MANAGER] = ip_manager
+    app[LARK_CLIENT] = lark_client
+    app.router.add_post("/", handle_webhook)
+    app.router.add_get("/stats", handle_stats)
+    app.router.add_get("/health", handle_health)
+    app.on_startup.append(start_lark_client)
+    app.on_cleanup.append(shutdown)
+    return app
+
+
+if __name__ == "__main__":
+    main_args = get_args()
+    lark_bot_client = AsyncLarkBotClient(
+        main_args.lark_bot_url,
+        pool_size=main_args.lark_connections,
+        outbox_dir=main_args.lark_outbox_dir,
+        rate_limiter=RateLimiter([]) if main_args.no_lark_rate_limit else None,
+    )
+    event_handler = GithubEventHandler(
+        main_args.user_config_file,
+        main_args.lark_bot_url,
+        lark_bot_client=lark_bot_client,
+        coalesce_window=main_args.coalesce_window,
+    )
+    webhook_ingestor = WebhookIngestor(
+        event_handler,
+        event_log_dir=main_args.event_log_dir,
+        always_log_event=main_args.log_event,
+        event_log_compression=main_args.event_log_compression,
+        num_workers=main_args.event_workers,
+        max_queue_size=main_args.event_queue_size,
+        dedupe_cache=DeliveryDedupeCache(persist_path=main_args.delivery_cache_file),
+    )
+    hook_ip_manager = GitHubHookIpManager(extra_subnets=main_args.allow_subnet)
+
+    # run_app exits on SIGINT and SIGTERM (e.g. docker stop) and runs the cleanup
+    web.run_app(
+        create_app(webhook_ingestor, hook_ip_manager, lark_bot_client),
+        port=main_args.port,
+    )
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Replay a corpus of events through GithubEventHandler, as test_event.py does for one
+event, posting to a local lark stand-in, and report the throughput, the latency per
+event type, the allocations and the peak RSS.
+"""
+
+from benchmark_servers import find_logins
+from benchmark_skip_notification import FIXTURE_EVENTS
+from lark_bot.event_archive import EventArchive
+from lark_bot.event_log_writer import SEGMENT_SUFFIXES, read_segment
+from lark_bot.github_event_handler import GithubEventHandler
+from lark_bot.lark_bot_client import LarkBotClient
+from lark_bot.lark_delivery import RateLimiter
+from lark_bot.mock_lark_server import MockLarkServer
+from lark_bot.payload_decoder import loads
+
+from argparse import ArgumentParser
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from typing import Iterator, List, Tuple
+import glob
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def get_args():
+    parser = ArgumentParser(description="Replay benchmark of GithubEventHandler")
+    parser.add_argument(
+        "corpus",
+        nargs="?",
+        default=os.path.join(ROOT_DIR, "tests", "data"),
+        help="tests/data style directory of fixtures, event log directory, event log "
+        "segment (.jsonl, .jsonl.gz, .jsonl.zst) or archive (.db) of replay_events.py",
+    )
+    parser.add_argument(
+        "-u",
+        "--user_config_file",
+        default=None,
+        help="File path to the lark user id list. By default, every github login in "
+        "the corpus is a user.",
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=100, help="Passes over the corpus")
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=1, help="Threads handling events"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Events per second to replay, 0 for no limit"
+    )
+    parser.add_argument(
+        "--lark_latency",
+        type=float,
+        default=0,
+        help="Seconds the lark stand-in waits before answering",
+    )
+    parser.add_argument(
+        "--lark_error_rate",
+        type=float,
+        default=0,
+        help="Fraction of posts the lark stand-in answers 503, to exercise retries",
+    )
+    parser.add_argument(
+        "--lark_rate_limit",
+        default=False,
+        action="store_true",
+        help="Keep the lark bot rate limit of LarkBotClient",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        default=False,
+        action="store_true",
+        help="Trace allocations, which slows down the replay",
+    )
+    return parser.parse_args()
+
+
+def load_corpus(path: str) -> List[Tuple[str, bytes]]:
+    """(event name, payload) of the events of the corpus."""
+    if path.endswith(".db"):
+        archive = EventArchive(path)
+        try:
+            return [(e.event_name, archive.payload(e.id)) for e in archive.query()]
+        finally:
+            archive.close()
+    if os.path.isfile(path):
+        segments = [path]
+    else:
+        segments = []
+        for suffix in SEGMENT_SUFFIXES.values():
+            segments += sorted(glob.glob(os.path.join(path, f"events-*{suffix}")))
+
+    corpus = []
+    for segment in segments:
+        for line in read_segment(segment):
+            record = json.loads(line)
+            corpus.append(
+                (record["event"], json.dumps(record["payload"]).encode("utf-8"))
+            )
+    if os.path.isdir(path):
+        # fixtures, and events of the older <event>-<action>/<time>.json log layout
+        for file_path in sorted(glob.glob(os.path.join(path, "*.json"))):
+            event_name = FIXTURE_EVENTS.get(os.path.basename(file_path))
+            if event_name is not None:
+                with open(file_path, "rb") as f:
+                    corpus.append((event_name, f.read()))
+        for file_path in sorted(glob.glob(os.path.join(path, "*", "*.json"))):
+            event_name = os.path.basename(os.path.dirname(file_path)).split("-", 1)[0]
+            with open(file_path, "rb") as f:
+                corpus.append((event_name, f.read()))
+    return corpus
+
+
+def paced(corpus: List[Tuple[str, bytes]], repeat: int, rate: float) -> Iterator:
+    """
+    The corpus repeated, as (monotonic time the event is due, event) to replay at most
+    rate events per second if rate > 0. The events are due right away otherwise.
+    """
+    start = time.monotonic()
+    for i in range(repeat * len(corpus)):
+        yield (start + i / rate if rate > 0 else 0), corpus[i % len(corpus)]
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class Replayer:
+    """
+    Handles the events on concurrency threads, recording the latency per event. Each
+    thread waits for the event it took to be due, so the others keep taking events.
+    """
+
+    def __init__(self, event_handler: GithubEventHandler, concurrency: int) -> None:
+        self._event_handler = event_handler
+        self._concurrency = concurrency
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)  # event name -> seconds
+        self.errors = 0
+
+    def _handle(self, events: Iterator):
+        while True:
+            with self._lock:
+                event = next(events, None)
+            if event is None:
+                return
+            due, (event_name, body) = event
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            webhook_json = loads(body)
+            start = time.perf_counter()
+            try:
+                self._event_handler.handle_event(event_name, webhook_json)
+            except Exception:  # pylint: disable=broad-exception-caught
+                with self._lock:
+                    self.errors += 1
+                continue
+            latency = time.perf_counter() - start
+            with self._lock:
+                self.latencies[event_name].append(latency)
+
+    def run(self, events: Iterator) -> float:
+        """Returns the elapsed seconds."""
+        start = time.perf_counter()
+        if self._concurrency <= 1:
+            self._handle(events)
+        else:
+            with ThreadPoolExecutor(self._concurrency) as pool:
+                for _ in range(self._concurrency):
+                    pool.submit(self._handle, events)
+        return time.perf_counter() - start
+
+
+def main():
+    args = get_args()
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        raise SystemExit(f"No events in {args.corpus}")
+
+    sink = MockLarkServer(
+        ("127.0.0.1", 0),
+        latency=args.lark_latency,
+        server_error_rate=args.lark_error_rate,
+    )
+    sink.serve_in_background()
+    user_config_file = args.user_config_file
+    try:
+        lark_bot_url = sink.url
+
+        if user_config_file is None:
+            logins = set()
+            for _, corpus_body in corpus:
+                find_logins(loads(corpus_body), logins)
+            with tempfile.NamedTemporaryFile("w", suffix="_user_list", delete=False) as f:
+                for login in sorted(logins):
+                    f.write(f"{login} ou_{login.lower()}\n")
+            user_config_file = f.name
+
+        handler = GithubEventHandler(
+            user_config_file,
+            lark_bot_url,
+            lark_bot_client=LarkBotClient(
+                lark_bot_url,
+                pool_size=max(1, args.concurrency),
+                rate_limiter=None if args.lark_rate_limit else RateLimiter([]),
+            ),
+        )
+        # the handler prints every event it skips or posts, which is not to be timed
+        with open(os.devnull, "w", encoding="utf-8") as devnull, redirect_stdout(devnull):
+            # warm up, e.g. the lazily imported event classes and the mention cache
+            Replayer(handler, 1).run(paced(corpus, 1, 0))
+
+            if args.tracemalloc:
+                tracemalloc.start()
+            replayer = Replayer(handler, args.concurrency)
+            elapsed = replayer.run(paced(corpus, args.repeat, args.rate))
+        snapshot, traced_peak = None, 0
+        if args.tracemalloc:
+            _, traced_peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        handler.close()
+    finally:
+        sink.shutdown()
+        sink.server_close()
+        if args.user_config_file is None and user_config_file is not None:
+            os.remove(user_config_file)
+
+    total = sum(len(latencies) for latencies in replayer.latencies.values())
+    print(f"{len(corpus)} events x {args.repeat}, {args.concurrency} threads")
+    print(f"{total / elapsed:.1f} events/s, {replayer.errors} errors")
+    print(f"{'event':<32} {'count':>7} {'p50 us':>10} {'p99 us':>10}")
+    for event_name, latencies in sorted(replayer.latencies.items()):
+        latencies.sort()
+        print(
+            f"{event_name:<32} {len(latencies):>7} "
+            f"{percentile(latencies, 0.5) * 1e6:>10.1f} {percentile(latencies, 0.99) * 1e6:>10.1f}"
+        )
+    # ru_maxrss is in KB on linux
+    print(f"lark mock: {sink.stats()}, delivery: {handler.stats()['lark_delivery']}")
+    print(f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    if snapshot is not None:
+        print(f"peak traced memory {traced_peak / 1024:.1f} KB, top allocations:")
+        for stat in snapshot.statistics("lineno")[:10]:
+            print(f"  {stat}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Load benchmark of the webhook servers: post the events in tests/data concurrently to
+each server, with a local lark stand-in answering after a delay. The lark rate limit
+is disabled on every server, so that the servers are compared rather than the limit.
+"""
+
+from benchmark_skip_notification import FIXTURE_EVENTS
+from lark_bot.mock_lark_server import MockLarkServer
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT_DIR = os.path.dirname(os.path.realpath(__file__))
+SERVERS = {
+    "http": "start_bot_backend.py",
+    "flask": "bot_backend.py",
+    "async": "async_bot_backend.py",
+}
+START_TIMEOUT = 30  # seconds
+
+
+def get_args():
+    parser = ArgumentParser(description="Load benchmark of the webhook servers")
+    parser.add_argument(
+        "-s",
+        "--server",
+        action="append",
+        choices=list(SERVERS),
+        help="Server to benchmark, can be repeated. Default all.",
+    )
+    parser.add_argument(
+        "-d",
+        "--data_dir",
+        default=os.path.join(ROOT_DIR, "tests", "data"),
+        help="Directory of the event json files",
+    )
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="Requests per server")
+    parser.add_argument("-c", "--concurrency", type=int, default=200)
+    parser.add_argument(
+        "--lark_latency",
+        type=float,
+        default=0.2,
+        help="Seconds the lark stand-in waits before answering",
+    )
+    parser.add_argument(
+        "--server_args",
+        default="",
+        help="Extra arguments of the servers, e.g. '--event_workers 8'",
+    )
+    return parser.parse_args()
+
+
+def find_logins(value, logins: set):
+    if isinstance(value, dict):
+        if isinstance(value.get("login"), str):
+            logins.add(value["login"])
+        for item in value.values():
+            find_logins(item, logins)
+    elif isinstance(value, list):
+        for item in value:
+            find_logins(item, logins)
+
+
+def load_fixtures(data_dir: str):
+    """[(event name, body)] of the fixtures, and the github logins in them."""
+    fixtures, logins = [], set()
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.json"))):
+        event_name = FIXTURE_EVENTS.get(os.path.basename(path))
+        if event_name is None:
+            continue
+        with open(path, "rb") as f:
+            body = f.read()
+        find_logins(json.loads(body), logins)
+        fixtures.append((event_name, body))
+    return fixtures, logins
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(port: int, process: subprocess.Popen):
+    deadline = time.time() + START_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/stats")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server not up in {START_TIMEOUT}s")
+
+
+def post_event(port: int, event_name: str, body: bytes) -> float:
+    """Seconds until the server responds, raises if the response is not 2xx."""
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    try:
+        conn.request(
+            "POST",
+            "/",
+            body,
+            {
+                "X-GitHub-Event": event_name,
+                "X-GitHub-Delivery": str(uuid.uuid4()),
+                "Content-Type": "application/json",
+            },
+        )
+        response = conn.getresponse()
+        response.read()
+    finally:
+        conn.close()
+    if response.status >= 300:
+        raise RuntimeError(f"{event_name}: {response.status}")
+    return time.perf_counter() - start
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run(server: str, lark_url: str, user_list: str, fixtures, args) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as event_log_dir:
+        command = [
+            sys.executable,
+            os.path.join(ROOT_DIR, SERVERS[server]),
+            lark_url,
+            "-u",
+            user_list,
+            "-p",
+            str(port),
+            "-e",
+            event_log_dir,
+            "--allow_subnet",
+            "127.0.0.1/32",
+            "--no_lark_rate_limit",
+        ] + args.server_args.split()
+        process = subprocess.Popen(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_until_up(port, process)
+            requests = [fixtures[i % len(fixtures)] for i in range(args.requests)]
+            latencies, errors = [], 0
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                futures = [
+                    pool.submit(post_event, port, event_name, body)
+                    for event_name, body in requests
+                ]
+                for future in futures:
+                    try:
+                        latencies.append(future.result())
+                    except Exception:  # pylint: disable=broad-exception-caught
+                        errors += 1
+            elapsed = time.perf_counter() - start
+        finally:
+            process.terminate()
+            process.wait()
+    latencies.sort()
+    return {
+        "server": server,
+        "req/s": len(latencies) / elapsed,
+        "p50 ms": percentile(latencies, 0.5) * 1000,
+        "p99 ms": percentile(latencies, 0.99) * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    args = get_args()
+    fixtures, logins = load_fixtures(args.data_dir)
+
+    sink = MockLarkServer(("127.0.0.1", 0), latency=args.lark_latency)
+    sink.serve_in_background()
+
+    with tempfile.NamedTemporaryFile("w", suffix="_user_list", delete=False) as f:
+        for login in sorted(logins):
+            f.write(f"{login} ou_{login.lower()}\n")
+    try:
+        print(f"{'server':<8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>7}")
+        for name in args.server or list(SERVERS):
+            result = run(name, sink.url, f.name, fixtures, args)
+            print(
+                f"{result['server']:<8} {result['req/s']:>10.1f} {result['p50 ms']:>10.1f} "
+                f"{result['p99 ms']:>10.1f} {result['errors']:>7}"
+            )
+    finally:
+        os.remove(f.name)
+        sink.shutdown()
+        sink.server_close()
+        print(f"lark mock: {sink.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Micro-benchmark of the skip decision of the events in tests/data"""
+
+from lark_bot import events
+from lark_bot.events.timestamps import updated_within
+from lark_bot.github_event_handler import COMBINE_RELATED_UPDATES_TIME
+
+from argparse import ArgumentParser
+from datetime import datetime
+import glob
+import json
+import os
+import timeit
+
+# fixture file name -> event name
+FIXTURE_EVENTS = {
+    "test_check_run_completed.json": "check_run",
+    "test_issue_assigned.json": "issues",
+    "test_issue_comment.json": "issue_comment",
+    "test_new_issue.json": "issues",
+    "test_new_pr.json": "pull_request",
+    "test_pr_review_submitted.json": "pull_request_review",
+    "test_pr_sync.json": "pull_request",
+    "test_workflow_run_completed.json": "workflow_run",
+}
+
+# actions whose skip decision compares the created_at and updated_at timestamps
+TIMESTAMP_ACTIONS = {"issues": "assigned", "pull_request": "review_requested"}
+
+
+def get_args():
+    parser = ArgumentParser(description="Benchmark should_skip_notification")
+    parser.add_argument(
+        "-d",
+        "--data_dir",
+        default=os.path.join(
+            os.path.dirname(os.path.realpath(__file__)), "tests", "data"
+        ),
+        help="Directory of the event json files",
+    )
+    parser.add_argument("-n", "--number", type=int, default=20000, help="Runs per case")
+    return parser.parse_args()
+
+
+def strptime_updated_within(created_at: str, updated_at: str, interval: float) -> bool:
+    """The previous timestamp comparison, for reference."""
+    create_time = datetime.strptime(created_at, "%Y-%m-%dT%H:%M:%SZ")
+    update_time = datetime.strptime(updated_at, "%Y-%m-%dT%H:%M:%SZ")
+    return update_time.timestamp() - create_time.timestamp() <= interval
+
+
+def load_cases(data_dir: str):
+    """(fixture, event name, payload) of each fixture, with timestamp actions added."""
+    cases = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.json"))):
+        event_name = FIXTURE_EVENTS.get(os.path.basename(path))
+        if events.get_event_class(event_name) is None:
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            webhook_json = json.load(f)
+        cases.append((os.path.basename(path), event_name, webhook_json))
+        action = TIMESTAMP_ACTIONS.get(event_name)
+        if action is not None and webhook_json["action"] != action:
+            name = f"{os.path.basename(path)}:{action}"
+            cases.append((name, event_name, dict(webhook_json, action=action)))
+    return cases
+
+
+def per_call_us(func, number: int) -> float:
+    return timeit.timeit(func, number=number) / number * 1e6
+
+
+def main():
+    args = get_args()
+    cases = load_cases(args.data_dir)
+
+    print(f"{'case':<48} {'skip':>5} {'should_skip us':>15}")
+    for name, event_name, webhook_json in cases:
+        try:
+            event = events.get_event_class(event_name)(event_name, webhook_json)
+        except (KeyError, TypeError) as e:
+            print(f"{name:<48} cannot build event: {e!r}")
+            continue
+        skip = event.should_skip_notification(COMBINE_RELATED_UPDATES_TIME)
+        cost = per_call_us(
+            lambda event=event: event.should_skip_notification(
+                COMBINE_RELATED_UPDATES_TIME
+            ),
+            args.number,
+        )
+        print(f"{name:<48} {str(skip):>5} {cost:>15.3f}")
+
+    timestamps = [
+        (subject["created_at"], subject["updated_at"])
+        for _, _, webhook_json in cases
+        for subject in [webhook_json.get("issue") or webhook_json.get("pull_request")]
+        if subject is not None
+    ]
+    print()
+    for label, compare in [
+        ("strptime (before)", strptime_updated_within),
+        ("fromisoformat", updated_within),
+    ]:
+        cost = per_call_us(
+            lambda compare=compare: [
+                compare(created_at, updated_at, COMBINE_RELATED_UPDATES_TIME)
+                for created_at, updated_at in timestamps
+            ],
+            args.number,
+        ) / max(len(timestamps), 1)
+        print(f"timestamp comparison, {label:<20} {cost:>8.3f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,15 +18,20 @@
 
 import sys
 import os
-import json
-from datetime import datetime
+import signal
 
 from flask import Flask, request, jsonify
 
+from lark_bot.delivery_dedupe import DeliveryDedupeCache
+from lark_bot.event_worker_pool import DEFAULT_MAX_QUEUE_SIZE
 from lark_bot.github_webhook_request_handler import (
     GitHubHookIpManager,
+    DISCARD_CHUNK_SIZE,
 )
 from lark_bot.github_event_handler import GithubEventHandler
+from lark_bot.lark_bot_client import LarkBotClient, DEFAULT_POOL_SIZE
+from lark_bot.lark_delivery import RateLimiter
+from lark_bot.webhook_ingestor import WebhookIngestor
 
 from argparse import ArgumentParser
 
@@ -38,7 +43,8 @@ def get_args():
         "-u",
         "--user_config_file",
         default="user_list",
-        help="File path to the lark user id list",
+        help="File path to the lark user id list. A .jsonl or .db/.sqlite file is "
+        "read as json lines or SQLite, see lark_bot.user_store",
     )
     parser.add_argument("-p", "--port", type=int, default=9002, help="Server port")
     parser.add_argument(
@@ -55,36 +61,75 @@ def get_args():
         default=os.path.join(os.path.dirname(os.path.realpath(__file__)), "event_log"),
         help="Directory to log events",
     )
+    parser.add_argument(
+        "--event_log_compression",
+        choices=["gzip", "zstd"],
+        default=None,
+        help="Compress the event log segments, zstd requires zstandard",
+    )
+    parser.add_argument(
+        "--event_workers",
+        type=int,
+        default=1,
+        help="Number of background threads processing events. The request is "
+        "acknowledged with 202 once the event is queued. If 0, events are "
+        "processed before responding to github.",
+    )
+    parser.add_argument(
+        "--event_queue_size",
+        type=int,
+        default=DEFAULT_MAX_QUEUE_SIZE,
+        help="Max number of queued events before responding 503 to github",
+    )
+    parser.add_argument(
+        "--allow_subnet",
+        action="append",
+        default=[],
+        help="Subnet (CIDR) allowed to post events in addition to github hooks, "
+        "e.g. a github enterprise or proxy range. Can be repeated.",
+    )
+    parser.add_argument(
+        "--lark_http2",
+        default=False,
+        action="store_true",
+        help="Post to lark over HTTP/2, requires httpx[http2]",
+    )
+    parser.add_argument(
+        "--no_lark_rate_limit",
+        default=False,
+        action="store_true",
+        help="Do not rate limit lark messages, e.g. to benchmark against a local "
+        "lark stand-in. Lark rejects messages over its limits.",
+    )
+    parser.add_argument(
+        "--lark_outbox_dir",
+        default=None,
+        help="Directory to persist lark messages until they are delivered, so that "
+        "they are resent after a restart",
+    )
+    parser.add_argument(
+        "--delivery_cache_file",
+        default=None,
+        help="File to persist seen X-GitHub-Delivery ids, so that redeliveries are "
+        "still skipped after a restart",
+    )
+    parser.add_argument(
+        "--coalesce_window",
+        type=float,
+        default=0,
+        help="Seconds to wait for related updates of an issue/PR to merge them into "
+        "one lark card. If 0, every update is posted right away.",
+    )
     return parser.parse_args()
 
 
-def log_event(
-    event_log_dir: str, event_name: str, event_json: object, timestamp: datetime
-):
-    if "action" in event_json:
-        dir_name = f"{event_name}-{event_json['action']}"
-    else:
-        dir_name = event_name
-    os.makedirs(os.path.join(event_log_dir, dir_name), exist_ok=True)
-    with open(
-        os.path.join(
-            event_log_dir,
-            dir_name,
-            timestamp.strftime("%Y%m%d-%H%M%S.%f") + ".json",
-        ),
-        "w",
-        encoding="utf-8",
-    ) as event_output:
-        event_output.write(json.dumps(event_json, indent=2))
-
-
 app = Flask(__name__)
 
 
 @app.route("/", methods=["POST"])
 def handle_webhook():
     # Initialize handlers
-    event_handler = app.config["EVENT_HANDLER"]
+    ingestor = app.config["INGESTOR"]
     ip_manager = app.config["IP_MANAGER"]
 
     # Verify IP if necessary
@@ -95,29 +140,63 @@ def handle_webhook():
         return jsonify({"error": "Unauthorized IP"}), 403
 
     # Process the event
-    now = datetime.now()
-    webhook_json = request.json
     event_name = request.headers.get("X-GitHub-Event")
+    delivery_id = request.headers.get("X-GitHub-Delivery")
     print(event_name)
-    try:
-        event_handler.handle_event(event_name, webhook_json)
-        if app.config["LOG_EVENT"]:
-            log_event(app.config["EVENT_LOG_DIR"], event_name, webhook_json, now)
-    except Exception as e:  # pylint: disable=broad-except
-        sys.stderr.write(f"Error handling event: {e}\n")
-        log_event(app.config["EVENT_LOG_DIR"], event_name, webhook_json, now)
-        return jsonify({"status": "error"}), 200
+    response = ingestor.precheck(event_name, delivery_id)
+    if response is None:
+        try:
+            response = ingestor.ingest(event_name, delivery_id, request.get_data())
+        except BaseException:
+            # e.g. the client disconnected, so that a redelivery is processed
+            ingestor.release(delivery_id)
+            raise
+    else:
+        # read the unused body, which would otherwise be parsed as the next request
+        while request.stream.read(DISCARD_CHUNK_SIZE):
+            pass
+    status, body, headers = response
+    return jsonify(body), status, headers
 
-    return jsonify({"status": "success"}), 200
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    # only for the allowed subnets, as the stats expose the delivery state
+    if not app.config["IP_MANAGER"].check_from_github(request.remote_addr):
+        return jsonify({"error": "Unauthorized IP"}), 403
+    return jsonify(app.config["INGESTOR"].stats()), 200
 
 
 if __name__ == "__main__":
     main_args = get_args()
-    app.config["EVENT_HANDLER"] = GithubEventHandler(
-        main_args.user_config_file, main_args.lark_bot_url
+    event_handler = GithubEventHandler(
+        main_args.user_config_file,
+        main_args.lark_bot_url,
+        lark_bot_client=LarkBotClient(
+            main_args.lark_bot_url,
+            pool_size=max(DEFAULT_POOL_SIZE, main_args.event_workers),
+            http2=main_args.lark_http2,
+            outbox_dir=main_args.lark_outbox_dir,
+            rate_limiter=RateLimiter([]) if main_args.no_lark_rate_limit else None,
+        ),
+        coalesce_window=main_args.coalesce_window,
+    )
+    app.config["INGESTOR"] = WebhookIngestor(
+        event_handler,
+        event_log_dir=main_args.event_log_dir,
+        always_log_event=main_args.log_event,
+        event_log_compression=main_args.event_log_compression,
+        num_workers=main_args.event_workers,
+        max_queue_size=main_args.event_queue_size,
+        dedupe_cache=DeliveryDedupeCache(persist_path=main_args.delivery_cache_file),
+    )
+    app.config["IP_MANAGER"] = GitHubHookIpManager(
+        extra_subnets=main_args.allow_subnet
     )
-    app.config["IP_MANAGER"] = GitHubHookIpManager()
-    app.config["LOG_EVENT"] = main_args.log_event
-    app.config["EVENT_LOG_DIR"] = main_args.event_log_dir
 
-    app.run(host="0.0.0.0", port=main_args.port, debug=False)
+    # exit app.run on SIGTERM (e.g. docker stop) so that queued events are drained
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        app.run(host="0.0.0.0", port=main_args.port, debug=False)
+    finally:
+        app.config["INGESTOR"].shutdown()
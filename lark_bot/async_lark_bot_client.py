@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Client to push message to lark bot from an asyncio event loop."""
+
+import asyncio
+import sys
+from functools import partial
+from typing import Callable, Dict, List
+
+import aiohttp
+
+from lark_bot.events import BaseGithubEvent
+from lark_bot.lark_bot_client import (
+    Notification,
+    build_card,
+    POST_TIMEOUT,
+    CONNECT_TIMEOUT,
+    DEFAULT_POOL_SIZE,
+)
+from lark_bot.lark_delivery import (
+    RateLimiter,
+    CircuitBreaker,
+    DeliveryPolicy,
+    SentResponse,
+    retry_delay,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_MAX_PENDING,
+)
+from lark_bot.lark_outbox import LarkOutbox
+
+CLOSE_TIMEOUT = 10  # seconds to deliver the queued messages on close
+
+
+class AsyncLarkBotClient:
+    """
+    Client to push message to the Lark bot from an asyncio server.
+
+    post_notification() only queues the message, so it never blocks the event loop and
+    can also be called from other threads (e.g. a NotificationCoalescer). Sender tasks
+    on the event loop post the queued messages through one pooled aiohttp session,
+    with the DeliveryPolicy (rate limiting, retries, circuit breaker) of LarkDelivery. A message is
+    retried until lark accepts or rejects it, and the oldest queued message is dropped
+    when more than max_pending are queued.
+
+    Call start() on the event loop before posting, and aclose() to deliver the queued
+    messages before exit.
+    """
+
+    def __init__(
+        self,
+        lark_bot_url: str,
+        post_time_out: int = POST_TIMEOUT,
+        connect_time_out: int = CONNECT_TIMEOUT,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        outbox_dir: str = None,
+        rate_limiter: RateLimiter = None,
+        circuit_breaker: CircuitBreaker = None,
+    ) -> None:
+        self._lark_bot_url = lark_bot_url
+        self._post_time_out = post_time_out
+        self._connect_time_out = connect_time_out
+        self._pool_size = pool_size
+        self._max_retries = max_retries
+        self._max_pending = max_pending
+        self._policy = DeliveryPolicy("AsyncLarkBotClient", rate_limiter, circuit_breaker)
+        self._outbox = None if outbox_dir is None else LarkOutbox(outbox_dir)
+        self._loop = None
+        self._queue = None
+        self._session = None
+        self._senders = []
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self._pool_size),
+            timeout=aiohttp.ClientTimeout(
+                connect=self._connect_time_out, sock_read=self._post_time_out
+            ),
+        )
+        self._senders = [
+            self._loop.create_task(self._send_loop()) for _ in range(self._pool_size)
+        ]
+        if self._outbox is not None:
+            for message_id, data in self._outbox.pending():
+                self._enqueue(data, partial(self._outbox.ack, message_id))
+
+    async def aclose(self, timeout: float = CLOSE_TIMEOUT):
+        """Deliver the queued messages for up to timeout seconds, then stop."""
+        if self._session is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            sys.stderr.write(
+                f"[AsyncLarkBotClient] {self._queue.qsize()} messages not delivered\n"
+            )
+        for sender in self._senders:
+            sender.cancel()
+        await asyncio.gather(*self._senders, return_exceptions=True)
+        await self._session.close()
+        self._session = None
+        if self._outbox is not None:
+            self._outbox.close()
+
+    def close(self):
+        """Closed by aclose() on the event loop, as the session cannot be closed here."""
+
+    def stats(self) -> Dict[str, int]:
+        """Delivery counters, see LarkDelivery.stats."""
+        return self._policy.stats(0 if self._queue is None else self._queue.qsize())
+
+    def post_to_lark(self, event: BaseGithubEvent, user_ids: List[str]):
+        return self.post_notification(Notification.from_event(event), user_ids)
+
+    def post_notification(self, notification: Notification, user_ids: List[str]):
+        """Queue the notification. Returns None, as the message is sent later."""
+        print(
+            f"[AsyncLarkBotClient] Post event {notification.event_name} {notification.title} to lark"
+        )
+        data = build_card(notification, user_ids)
+        ack = None
+        if self._outbox is not None:
+            ack = partial(self._outbox.ack, self._outbox.put(data))
+        self._loop.call_soon_threadsafe(self._enqueue, data, ack)
+
+    def _enqueue(self, data: Dict, ack: Callable):
+        if self._queue.qsize() >= self._max_pending:
+            _, dropped_ack = self._queue.get_nowait()
+            self._queue.task_done()
+            self._policy.on_dropped(dropped_ack)
+        self._queue.put_nowait((data, ack))
+
+    async def _send_loop(self):
+        while True:
+            data, ack = await self._queue.get()
+            try:
+                if await self._deliver(data) and ack is not None:
+                    ack()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                sys.stderr.write(f"[AsyncLarkBotClient] {e}\n")
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, data: Dict) -> SentResponse:
+        async with self._session.post(self._lark_bot_url, json=data) as response:
+            return SentResponse(response.status, await response.text(), response.headers)
+
+    async def _deliver(self, data: Dict) -> bool:
+        """Returns True once lark accepts or rejects the message."""
+        attempt = 0
+        while True:
+            wait = self._policy.wait_before_attempt(attempt)
+            if wait is None:
+                await asyncio.sleep(self._policy.circuit_wait())
+                continue
+            if wait > 0:
+                await asyncio.sleep(wait)
+            response = None
+            try:
+                response = await self._send(data)
+                delivered = self._policy.on_response(response)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._policy.on_transport_error(e)
+                delivered = None
+            if delivered is not None:
+                return True
+            await asyncio.sleep(retry_delay(min(attempt, self._max_retries), response))
+            attempt += 1
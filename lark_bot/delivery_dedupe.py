@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Cache of recently seen github webhook delivery ids."""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 3 * 24 * 3600  # seconds, github allows redelivering deliveries up to 3 days old
+DEFAULT_MAX_SIZE = 100000
+MIN_COMPACT_LINES = 1000  # the persist file is not compacted below this many lines
+
+
+class DeliveryDedupeCache:
+    """
+    Remember X-GitHub-Delivery ids for ttl seconds, up to max_size ids, to drop redeliveries.
+
+    A delivery is in flight from add() until complete() or discard(), so that a
+    redelivery arriving meanwhile can be told to retry rather than be dropped, in
+    case the first copy fails.
+
+    With persist_path, completed ids are appended to the file so that the window
+    survives a restart. The file is compacted to the live ids when loaded, and once
+    it holds twice as many lines as live ids.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL,
+        max_size: int = DEFAULT_MAX_SIZE,
+        persist_path: str = None,
+    ) -> None:
+        self._ttl = ttl
+        self._max_size = max_size
+        self._seen = OrderedDict()  # delivery id -> time first seen, oldest first
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._persist_path = persist_path
+        self._persist_file = None
+        self._num_lines = 0  # lines in the persist file
+        self._num_duplicates = 0
+        if persist_path is not None:
+            self._load(persist_path)
+            self._compact()
+            sys.stderr.write(
+                f"[DeliveryDedupeCache] Loaded {len(self._seen)} delivery ids\n"
+            )
+
+    def _load(self, persist_path: str):
+        if os.path.exists(persist_path):
+            with open(persist_path, "r", encoding="utf-8") as persist_f:
+                for line in persist_f:
+                    try:
+                        seen_at, delivery_id = line.split(" ", 1)
+                        if seen_at == "-":  # discarded
+                            self._seen.pop(delivery_id.strip(), None)
+                        else:
+                            self._seen[delivery_id.strip()] = float(seen_at)
+                    except ValueError:
+                        continue
+        self._evict(time.time())
+
+    def _compact(self):
+        """Rewrite the persist file with the live, completed ids."""
+        if self._persist_file is not None:
+            self._persist_file.close()
+        tmp_path = f"{self._persist_path}.tmp"
+        self._num_lines = 0
+        with open(tmp_path, "w", encoding="utf-8") as persist_f:
+            for delivery_id, seen_at in self._seen.items():
+                if delivery_id not in self._in_flight:
+                    persist_f.write(f"{seen_at} {delivery_id}\n")
+                    self._num_lines += 1
+        os.replace(tmp_path, self._persist_path)
+        self._persist_file = open(self._persist_path, "a", encoding="utf-8")
+
+    def _persist(self, line: str):
+        if self._persist_file is None:
+            return
+        self._persist_file.write(line)
+        self._persist_file.flush()
+        self._num_lines += 1
+        if self._num_lines > max(2 * len(self._seen), MIN_COMPACT_LINES):
+            self._compact()
+
+    def _evict(self, now: float):
+        while len(self._seen) > 0:
+            delivery_id, seen_at = next(iter(self._seen.items()))
+            if now - seen_at <= self._ttl and len(self._seen) <= self._max_size:
+                break
+            del self._seen[delivery_id]
+            self._in_flight.discard(delivery_id)
+
+    def add(self, delivery_id: str) -> bool:
+        """Record the delivery. Returns False if it was already seen within the window."""
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            if delivery_id in self._seen:
+                self._num_duplicates += 1
+                return False
+            self._seen[delivery_id] = now
+            self._in_flight.add(delivery_id)
+            self._evict(now)
+        return True
+
+    def is_in_flight(self, delivery_id: str) -> bool:
+        """Whether the delivery was added but is not complete nor discarded yet."""
+        with self._lock:
+            return delivery_id in self._in_flight
+
+    def complete(self, delivery_id: str):
+        """Mark the delivery as processed, so that its redeliveries are dropped."""
+        with self._lock:
+            self._in_flight.discard(delivery_id)
+            seen_at = self._seen.get(delivery_id)
+            if seen_at is not None:
+                self._persist(f"{seen_at} {delivery_id}\n")
+
+    def discard(self, delivery_id: str):
+        """Forget the delivery, e.g. when it failed, so that a redelivery is processed."""
+        with self._lock:
+            persisted = delivery_id not in self._in_flight
+            self._in_flight.discard(delivery_id)
+            if self._seen.pop(delivery_id, None) is not None and persisted:
+                self._persist(f"- {delivery_id}\n")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._seen),
+                "in_flight": len(self._in_flight),
+                "duplicates": self._num_duplicates,
+            }
+
+    def close(self):
+        if self._persist_file is not None:
+            self._persist_file.close()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Indexed archive of logged github webhook events."""
+
+from datetime import datetime
+from typing import Iterator, NamedTuple, Optional
+import glob
+import json
+import os
+import sqlite3
+import sys
+
+from lark_bot.event_log_writer import SEGMENT_SUFFIXES, read_segment
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    time TEXT NOT NULL,
+    delivery_id TEXT,
+    event TEXT NOT NULL,
+    action TEXT,
+    repo TEXT,
+    number INTEGER,
+    sender TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS payloads (
+    event_id INTEGER PRIMARY KEY,
+    body BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    lines INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE INDEX IF NOT EXISTS events_delivery ON events (delivery_id);
+CREATE INDEX IF NOT EXISTS events_repo_number ON events (repo, number, time);
+CREATE INDEX IF NOT EXISTS events_event_action ON events (event, action, time);
+CREATE INDEX IF NOT EXISTS events_sender ON events (sender, time);
+"""
+
+_COLUMNS = "id, time, delivery_id, event, action, repo, number, sender, error"
+
+
+class ArchivedEvent(NamedTuple):
+    """Indexed fields of an archived event, without the payload."""
+
+    id: int
+    time: str  # ISO-8601, as logged
+    delivery_id: Optional[str]
+    event_name: str
+    action: Optional[str]
+    repo: Optional[str]
+    number: Optional[int]  # of the issue or PR
+    sender: Optional[str]
+    error: Optional[str]
+
+
+def subject_number(payload: dict) -> Optional[int]:
+    """Number of the issue or PR the event is about, None if none."""
+    for key in ["issue", "pull_request"]:
+        subject = payload.get(key)
+        if isinstance(subject, dict) and "number" in subject:
+            return subject["number"]
+    pull_requests = (payload.get("workflow_run") or {}).get("pull_requests")
+    if pull_requests:
+        return pull_requests[0].get("number")
+    return payload.get("number")
+
+
+class EventArchive:
+    """
+    SQLite archive of the event log, indexed by time, delivery id, repo and issue/PR
+    number, event and action, and sender.
+
+    Payloads are kept in a separate table and only read for the events a query
+    returns, so that scans over the index never load unrelated payloads. Imports are
+    incremental: the number of lines read from each event log segment is recorded, and
+    only the new lines of a segment are imported again.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def add(
+        self,
+        time: str,
+        event_name: str,
+        delivery_id: Optional[str],
+        payload: dict,
+        body: bytes = None,
+        error: str = None,
+    ) -> int:
+        """Archive an event. body: the payload as json, serialized if not given."""
+        sender = (payload.get("sender") or {}).get("login")
+        repo = (payload.get("repository") or {}).get("full_name")
+        cursor = self._db.execute(
+            "INSERT INTO events (time, delivery_id, event, action, repo, number, "
+            "sender, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                time,
+                delivery_id,
+                event_name,
+                payload.get("action"),
+                repo,
+                subject_number(payload),
+                sender,
+                error,
+            ),
+        )
+        if body is None:
+            body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        self._db.execute(
+            "INSERT INTO payloads (event_id, body) VALUES (?, ?)", (cursor.lastrowid, body)
+        )
+        return cursor.lastrowid
+
+    def _imported_lines(self, path: str) -> int:
+        row = self._db.execute(
+            "SELECT lines FROM sources WHERE path = ?", (path,)
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    def _set_imported_lines(self, path: str, lines: int):
+        self._db.execute(
+            "INSERT OR REPLACE INTO sources (path, lines) VALUES (?, ?)", (path, lines)
+        )
+
+    def import_segment(self, path: str) -> int:
+        """Archive the new lines of an EventLogWriter segment. Returns the number archived."""
+        path = os.path.abspath(path)
+        skip = self._imported_lines(path)
+        lines = 0
+        archived = 0
+        with self._db:
+            for line in read_segment(path):
+                lines += 1
+                if lines <= skip:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    sys.stderr.write(f"[EventArchive] Skip corrupted line {lines} of {path}\n")
+                    continue
+                self.add(
+                    record["time"],
+                    record["event"],
+                    record.get("delivery"),
+                    record["payload"],
+                    error=record.get("error"),
+                )
+                archived += 1
+            self._set_imported_lines(path, max(lines, skip))
+        return archived
+
+    def import_event_file(self, path: str) -> int:
+        """
+        Archive an event logged as <event>-<action>/<%Y%m%d-%H%M%S.%f>.json by earlier
+        versions. Returns the number archived.
+        """
+        path = os.path.abspath(path)
+        if self._imported_lines(path) > 0:
+            return 0
+        event_name = os.path.basename(os.path.dirname(path)).split("-", 1)[0]
+        try:
+            time = datetime.strptime(
+                os.path.basename(path)[: -len(".json")], "%Y%m%d-%H%M%S.%f"
+            ).isoformat()
+        except ValueError:
+            time = datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+        try:
+            with open(path, "r", encoding="utf-8") as event_file:
+                payload = json.load(event_file)
+        except json.JSONDecodeError as e:
+            sys.stderr.write(f"[EventArchive] Skip {path}: {e}\n")
+            return 0
+        with self._db:
+            self.add(time, event_name, None, payload)
+            self._set_imported_lines(path, 1)
+        return 1
+
+    def import_dir(self, event_log_dir: str) -> int:
+        """Archive the new events of an event log directory. Returns the number archived."""
+        archived = 0
+        for suffix in SEGMENT_SUFFIXES.values():
+            for path in sorted(glob.glob(os.path.join(event_log_dir, f"events-*{suffix}"))):
+                archived += self.import_segment(path)
+        for path in sorted(glob.glob(os.path.join(event_log_dir, "*", "*.json"))):
+            archived += self.import_event_file(path)
+        return archived
+
+    def query(
+        self,
+        delivery_id: str = None,
+        repo: str = None,
+        number: int = None,
+        event_name: str = None,
+        action: str = None,
+        sender: str = None,
+        since: str = None,
+        until: str = None,
+        limit: int = None,
+    ) -> Iterator[ArchivedEvent]:
+        """
+        The matching events in time order, streamed from the database.
+        since/until: ISO-8601 time bounds, inclusive/exclusive, e.g. 2024-06-24T07:14
+        """
+        conditions, params = [], []
+        for column, value in [
+            ("delivery_id", delivery_id),
+            ("repo", repo),
+            ("number", number),
+            ("event", event_name),
+            ("action", action),
+            ("sender", sender),
+        ]:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append("time >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("time < ?")
+            params.append(until)
+        sql = f"SELECT {_COLUMNS} FROM events"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY time, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        for row in self._db.execute(sql, params):
+            yield ArchivedEvent(*row)
+
+    def payload(self, event_id: int) -> bytes:
+        """The json payload of an archived event."""
+        row = self._db.execute(
+            "SELECT body FROM payloads WHERE event_id = ?", (event_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(event_id)
+        return row[0]
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Background writer of the webhook event log."""
+
+import gzip
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, NamedTuple, Optional
+
+DEFAULT_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_SEGMENT_MAX_AGE = 3600  # seconds
+DEFAULT_FLUSH_INTERVAL = 1.0  # seconds
+DEFAULT_MAX_PENDING = 10000
+MAX_BATCH_SIZE = 1000
+
+# compression -> segment file suffix
+SEGMENT_SUFFIXES = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+_STOP = object()
+
+
+def read_segment(path: str) -> Iterator[bytes]:
+    """
+    The complete lines of a segment file, which may still be being written. The lines
+    of a compressed segment are read up to the last flushed batch.
+    """
+    with open(path, "rb") as raw:
+        if path.endswith(".gz"):
+            stream = gzip.GzipFile(fileobj=raw, mode="rb")
+        elif path.endswith(".zst"):
+            import zstandard  # pylint: disable=import-outside-toplevel
+
+            stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw))
+        else:
+            stream = raw
+        try:
+            for line in stream:
+                if line.endswith(b"\n"):
+                    yield line
+        except EOFError:
+            pass  # the end of a compressed stream that is not closed yet
+
+
+class LoggedEvent(NamedTuple):
+    event_name: str
+    delivery_id: Optional[str]
+    action: Optional[str]
+    timestamp: datetime
+    payload: object
+    body: Optional[bytes]
+    error: Optional[str]
+
+
+class EventLogWriter:
+    """
+    Append webhook events as compact json lines to rotated segment files.
+
+    write() only queues the event, so logging never blocks the request path. A
+    background thread serializes the queued events (reusing the raw request body as
+    is), writes them in batches and fsyncs at most every flush_interval seconds. When
+    more than max_pending events are queued, further events are dropped and counted.
+
+    Each line is {"time", "event", "action", "delivery", ["error",] "payload"}.
+    Segments are named events-<start time>-<pid>-<seq>.jsonl and rolled over after
+    segment_max_bytes (uncompressed) or segment_max_age seconds. With compression
+    "gzip" or "zstd" (requires pip install zstandard), a segment is one compressed
+    stream, flushed at every batch so that a crash loses at most the last batch.
+    """
+
+    def __init__(
+        self,
+        event_log_dir: str,
+        compression: str = None,
+        segment_max_bytes: int = DEFAULT_SEGMENT_MAX_BYTES,
+        segment_max_age: float = DEFAULT_SEGMENT_MAX_AGE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ) -> None:
+        if compression not in SEGMENT_SUFFIXES:
+            raise ValueError(
+                f"compression must be one of {list(SEGMENT_SUFFIXES)}, got {compression}"
+            )
+        self._zstd = None
+        if compression == "zstd":
+            try:
+                import zstandard  # pylint: disable=import-outside-toplevel
+
+                self._zstd = zstandard
+            except ImportError as e:
+                sys.stderr.write(f"WARNING: {e}. Fall back to gzip\n")
+                compression = "gzip"
+        self._event_log_dir = event_log_dir
+        self._compression = compression
+        self._segment_max_bytes = segment_max_bytes
+        self._segment_max_age = segment_max_age
+        self._flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._counters = {"written": 0, "dropped": 0}
+        self._counter_lock = threading.Lock()
+        self._closed = False
+
+        self._raw = None  # the segment file
+        self._stream = None  # writes to the segment file, compressing if enabled
+        self._segment_seq = 0
+        self._segment_bytes = 0
+        self._segment_opened_at = 0.0
+        self._last_sync = 0.0
+        self._dirty = False
+
+        self._writer = threading.Thread(
+            target=self._run, name="event-log-writer", daemon=True
+        )
+        self._writer.start()
+
+    def write(
+        self,
+        event_name: str,
+        delivery_id: Optional[str],
+        timestamp: datetime,
+        payload: object,
+        body: bytes = None,
+        error: str = None,
+    ) -> bool:
+        """
+        Queue the event. Returns False if it is dropped.
+        body: the raw payload, logged instead of payload (which may be partially decoded)
+        """
+        action = payload.get("action") if isinstance(payload, dict) else None
+        try:
+            if self._closed:
+                raise queue.Full
+            self._queue.put_nowait(
+                LoggedEvent(event_name, delivery_id, action, timestamp, payload, body, error)
+            )
+        except queue.Full:
+            with self._counter_lock:
+                self._counters["dropped"] += 1
+            return False
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._counter_lock:
+            stats = dict(self._counters)
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+    @classmethod
+    def encode(cls, event: LoggedEvent) -> bytes:
+        header = {
+            "time": event.timestamp.isoformat(),
+            "event": event.event_name,
+            "action": event.action,
+            "delivery": event.delivery_id,
+        }
+        if event.error is not None:
+            header["error"] = event.error
+        line = json.dumps(header, separators=(",", ":"))[:-1].encode("utf-8")
+        body = None if event.body is None else event.body.strip()
+        if body is None or b"\n" in body:
+            # not a compact single-line payload, serialize the decoded one
+            payload = event.payload if event.body is None else json.loads(event.body)
+            body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        return line + b',"payload":' + body + b"}\n"
+
+    def _open_segment(self):
+        os.makedirs(self._event_log_dir, exist_ok=True)
+        self._segment_seq += 1
+        name = (
+            f"events-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{self._segment_seq:04d}"
+            f"{SEGMENT_SUFFIXES[self._compression]}"
+        )
+        self._raw = open(os.path.join(self._event_log_dir, name), "wb")
+        if self._compression == "gzip":
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        elif self._compression == "zstd":
+            self._stream = self._zstd.ZstdCompressor().stream_writer(
+                self._raw, closefd=False
+            )
+        else:
+            self._stream = self._raw
+        self._segment_bytes = 0
+        self._segment_opened_at = time.monotonic()
+
+    def _close_segment(self):
+        if self._raw is None:
+            return
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        self._raw = self._stream = None
+        self._dirty = False
+
+    def _flush(self):
+        if self._stream is not self._raw:
+            if self._zstd is not None:
+                self._stream.flush(self._zstd.FLUSH_BLOCK)
+            else:
+                self._stream.flush()
+        self._raw.flush()
+        now = time.monotonic()
+        if now - self._last_sync >= self._flush_interval:
+            os.fsync(self._raw.fileno())
+            self._last_sync = now
+            self._dirty = False
+
+    def _write_batch(self, batch):
+        written = 0
+        for event in batch:
+            try:
+                line = self.encode(event)
+            except (TypeError, ValueError) as e:
+                sys.stderr.write(f"[EventLogWriter] Cannot encode {event.event_name}: {e}\n")
+                continue
+            if self._raw is None:
+                self._open_segment()
+            self._stream.write(line)
+            self._segment_bytes += len(line)
+            self._dirty = True
+            written += 1
+            if self._segment_bytes >= self._segment_max_bytes:
+                self._close_segment()
+        with self._counter_lock:
+            self._counters["written"] += written
+        if self._raw is not None:
+            self._flush()
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self._flush_interval)]
+            except queue.Empty:
+                batch = []
+            while 0 < len(batch) < MAX_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = _STOP in batch
+            try:
+                self._write_batch([event for event in batch if event is not _STOP])
+                if self._raw is not None and (
+                    stop
+                    or time.monotonic() - self._segment_opened_at >= self._segment_max_age
+                ):
+                    self._close_segment()
+                elif self._dirty:
+                    self._flush()
+            except OSError as e:
+                sys.stderr.write(f"[EventLogWriter] Error writing event log: {e}\n")
+            if stop:
+                return
+
+    def close(self):
+        """Write the queued events and close the segment."""
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
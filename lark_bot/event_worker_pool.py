@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Bounded pool of background threads that process github webhook events."""
+
+import queue
+import sys
+import threading
+from typing import Callable
+
+DEFAULT_NUM_WORKERS = 4
+DEFAULT_MAX_QUEUE_SIZE = 1000
+RETRY_AFTER = 5  # seconds, suggested to github when the queue is full
+
+_STOP = object()
+
+
+class EventWorkerPool:
+    """
+    Process events on worker threads so that the webhook request can be acknowledged immediately.
+    The queue is bounded: submit returns False instead of blocking when it is full.
+    """
+
+    def __init__(
+        self,
+        process_event: Callable,
+        num_workers: int = DEFAULT_NUM_WORKERS,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+    ) -> None:
+        if num_workers <= 0:
+            raise ValueError(f"num_workers must be positive, got {num_workers}")
+        self._process_event = process_event
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._run, name=f"event-worker-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, *args) -> bool:
+        """Queue process_event(*args). Returns False if the pool is full or shut down."""
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(args)
+        except queue.Full:
+            return False
+        return True
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._process_event(*item)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                sys.stderr.write(f"[EventWorkerPool] Error processing event: {e}\n")
+            finally:
+                self._queue.task_done()
+
+    def shutdown(self, timeout: float = None):
+        """Stop accepting events, process the queued ones and join the workers."""
+        if self._closed:
+            return
+        self._closed = True
+        sys.stderr.write(
+            f"[EventWorkerPool] Draining {self._queue.qsize()} queued events\n"
+        )
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join(timeout)
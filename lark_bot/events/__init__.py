@@ -25,14 +25,53 @@ __all__ = [
     "PullRequestReviewEvent",
     "PullRequestReviewCommentEvent",
     "WorkflowRunEvent",
+    "DISCARDED_EVENTS",
+    "get_event_class",
+    "register_event",
+    "MentionExtractor",
+    "mention_extractor",
 ]
 
-from lark_bot.events.issues_event import IssuesEvent
-from lark_bot.events.issue_comment_event import IssueCommentEvent
+import importlib
+from typing import TYPE_CHECKING
+
 from lark_bot.events.base_github_event import BaseGithubEvent, InvolveReason
-from lark_bot.events.pull_request_event import PullRequestEvent
-from lark_bot.events.pull_request_review_event import PullRequestReviewEvent
-from lark_bot.events.pull_request_review_comment_event import (
-    PullRequestReviewCommentEvent,
+from lark_bot.events.mention_extractor import MentionExtractor, mention_extractor
+from lark_bot.events.registry import (
+    DISCARDED_EVENTS,
+    get_event_class,
+    register_event,
 )
-from lark_bot.events.workflow_run_event import WorkflowRunEvent
+
+if TYPE_CHECKING:
+    # for type checkers and linters, the classes are imported lazily at runtime
+    from lark_bot.events.issues_event import IssuesEvent
+    from lark_bot.events.issue_comment_event import IssueCommentEvent
+    from lark_bot.events.pull_request_event import PullRequestEvent
+    from lark_bot.events.pull_request_review_event import PullRequestReviewEvent
+    from lark_bot.events.pull_request_review_comment_event import (
+        PullRequestReviewCommentEvent,
+    )
+    from lark_bot.events.workflow_run_event import WorkflowRunEvent
+
+# event classes are imported on first access, see registry.get_event_class
+_LAZY_CLASSES = {
+    "IssuesEvent": "lark_bot.events.issues_event",
+    "IssueCommentEvent": "lark_bot.events.issue_comment_event",
+    "PullRequestEvent": "lark_bot.events.pull_request_event",
+    "PullRequestReviewEvent": "lark_bot.events.pull_request_review_event",
+    "PullRequestReviewCommentEvent": "lark_bot.events.pull_request_review_comment_event",
+    "WorkflowRunEvent": "lark_bot.events.workflow_run_event",
+}
+
+
+def __getattr__(name: str):  # pylint: disable=invalid-name, module __getattr__ (PEP 562)
+    if name in _LAZY_CLASSES:
+        event_class = getattr(importlib.import_module(_LAZY_CLASSES[name]), name)
+        globals()[name] = event_class
+        return event_class
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():  # pylint: disable=invalid-name, module __dir__ (PEP 562)
+    return sorted(__all__)
@@ -17,8 +17,12 @@
 """Interface for github events"""
 
 
-import re
-from typing import List, Dict
+from typing import Hashable, List, Dict, FrozenSet, Optional, Tuple
+
+from lark_bot.events.mention_extractor import (
+    MentionExtractor,
+    mention_extractor as default_mention_extractor,
+)
 
 
 class InvolveReason:
@@ -31,17 +35,46 @@ class InvolveReason:
     WORKFLOW_RUN_COMPLETE = "workflow_run_complete"
 
 
-class BaseGithubEvent:
-    """Github event interface for notification construction."""
+# payload fields read by every event, see BaseGithubEvent.payload_fields
+COMMON_PAYLOAD_FIELDS = {"action": None, "sender": {"login": None}}
+USER_FIELDS = {"login": None}
+
 
-    def __init__(self, event_name: str, webhook_json: object) -> None:
+class BaseGithubEvent:
+    """
+    Github event interface for notification construction.
+
+    An event extracts the fields it needs from the webhook payload when constructed
+    and does not keep the payload, so a subclass declares its fields in __slots__.
+    """
+
+    __slots__ = ("event_name", "action", "sender", "_mention_extractor")
+
+    # actions that may be notified, None for any action
+    notified_actions: Optional[FrozenSet[str]] = None
+    # actions that are never notified
+    skipped_actions: FrozenSet[str] = frozenset()
+    # payload fields read by the event, so that only these are decoded: a field maps
+    # to None to keep its value as is, to a dict of the fields of an object, or to a
+    # list of the dict for an array of objects. None to decode the whole payload.
+    payload_fields: Optional[Dict] = None
+
+    def __init__(
+        self,
+        event_name: str,
+        webhook_json: object,
+        mention_extractor: MentionExtractor = None,
+    ) -> None:
+        """mention_extractor: finds the users @ed in the event, see _find_users_ated"""
         if event_name is None:
             raise ValueError("event_name cannot be None")
         if webhook_json is None:
             raise ValueError("webhook_json cannot be None")
 
         self.event_name = event_name
-        self._webhook_json = webhook_json
+        self.action = webhook_json.get("action")
+        self.sender = webhook_json["sender"]["login"]
+        self._mention_extractor = mention_extractor or default_mention_extractor
 
     def involved_users(self) -> List[object]:
         """
@@ -75,22 +108,39 @@ class BaseGithubEvent:
         """
         Returns True if should skip notification for this event.
         To avoid sending multiple notifications related to the same user action.
+        If combine_related_updates_interval is None, related updates are not skipped by
+        their timestamps, as they are combined by a NotificationCoalescer instead.
         """
         pass
 
+    def coalesce_key(self) -> Optional[Tuple[str, int]]:
+        """
+        Interface to get the subject (repository, issue/PR number) of the event, whose
+        notifications can be merged into one card. None if not to be merged.
+        """
+        return None
+
+    @classmethod
+    def discards_action(cls, action: str) -> bool:
+        """
+        Whether events with the action are never notified, so that they can be
+        rejected before the event is constructed.
+        """
+        if action in cls.skipped_actions:
+            return True
+        return cls.notified_actions is not None and action not in cls.notified_actions
+
     def get_sender(self) -> str:
-        return self._webhook_json["sender"]["login"]
+        return self.sender
 
     def get_action(self) -> str:
-        return self._webhook_json["action"]
+        return self.action
 
-    @classmethod
-    def _find_users_ated(cls, text: str):
+    def _find_users_ated(self, text: str, key: Hashable = None):
+        """Users @ed in the text, see MentionExtractor.find."""
         if text is None:
             return []
-        users = re.findall("@([a-zA-Z0-9_]+)", text)
-        # print(f"users {users} @ed in {text}")
-        return users
+        return self._mention_extractor.find(text, key)
 
     @classmethod
     def _add_to_involved_users(
@@ -17,65 +17,97 @@
 """Github webhook event: issue_comment"""
 
 
-from typing import List
-
-from lark_bot.events.base_github_event import BaseGithubEvent, InvolveReason
+from typing import Dict, List
+
+from lark_bot.events.base_github_event import (
+    BaseGithubEvent,
+    InvolveReason,
+    COMMON_PAYLOAD_FIELDS,
+    USER_FIELDS,
+)
+from lark_bot.events.mention_extractor import MentionExtractor
 from lark_bot.events.issues_event import IssuesEvent
+from lark_bot.events.registry import register_event
 
 
+@register_event("issue_comment")
 class IssueCommentEvent(BaseGithubEvent):
     """Issue comment: https://docs.github.com/en/webhooks/webhook-events-and-payloads#issue_comment"""
 
-    def __init__(self, event_name: str, webhook_json: object) -> None:
-        super().__init__(event_name=event_name, webhook_json=webhook_json)
-        self._involved_users = None
+    notified_actions = frozenset(["created", "edited"])
+    payload_fields = dict(
+        COMMON_PAYLOAD_FIELDS,
+        issue={
+            "assignees": [USER_FIELDS],
+            "assignee": USER_FIELDS,
+            "id": None,
+            "body": None,
+            "title": None,
+        },
+        comment={"body": None, "html_url": None, "user": USER_FIELDS},
+    )
+
+    __slots__ = ("issue_title", "html_url", "commenter", "_involved_users")
+
+    def __init__(
+        self,
+        event_name: str,
+        webhook_json: object,
+        mention_extractor: MentionExtractor = None,
+    ) -> None:
+        super().__init__(
+            event_name=event_name,
+            webhook_json=webhook_json,
+            mention_extractor=mention_extractor,
+        )
+        comment = webhook_json["comment"]
+        self.issue_title = webhook_json["issue"]["title"]
+        self.html_url = comment["html_url"]
+        self.commenter = comment["user"]["login"]
+        self._involved_users = self._find_involved_users(webhook_json)
 
     def _is_action_to_notify(self, action: str):
-        return action in ["created", "edited"]
-
-    def involved_users(self) -> List[object]:
-        if self._involved_users is not None:
-            return self._involved_users
+        return action in self.notified_actions
 
-        action = self._webhook_json["action"]
-        if not self._is_action_to_notify(action):
+    def _find_involved_users(self, webhook_json: object) -> Dict[str, List[str]]:
+        if not self._is_action_to_notify(self.action):
             return []
 
         users = {}
-        assignees = IssuesEvent.get_assignees(self._webhook_json["issue"])
+        assignees = IssuesEvent.get_assignees(webhook_json["issue"])
         self._add_to_involved_users(users, assignees, InvolveReason.ASSIGNEE)
 
-        ated_in_issue = self._find_users_ated(self._webhook_json["issue"]["body"])
+        # the issue body is the same for every comment on the issue
+        ated_in_issue = self._find_users_ated(
+            webhook_json["issue"]["body"], webhook_json["issue"].get("id")
+        )
         self._add_to_involved_users(users, ated_in_issue, InvolveReason.ATED_IN_ISSUE)
 
-        ated_in_comment = self._find_users_ated(self._webhook_json["comment"]["body"])
+        ated_in_comment = self._find_users_ated(webhook_json["comment"]["body"])
         self._add_to_involved_users(
             users, ated_in_comment, InvolveReason.ATED_IN_COMMENT
         )
-
-        self._involved_users = users
         return users
 
+    def involved_users(self) -> List[object]:
+        return self._involved_users
+
     def notification_title(self) -> str:
-        action = self._webhook_json["action"]
-        if action == "created":
+        if self.action == "created":
             return "New Comment"
-        return f"Issue Comment {action.capitalize()}"
+        return f"Issue Comment {self.action.capitalize()}"
 
     def link_url(self) -> str:
-        return self._webhook_json["comment"]["html_url"]
+        return self.html_url
 
     def link_title(self) -> str:
-        issue_title = self._webhook_json["issue"]["title"]
-        return f"Comment on {issue_title}"
+        return f"Comment on {self.issue_title}"
 
     def notification_message(self) -> str:
-        action = self._webhook_json["action"]
-        sender = self._webhook_json["comment"]["user"]["login"]
-        if self._is_action_to_notify(action):
-            return f"{sender} {action} a comment."
+        if self._is_action_to_notify(self.action):
+            return f"{self.commenter} {self.action} a comment."
 
         return None
 
     def should_skip_notification(self, combine_related_updates_interval: int) -> bool:
-        return not self._is_action_to_notify(self._webhook_json["action"])
+        return not self._is_action_to_notify(self.action)
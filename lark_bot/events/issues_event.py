@@ -16,15 +16,50 @@
 
 """Github webhook event: issues"""
 
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
-from lark_bot.events.base_github_event import BaseGithubEvent, InvolveReason
-from datetime import datetime
+from lark_bot.events.base_github_event import (
+    BaseGithubEvent,
+    InvolveReason,
+    COMMON_PAYLOAD_FIELDS,
+    USER_FIELDS,
+)
+from lark_bot.events.mention_extractor import MentionExtractor
+from lark_bot.events.registry import register_event
+from lark_bot.events.timestamps import updated_within
 
 
+@register_event("issues")
 class IssuesEvent(BaseGithubEvent):
     """Issues: https://docs.github.com/en/webhooks/webhook-events-and-payloads#issues"""
 
+    skipped_actions = frozenset(["milestoned", "labeled", "closed", "pinned"])
+    payload_fields = dict(
+        COMMON_PAYLOAD_FIELDS,
+        issue={
+            "assignees": [USER_FIELDS],
+            "assignee": USER_FIELDS,
+            "body": None,
+            "title": None,
+            "html_url": None,
+            "number": None,
+            "created_at": None,
+            "updated_at": None,
+        },
+        assignee=USER_FIELDS,
+        repository={"full_name": None},
+    )
+
+    __slots__ = (
+        "title",
+        "html_url",
+        "number",
+        "repository",
+        "created_at",
+        "updated_at",
+        "_involved_users",
+    )
+
     @classmethod
     def get_assignees(cls, issue_or_pr_json: object):
         """Get assignees for issue/PR."""
@@ -34,63 +69,76 @@ class IssuesEvent(BaseGithubEvent):
             assignees.append(assignee["login"])
         return assignees
 
-    def __init__(self, event_name: str, webhook_json: object) -> None:
-        super().__init__(event_name=event_name, webhook_json=webhook_json)
-        self._involved_users = None
-
-    def involved_users(self) -> Dict[str, List[str]]:
-        if self._involved_users is not None:
-            return self._involved_users
-
-        action = self._webhook_json["action"]
+    def __init__(
+        self,
+        event_name: str,
+        webhook_json: object,
+        mention_extractor: MentionExtractor = None,
+    ) -> None:
+        super().__init__(
+            event_name=event_name,
+            webhook_json=webhook_json,
+            mention_extractor=mention_extractor,
+        )
+        issue = webhook_json["issue"]
+        self.title = issue["title"]
+        self.html_url = issue["html_url"]
+        self.number = issue["number"]
+        self.created_at = issue["created_at"]
+        self.updated_at = issue["updated_at"]
+        self.repository = webhook_json["repository"]["full_name"]
+        self._involved_users = self._find_involved_users(webhook_json)
+
+    def _find_involved_users(self, webhook_json: object) -> Dict[str, List[str]]:
+        action = self.action
         users = {}
         if action in ["opened", "reopened", "edited"]:
-            assignees = self.get_assignees(self._webhook_json["issue"])
+            assignees = self.get_assignees(webhook_json["issue"])
             self._add_to_involved_users(users, assignees, InvolveReason.ASSIGNEE)
 
-            ated_in_issue = self._find_users_ated(self._webhook_json["issue"]["body"])
+            ated_in_issue = self._find_users_ated(webhook_json["issue"]["body"])
             self._add_to_involved_users(
                 users, ated_in_issue, InvolveReason.ATED_IN_ISSUE
             )
         elif action in ["assigned", "unassigned"]:
-            assignee = self._webhook_json["assignee"]["login"]
-            if assignee != self._webhook_json["sender"]["login"]:
-                self._add_to_involved_users(users, [assignee], InvolveReason.ASSIGNEE)
+            assignee = webhook_json.get("assignee")
+            if assignee is not None and assignee["login"] != self.sender:
+                self._add_to_involved_users(
+                    users, [assignee["login"]], InvolveReason.ASSIGNEE
+                )
 
         # no need to notify the person who triggered this event
-        sender = self._webhook_json["sender"]["login"]
-        if sender in users:
-            users.pop(sender)
-
-        self._involved_users = users
+        if self.sender in users:
+            users.pop(self.sender)
         return users
 
+    def involved_users(self) -> Dict[str, List[str]]:
+        return self._involved_users
+
     def notification_title(self) -> str:
-        action = self._webhook_json["action"]
-        if action == "opened":
+        if self.action == "opened":
             return "New Issue"
-        return f"Issue {action.capitalize()}"
+        return f"Issue {self.action.capitalize()}"
 
     def link_title(self) -> str:
-        return self._webhook_json["issue"]["title"]
+        return self.title
 
     def link_url(self) -> str:
-        return self._webhook_json["issue"]["html_url"]
+        return self.html_url
 
     def notification_message(self) -> str:
-        action = self._webhook_json["action"]
-        sender = self._webhook_json["sender"]["login"]
+        action = self.action
         if action in ["opened", "reopened", "edited", "assigned", "unassigned"]:
-            return f"{sender} {action} issue."
+            return f"{self.sender} {action} issue."
 
-        print(f"[WARNING] Unhandled issues action {self._webhook_json['action']}")
+        print(f"[WARNING] Unhandled issues action {action}")
         return None
 
     def should_skip_notification(self, combine_related_updates_interval: int) -> bool:
-        action = self._webhook_json["action"]
+        action = self.action
 
         # events to skip notification
-        if action in ["milestoned", "labeled", "closed", "pinned"]:
+        if action in self.skipped_actions:
             return True
 
         if action == "edited" and len(self.involved_users()) == 0:
@@ -100,18 +148,14 @@ class IssuesEvent(BaseGithubEvent):
             return True
 
         # events that are related to issue opened should be skipped to avoid duplicate notification
-        create_time = datetime.strptime(
-            self._webhook_json["issue"]["created_at"], "%Y-%m-%dT%H:%M:%SZ"
-        )
-        update_time = datetime.strptime(
-            self._webhook_json["issue"]["updated_at"], "%Y-%m-%dT%H:%M:%SZ"
-        )
-        if action in ["assigned"]:
+        if action in ["assigned"] and combine_related_updates_interval is not None:
             # this action is correlated issue "opened", skip it
-            if (
-                update_time.timestamp() - create_time.timestamp()
-                <= combine_related_updates_interval
+            if updated_within(
+                self.created_at, self.updated_at, combine_related_updates_interval
             ):
                 return True
 
         return False
+
+    def coalesce_key(self) -> Tuple[str, int]:
+        return (self.repository, self.number)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Find the github users @ed in issue, PR and comment bodies."""
+
+from collections import OrderedDict
+from typing import Callable, Collection, Hashable, List, Optional, Tuple
+import re
+import threading
+
+DEFAULT_CACHE_SIZE = 1024
+
+# Spans where an @ is not a mention: fenced code blocks, inline code, html comments
+# (e.g. in PR templates) and quoted lines. Otherwise an @ not preceded by a word
+# character (emails) and followed by a login: alphanumerics, underscores (enterprise
+# managed users) and single inner hyphens, at most 39 characters, not followed by a
+# slash (@org/team).
+_MENTION_PATTERN = re.compile(
+    r"^[ \t]*(?P<fence>`{3,}|~{3,})[^\n]*\n.*?(?:^[ \t]*(?P=fence)[ \t]*$|\Z)"
+    r"|(?P<tick>`+)[^`]+?(?P=tick)"
+    r"|<!--.*?-->"
+    r"|^[ \t]*>[^\n]*"
+    r"|(?<![\w@.+-])@(?P<login>[A-Za-z0-9_](?:[A-Za-z0-9_]|-(?=[A-Za-z0-9_])){0,38})"
+    r"(?![\w/])",
+    re.MULTILINE | re.DOTALL,
+)
+
+
+class MentionExtractor:
+    """
+    Extract @mentions from markdown text in one pass of a compiled pattern.
+
+    The mentions of a text are cached by (key, text hash), so that e.g. the issue body
+    is not scanned again for every comment on the issue. With known_logins set, only
+    mentions of known github logins (lowercased) are returned.
+    """
+
+    def __init__(
+        self,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        known_logins: Optional[Callable[[], Collection[str]]] = None,
+    ) -> None:
+        """known_logins: returns the current lowercased logins, None to keep all."""
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._known_logins = known_logins
+
+    @classmethod
+    def scan(cls, text: str) -> Tuple[str, ...]:
+        """Distinct logins @ed in the text, in order of appearance."""
+        logins = {}
+        for match in _MENTION_PATTERN.finditer(text):
+            login = match.group("login")
+            if login is not None:
+                logins.setdefault(login, None)
+        return tuple(logins)
+
+    def find(self, text: str, key: Hashable = None) -> List[str]:
+        """
+        Logins @ed in the text.
+        key: what the text belongs to, e.g. the issue id, to tell apart equal hashes.
+        """
+        if not text:
+            return []
+        cache_key = (key, len(text), hash(text))
+        with self._lock:
+            logins = self._cache.get(cache_key)
+            if logins is not None:
+                self._cache.move_to_end(cache_key)
+        if logins is None:
+            logins = self.scan(text)
+            with self._lock:
+                self._cache[cache_key] = logins
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+
+        if self._known_logins is None:
+            return list(logins)
+        known_logins = self._known_logins()
+        return [login for login in logins if login.lower() in known_logins]
+
+
+# used by events constructed without an extractor, keeps all mentions
+mention_extractor = MentionExtractor()
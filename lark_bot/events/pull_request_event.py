@@ -16,48 +16,100 @@
 
 """Github webhook event: pull_request"""
 
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
-from lark_bot.events.base_github_event import BaseGithubEvent, InvolveReason
-from datetime import datetime
+from lark_bot.events.base_github_event import (
+    BaseGithubEvent,
+    InvolveReason,
+    COMMON_PAYLOAD_FIELDS,
+    USER_FIELDS,
+)
+from lark_bot.events.mention_extractor import MentionExtractor
+from lark_bot.events.registry import register_event
+from lark_bot.events.timestamps import updated_within
 
 
+@register_event("pull_request")
 class PullRequestEvent(BaseGithubEvent):
     """Pull Request: https://docs.github.com/en/webhooks/webhook-events-and-payloads#pull_request"""
 
-    def __init__(self, event_name: str, webhook_json: object) -> None:
-        super().__init__(event_name=event_name, webhook_json=webhook_json)
-        self._involved_users = None
-
-    @classmethod
-    def _get_reviewers(cls, pull_request_json: object):
+    skipped_actions = frozenset(["assigned", "labeled"])
+    payload_fields = dict(
+        COMMON_PAYLOAD_FIELDS,
+        pull_request={
+            "requested_reviewers": [USER_FIELDS],
+            "body": None,
+            "title": None,
+            "html_url": None,
+            "number": None,
+            "created_at": None,
+            "updated_at": None,
+        },
+        requested_reviewer=USER_FIELDS,
+        repository={"full_name": None},
+    )
+
+    __slots__ = (
+        "title",
+        "html_url",
+        "body",
+        "number",
+        "repository",
+        "created_at",
+        "updated_at",
+        "_involved_users",
+    )
+
+    def __init__(
+        self,
+        event_name: str,
+        webhook_json: object,
+        mention_extractor: MentionExtractor = None,
+    ) -> None:
+        super().__init__(
+            event_name=event_name,
+            webhook_json=webhook_json,
+            mention_extractor=mention_extractor,
+        )
+        pull_request_json = webhook_json["pull_request"]
+        self.title = pull_request_json["title"]
+        self.html_url = pull_request_json["html_url"]
+        self.body = pull_request_json["body"]
+        self.number = pull_request_json["number"]
+        self.created_at = pull_request_json["created_at"]
+        self.updated_at = pull_request_json["updated_at"]
+        self.repository = webhook_json["repository"]["full_name"]
+        self._involved_users = self._find_involved_users(webhook_json)
+
+    def _get_reviewers(self, pull_request_json: object):
         """Get reviewers from pr reviewers and pr body @users"""
         reviewers = [user["login"] for user in pull_request_json["requested_reviewers"]]
         body = pull_request_json["body"]
         if body is not None:
-            reviewers.extend(cls._find_users_ated(body))
+            reviewers.extend(self._find_users_ated(body))
         return reviewers
 
-    def involved_users(self) -> Dict[str, List[str]]:
-        if self._involved_users is not None:
-            return self._involved_users
-
+    def _find_involved_users(self, webhook_json: object) -> Dict[str, List[str]]:
         users = {}
-        action = self._webhook_json["action"]
-        pull_request_json = self._webhook_json["pull_request"]
+        action = self.action
 
         if action in ["opened", "reopened", "edited", "synchronize"]:
-            reviewers = self._get_reviewers(pull_request_json)
+            reviewers = self._get_reviewers(webhook_json["pull_request"])
             self._add_to_involved_users(users, reviewers, InvolveReason.REVIEWER)
         elif action == "review_requested":
-            reviewer = self._webhook_json["requested_reviewer"]["login"]
-            self._add_to_involved_users(users, [reviewer], InvolveReason.REVIEWER)
-
-        self._involved_users = users
+            # a review requested from a team has requested_team instead
+            reviewer = webhook_json.get("requested_reviewer")
+            if reviewer is not None:
+                self._add_to_involved_users(
+                    users, [reviewer["login"]], InvolveReason.REVIEWER
+                )
         return users
 
+    def involved_users(self) -> Dict[str, List[str]]:
+        return self._involved_users
+
     def notification_title(self) -> str:
-        action = self._webhook_json["action"]
+        action = self.action
         if action == "opened":
             return "New PR"
         if action == "review_requested":
@@ -65,47 +117,44 @@ class PullRequestEvent(BaseGithubEvent):
         return f"PR {action.capitalize()}"
 
     def link_title(self) -> str:
-        return self._webhook_json["pull_request"]["title"]
+        return self.title
 
     def link_url(self) -> str:
-        return self._webhook_json["pull_request"]["html_url"]
+        return self.html_url
 
     def notification_message(self) -> str:
-        action = self._webhook_json["action"]
-        sender = self._webhook_json["sender"]["login"]
-        pull_request_json = self._webhook_json["pull_request"]
-        body = pull_request_json["body"]
+        action = self.action
+        sender = self.sender
         if action in ["opened", "edited"]:
-            return f"{sender} {action} PR.\n\n**Content**\n{body}"
+            return f"{sender} {action} PR.\n\n**Content**\n{self.body}"
         elif action in ["synchronize", "reopened"]:
             return f"{sender} {action} PR."
         elif action == "review_requested":
             return f"{sender} requested review."
 
-        print(f"[WARNING] Unhandled pull_request action {self._webhook_json['action']}")
+        print(f"[WARNING] Unhandled pull_request action {action}")
         return None
 
     def should_skip_notification(self, combine_related_updates_interval: int) -> bool:
         if len(self.involved_users()) == 0:
             return True
 
-        action = self._webhook_json["action"]
+        action = self.action
         # events to skip notification
-        if action in ["assigned", "labeled"]:
+        if action in self.skipped_actions:
             return True
 
         # events that are related to pull_request "opened" should be skipped to avoid duplicate notification
-        create_time = datetime.strptime(
-            self._webhook_json["pull_request"]["created_at"], "%Y-%m-%dT%H:%M:%SZ"
-        )
-        update_time = datetime.strptime(
-            self._webhook_json["pull_request"]["updated_at"], "%Y-%m-%dT%H:%M:%SZ"
-        )
-        if action in ["review_requested"]:
-            if (
-                update_time.timestamp() - create_time.timestamp()
-                <= combine_related_updates_interval
+        if (
+            action in ["review_requested"]
+            and combine_related_updates_interval is not None
+        ):
+            if updated_within(
+                self.created_at, self.updated_at, combine_related_updates_interval
             ):
                 return True
 
         return False
+
+    def coalesce_key(self) -> Tuple[str, int]:
+        return (self.repository, self.number)
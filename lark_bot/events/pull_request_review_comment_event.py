@@ -16,61 +16,98 @@
 
 """Github webhook event: pull_request_review_comment"""
 
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
-from lark_bot.events.base_github_event import BaseGithubEvent, InvolveReason
+from lark_bot.events.base_github_event import (
+    BaseGithubEvent,
+    InvolveReason,
+    COMMON_PAYLOAD_FIELDS,
+    USER_FIELDS,
+)
+from lark_bot.events.mention_extractor import MentionExtractor
+from lark_bot.events.registry import register_event
 
 
+@register_event("pull_request_review_comment")
 class PullRequestReviewCommentEvent(BaseGithubEvent):
     """PR Review Comment: https://docs.github.com/en/webhooks/webhook-events-and-payloads#pull_request_review_comment"""
 
-    def __init__(self, event_name: str, webhook_json: object) -> None:
-        super().__init__(event_name=event_name, webhook_json=webhook_json)
-        self._involved_users = None
-
-    def involved_users(self) -> Dict[str, List[str]]:
-        if self._involved_users is not None:
-            return self._involved_users
-
+    payload_fields = dict(
+        COMMON_PAYLOAD_FIELDS,
+        pull_request={"user": USER_FIELDS, "title": None, "number": None},
+        comment={"body": None, "html_url": None, "pull_request_review_id": None},
+        repository={"full_name": None},
+    )
+
+    __slots__ = (
+        "title",
+        "number",
+        "repository",
+        "html_url",
+        "body",
+        "review_id",
+        "_involved_users",
+    )
+
+    def __init__(
+        self,
+        event_name: str,
+        webhook_json: object,
+        mention_extractor: MentionExtractor = None,
+    ) -> None:
+        super().__init__(
+            event_name=event_name,
+            webhook_json=webhook_json,
+            mention_extractor=mention_extractor,
+        )
+        pull_request_json = webhook_json["pull_request"]
+        comment = webhook_json["comment"]
+        self.title = pull_request_json["title"]
+        self.number = pull_request_json["number"]
+        self.repository = webhook_json["repository"]["full_name"]
+        self.html_url = comment["html_url"]
+        self.body = comment["body"]
+        self.review_id = comment["pull_request_review_id"]
+        self._involved_users = self._find_involved_users(webhook_json)
+
+    def _find_involved_users(self, webhook_json: object) -> Dict[str, List[str]]:
         users = {}
-        created_by = self._webhook_json["pull_request"]["user"]["login"]
+        created_by = webhook_json["pull_request"]["user"]["login"]
         self._add_to_involved_users(users, [created_by], InvolveReason.CREATOR)
 
-        ated_in_comment = self._find_users_ated(self._webhook_json["comment"]["body"])
+        ated_in_comment = self._find_users_ated(self.body)
         self._add_to_involved_users(
             users, ated_in_comment, InvolveReason.ATED_IN_COMMENT
         )
-
-        self._involved_users = users
         return users
 
+    def involved_users(self) -> Dict[str, List[str]]:
+        return self._involved_users
+
     def notification_title(self) -> str:
-        action = self._webhook_json["action"]
-        return f"PR Comment {action.capitalize()}"
+        return f"PR Comment {self.action.capitalize()}"
 
     def link_title(self) -> str:
-        title = self._webhook_json["pull_request"]["title"]
-        return f"Comment on {title}"
+        return f"Comment on {self.title}"
 
     def link_url(self) -> str:
-        return self._webhook_json["comment"]["html_url"]
+        return self.html_url
 
     def notification_message(self) -> str:
-        sender = self._webhook_json["sender"]["login"]
-        action = self._webhook_json["action"]
-        body = self._webhook_json["comment"]["body"]
-        if action == "deleted":
-            return f"{sender} {action} comment."
-        return f"{sender} {action} comment.\n\n{body}"
+        if self.action == "deleted":
+            return f"{self.sender} {self.action} comment."
+        return f"{self.sender} {self.action} comment.\n\n{self.body}"
 
     def should_skip_notification(self, combine_related_updates_interval: int) -> bool:
-        action = self._webhook_json["action"]
         # This event is associated with a review, skip duplicate notification
         if (
-            self._webhook_json["comment"]["pull_request_review_id"] is not None
-            and action == "created"
+            self.review_id is not None
+            and self.action == "created"
             and len(self.involved_users()) == 1
         ):
             return True
 
         return False
+
+    def coalesce_key(self) -> Tuple[str, int]:
+        return (self.repository, self.number)
@@ -18,52 +18,72 @@
 
 from typing import List, Dict
 
-from lark_bot.events.base_github_event import BaseGithubEvent, InvolveReason
+from lark_bot.events.base_github_event import (
+    BaseGithubEvent,
+    InvolveReason,
+    COMMON_PAYLOAD_FIELDS,
+    USER_FIELDS,
+)
+from lark_bot.events.mention_extractor import MentionExtractor
+from lark_bot.events.registry import register_event
 
 
+@register_event("pull_request_review")
 class PullRequestReviewEvent(BaseGithubEvent):
     """Pull Request Review: https://docs.github.com/en/webhooks/webhook-events-and-payloads#pull_request_review"""
 
-    def __init__(self, event_name: str, webhook_json: object) -> None:
-        super().__init__(event_name=event_name, webhook_json=webhook_json)
-        self._involved_users = None
-
-    def involved_users(self) -> Dict[str, List[str]]:
-        if self._involved_users is not None:
-            return self._involved_users
-
+    notified_actions = frozenset(["submitted"])
+    payload_fields = dict(
+        COMMON_PAYLOAD_FIELDS,
+        pull_request={"user": USER_FIELDS, "title": None},
+        review={"state": None, "html_url": None},
+    )
+
+    __slots__ = ("title", "review_state", "html_url", "_involved_users")
+
+    def __init__(
+        self,
+        event_name: str,
+        webhook_json: object,
+        mention_extractor: MentionExtractor = None,
+    ) -> None:
+        super().__init__(
+            event_name=event_name,
+            webhook_json=webhook_json,
+            mention_extractor=mention_extractor,
+        )
+        review = webhook_json["review"]
+        self.title = webhook_json["pull_request"]["title"]
+        self.review_state = review["state"]
+        self.html_url = review["html_url"]
+        self._involved_users = self._find_involved_users(webhook_json)
+
+    def _find_involved_users(self, webhook_json: object) -> Dict[str, List[str]]:
         users = {}
-        action = self._webhook_json["action"]
-        pull_request_json = self._webhook_json["pull_request"]
-
-        if action == "submitted":
-            created_by = pull_request_json["user"]["login"]
-            if created_by != self._webhook_json["sender"]["login"]:
+        if self.action == "submitted":
+            created_by = webhook_json["pull_request"]["user"]["login"]
+            if created_by != self.sender:
                 self._add_to_involved_users(users, [created_by], InvolveReason.CREATOR)
-
-        self._involved_users = users
         return users
 
+    def involved_users(self) -> Dict[str, List[str]]:
+        return self._involved_users
+
     def notification_title(self) -> str:
-        review_state = self._webhook_json["review"]["state"]
-        return f"PR {review_state.capitalize()} by Review"
+        return f"PR {self.review_state.capitalize()} by Review"
 
     def link_title(self) -> str:
-        return self._webhook_json["pull_request"]["title"]
+        return self.title
 
     def link_url(self) -> str:
-        return self._webhook_json["review"]["html_url"]
+        return self.html_url
 
     def notification_message(self) -> str:
-        sender = self._webhook_json["sender"]["login"]
-        review_state = self._webhook_json["review"]["state"]
-        return f"{sender} {review_state}."
+        return f"{self.sender} {self.review_state}."
 
     def should_skip_notification(self, combine_related_updates_interval: int) -> bool:
-        action = self._webhook_json["action"]
-
         # events to skip notification
-        if action != "submitted":
+        if self.action not in self.notified_actions:
             return True
 
         return False
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Registry of event classes by github webhook event name."""
+
+from typing import Dict, Optional
+import importlib
+
+
+# webhook event name -> module of its event class, imported on the first such event
+EVENT_MODULES = {
+    "issues": "lark_bot.events.issues_event",
+    "issue_comment": "lark_bot.events.issue_comment_event",
+    "pull_request": "lark_bot.events.pull_request_event",
+    "pull_request_review": "lark_bot.events.pull_request_review_event",
+    "pull_request_review_comment": "lark_bot.events.pull_request_review_comment_event",
+    "workflow_run": "lark_bot.events.workflow_run_event",
+}
+
+# events that are received but never notified
+DISCARDED_EVENTS = frozenset(["check_run", "pull_request_review_thread"])
+
+_event_classes: Dict[str, type] = {}
+
+
+def register_event(event_name: str):
+    """
+    Class decorator registering the event class of a webhook event name.
+    The module of the class is to be listed in EVENT_MODULES to be loaded lazily.
+    """
+
+    def decorator(event_class: type) -> type:
+        _event_classes[event_name] = event_class
+        return event_class
+
+    return decorator
+
+
+def get_event_class(event_name: str) -> Optional[type]:
+    """The event class registered for event_name, None for an unhandled event."""
+    event_class = _event_classes.get(event_name)
+    if event_class is None and event_name in EVENT_MODULES:
+        importlib.import_module(EVENT_MODULES[event_name])
+        event_class = _event_classes.get(event_name)
+    return event_class
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timestamps of github webhook payloads."""
+
+from datetime import datetime
+
+
+def parse_timestamp(value: str) -> int:
+    """Epoch seconds of an ISO-8601 timestamp, e.g. 2024-06-24T07:14:08Z."""
+    if value.endswith("Z"):
+        # fromisoformat only accepts the Z suffix since python 3.11
+        value = value[:-1] + "+00:00"
+    return int(datetime.fromisoformat(value).timestamp())
+
+
+def updated_within(created_at: str, updated_at: str, interval: float) -> bool:
+    """Whether updated_at is at most interval seconds after created_at."""
+    return parse_timestamp(updated_at) - parse_timestamp(created_at) <= interval
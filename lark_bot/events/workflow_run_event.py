@@ -18,53 +18,70 @@
 
 
 from typing import List
-from lark_bot.events.base_github_event import BaseGithubEvent, InvolveReason
+from lark_bot.events.base_github_event import (
+    BaseGithubEvent,
+    InvolveReason,
+    COMMON_PAYLOAD_FIELDS,
+)
+from lark_bot.events.mention_extractor import MentionExtractor
+from lark_bot.events.registry import register_event
 
 
+@register_event("workflow_run")
 class WorkflowRunEvent(BaseGithubEvent):
     """Workflow Run: https://docs.github.com/en/webhooks/webhook-events-and-payloads#workflow_run"""
 
-    def __init__(self, event_name: str, webhook_json: object) -> None:
-        super().__init__(event_name=event_name, webhook_json=webhook_json)
-        self._involved_users = None
-
-    def involved_users(self) -> List[object]:
-        if self._involved_users is not None:
-            return self._involved_users
-
-        users = {}
-
-        sender = self._webhook_json["sender"]["login"]
-
-        conclusion = self._webhook_json["workflow_run"]["conclusion"]
-
-        self._add_to_involved_users(
-            users, [sender], f"{InvolveReason.WORKFLOW_RUN_COMPLETE}.{conclusion}"
+    notified_actions = frozenset(["completed"])
+    payload_fields = dict(
+        COMMON_PAYLOAD_FIELDS,
+        workflow_run={
+            "conclusion": None,
+            "html_url": None,
+            "name": None,
+            "display_title": None,
+        },
+    )
+
+    __slots__ = ("name", "display_title", "html_url", "conclusion", "_involved_users")
+
+    def __init__(
+        self,
+        event_name: str,
+        webhook_json: object,
+        mention_extractor: MentionExtractor = None,
+    ) -> None:
+        super().__init__(
+            event_name=event_name,
+            webhook_json=webhook_json,
+            mention_extractor=mention_extractor,
         )
+        workflow_run = webhook_json["workflow_run"]
+        self.name = workflow_run["name"]
+        self.display_title = workflow_run["display_title"]
+        self.html_url = workflow_run["html_url"]
+        self.conclusion = workflow_run["conclusion"]
+        self._involved_users = {
+            self.sender: [f"{InvolveReason.WORKFLOW_RUN_COMPLETE}.{self.conclusion}"]
+        }
 
-        self._involved_users = users
-        return users
+    def involved_users(self) -> List[object]:
+        return self._involved_users
 
     def notification_title(self) -> str:
         return "Workflow Run Complete"
 
     def link_url(self) -> str:
-        return self._webhook_json["workflow_run"]["html_url"]
+        return self.html_url
 
     def link_title(self) -> str:
-        name = self._webhook_json["workflow_run"]["name"]
-        display = self._webhook_json["workflow_run"]["display_title"]
-        return f"{name} for {display}"
+        return f"{self.name} for {self.display_title}"
 
     def notification_message(self) -> str:
-        name = self._webhook_json["workflow_run"]["name"]
-        conclusion = self._webhook_json["workflow_run"]["conclusion"]
-
-        return f'Workflow "{name}" ended with status: **{conclusion}**'
+        return f'Workflow "{self.name}" ended with status: **{self.conclusion}**'
 
     def should_skip_notification(self, combine_related_updates_interval: int) -> bool:
         # events to skip notification
-        if self._webhook_json["action"] != "completed":
+        if self.action not in self.notified_actions:
             return True
 
         return False
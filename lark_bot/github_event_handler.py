@@ -16,36 +16,97 @@
 
 """Github Event Handler"""
 
+from typing import Dict
+
 from lark_bot import events
-from lark_bot.user_manager import UserManager, BOTS
-from lark_bot.lark_bot_client import LarkBotClient
+from lark_bot.user_manager import UserManager
+from lark_bot.lark_bot_client import LarkBotClient, Notification
+from lark_bot.notification_coalescer import (
+    NotificationCoalescer,
+    digest_notifications,
+)
 
 
 COMBINE_RELATED_UPDATES_TIME = 2  # seconds
+DEFAULT_DIGEST_INTERVAL = 600  # seconds
+MAX_DIGEST_NOTIFICATIONS = 50
 
 
 class GithubEventHandler:
     """Handles github webhook events. See GithubEventHandler.handle_event."""
 
-    def __init__(self, user_config_path: str, lark_bot_url: str) -> None:
+    def __init__(
+        self,
+        user_config_path: str,
+        lark_bot_url: str,
+        lark_bot_client: LarkBotClient = None,
+        coalesce_window: float = 0,
+    ) -> None:
+        """
+        coalesce_window: seconds to wait for related issue/PR updates to merge into one
+        card. If 0, only updates within COMBINE_RELATED_UPDATES_TIME of the issue/PR
+        creation are combined, by skipping them.
+        """
         self._user_manager = UserManager(user_config_path)
-        self._lark_bot_client = LarkBotClient(lark_bot_url)
+        # only @mentions of known users are involved in an event
+        self._mention_extractor = events.MentionExtractor(
+            known_logins=self._user_manager.known_logins
+        )
+        if lark_bot_client is None:
+            lark_bot_client = LarkBotClient(lark_bot_url)
+        self._lark_bot_client = lark_bot_client
+        self._coalescer = None
+        self._combine_related_updates_time = COMBINE_RELATED_UPDATES_TIME
+        if coalesce_window > 0:
+            self._coalescer = NotificationCoalescer(
+                self._lark_bot_client.post_notification, coalesce_window
+            )
+            self._combine_related_updates_time = None
+        # per-recipient digests, for users with digest_interval in their config
+        self._digest = NotificationCoalescer(
+            self._lark_bot_client.post_notification,
+            window=DEFAULT_DIGEST_INTERVAL,
+            max_notifications=MAX_DIGEST_NOTIFICATIONS,
+            max_delay_windows=1,
+            merge=digest_notifications,
+        )
         self._debug = True
 
+    def close(self):
+        if self._coalescer is not None:
+            self._coalescer.close()
+        self._digest.close()
+        self._lark_bot_client.close()
+        self._user_manager.close()
+
+    def stats(self) -> Dict[str, object]:
+        return {"lark_delivery": self._lark_bot_client.stats()}
+
+    @classmethod
+    def is_event_handled(cls, event_name: str) -> bool:
+        """Whether events of the name can be notified, see events.get_event_class."""
+        return events.get_event_class(event_name) is not None
+
+    @classmethod
+    def is_action_discarded(cls, event_name: str, action: str) -> bool:
+        """Whether events of the name and action are never notified."""
+        event_class = events.get_event_class(event_name)
+        return event_class is not None and event_class.discards_action(action)
+
     def _post_to_lark(self, event: events.BaseGithubEvent):
         user_ids = []
-        for github_user, reasons in event.involved_users().items():
-            if github_user not in BOTS:
-                try:
-                    lark_user = self._user_manager.notify_user(
-                        github_login_name=github_user, reasons=reasons, event=event
-                    )
-                except RuntimeError as e:
-                    if self._debug:
-                        print("UserManager.notify_user", e)
-                    lark_user = None
-                if lark_user is not None:
-                    user_ids.append(lark_user)
+        for lark_user, digest_interval in self._user_manager.notify_users(
+            event.involved_users(), event
+        ):
+            if digest_interval > 0:
+                self._digest.add(
+                    lark_user,
+                    Notification.from_event(event),
+                    [lark_user],
+                    window=digest_interval,
+                )
+            else:
+                user_ids.append(lark_user)
 
         # if len(user_ids) == 0 and event.get_sender() in BOTS:
         if len(user_ids) == 0:
@@ -56,32 +117,34 @@ class GithubEventHandler:
                 )
             return
 
-        self._lark_bot_client.post_to_lark(event, user_ids)
+        coalesce_key = None if self._coalescer is None else event.coalesce_key()
+        if coalesce_key is not None:
+            self._coalescer.add(coalesce_key, Notification.from_event(event), user_ids)
+        else:
+            self._lark_bot_client.post_to_lark(event, user_ids)
 
     def handle_event(
         self, event_name: str, webhook_json: object
     ) -> events.BaseGithubEvent:
-        event = None
-        if event_name == "issues":
-            event = events.IssuesEvent(event_name, webhook_json)
-        elif event_name == "issue_comment":
-            event = events.IssueCommentEvent(event_name, webhook_json)
-        elif event_name == "pull_request":
-            event = events.PullRequestEvent(event_name, webhook_json)
-        elif event_name == "pull_request_review":
-            event = events.PullRequestReviewEvent(event_name, webhook_json)
-        elif event_name == "pull_request_review_comment":
-            event = events.PullRequestReviewCommentEvent(event_name, webhook_json)
-        elif event_name == "workflow_run":
-            event = events.WorkflowRunEvent(event_name, webhook_json)
-        elif event_name in ["check_run", "pull_request_review_thread"]:
-            if self._debug:
-                print(f"Discard event {event_name}")
-            return None  # now we discard this event
-        else:
+        event_class = events.get_event_class(event_name)
+        if event_class is None:
+            if event_name in events.DISCARDED_EVENTS:
+                if self._debug:
+                    print(f"Discard event {event_name}")
+                return None  # now we discard this event
             raise NotImplementedError(f"Unhandled event {event_name}")
 
-        if event.should_skip_notification(COMBINE_RELATED_UPDATES_TIME):
+        # reject actions that are never notified before building the event
+        action = webhook_json.get("action")
+        if event_class.discards_action(action):
+            if self._debug:
+                print(
+                    f"[GithubEventHandler::handle_event] skip notification of {event_name}: {action}"
+                )
+            return None
+
+        event = event_class(event_name, webhook_json, self._mention_extractor)
+        if event.should_skip_notification(self._combine_related_updates_time):
             if self._debug:
                 print(
                     f"[GithubEventHandler::handle_event] skip notification of {event.event_name}: {event.get_action()}"
@@ -18,74 +18,168 @@
 
 import json
 import os
+import random
 import sys
+import threading
+import time
 import requests
-import ipaddress
-from datetime import datetime
+from typing import List, Optional
 
 from http.server import BaseHTTPRequestHandler
-from lark_bot.github_event_handler import GithubEventHandler
+from lark_bot.subnet_index import SubnetIndex
+from lark_bot.webhook_ingestor import WebhookIngestor
 
 
-EVENT_DIR = os.path.join(
-    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "event_log"
+HOOK_SUBNET_CACHE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    "github_hook_subnets.json",
 )
 
+# used before the first successful fetch if there is no cache on disk
+DEFAULT_HOOK_SUBNETS = [
+    "192.30.252.0/22",
+    "185.199.108.0/22",
+    "140.82.112.0/20",
+    "143.55.64.0/20",
+    "2a0a:a440::/29",
+    "2606:50c0::/32",
+]
+DISCARD_CHUNK_SIZE = 64 * 1024
+
 
 class GitHubHookIpManager:
-    """Get github hook info and verify IP address is github hook"""
+    """
+    Get github hook info and verify IP address is github hook.
+
+    The hook subnets are refreshed by a background thread. Checks always use the
+    current subnets (from the on-disk cache or the defaults before the first fetch),
+    so a webhook request never waits for the github meta API.
+    """
 
     REFRESH_HOOK_SUBNET_INTERVAL = 1  # day
+    META_API_URL = "https://api.github.com/meta"
+    META_API_TIMEOUT = 3  # seconds
+    RETRY_MIN_DELAY = 30  # seconds
+    RETRY_MAX_DELAY = 3600  # seconds
+
+    def __init__(
+        self,
+        refresh_interval_days: int = REFRESH_HOOK_SUBNET_INTERVAL,
+        extra_subnets: List[str] = None,
+        cache_path: str = HOOK_SUBNET_CACHE,
+        background_refresh: bool = True,
+    ):
+        """
+        extra_subnets: subnets allowed in addition to github hooks, e.g. github
+        enterprise or proxy ranges
+        cache_path: file to persist the last fetched hook subnets, None to disable
+        """
+        self._refresh_interval = max(
+            refresh_interval_days * 24 * 3600, self.RETRY_MIN_DELAY
+        )
+        self._extra_subnets = list(extra_subnets or [])
+        self._cache_path = cache_path
+        self._etag = None
+        self._last_fetch_time = None  # epoch seconds of the last successful fetch
+        self._github_hook_subnets = DEFAULT_HOOK_SUBNETS
+        self._load_cache()
+        self._subnet_index = SubnetIndex(self._github_hook_subnets + self._extra_subnets)
+
+        self._stop_event = threading.Event()
+        self._refresher = None
+        if background_refresh:
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="hook-subnet-refresher", daemon=True
+            )
+            self._refresher.start()
 
-    def __init__(self, refresh_interval_days: int = REFRESH_HOOK_SUBNET_INTERVAL):
-        self._last_github_hook_ip_fetch = None
-        self._refresh_interval = refresh_interval_days
+    def _load_cache(self):
+        if self._cache_path is None or not os.path.exists(self._cache_path):
+            return
+        try:
+            with open(self._cache_path, "r", encoding="utf-8") as cache_f:
+                cache = json.load(cache_f)
+            self._github_hook_subnets = cache["hooks"]
+            self._etag = cache.get("etag")
+            self._last_fetch_time = cache.get("fetched_at")
+        except (OSError, KeyError, json.JSONDecodeError) as e:
+            sys.stderr.write(f"WARNING reading {self._cache_path}: {e}. Ignore cache\n")
 
-    @classmethod
-    def get_github_webhook_subnets(cls):
-        github_api_url = "https://api.github.com/meta"
-        rsp = requests.get(github_api_url, timeout=3)
+    def _save_cache(self):
+        if self._cache_path is None:
+            return
+        # per process, as forked server processes share the cache file
+        tmp_path = f"{self._cache_path}.{os.getpid()}.tmp"
         try:
-            hooks = json.loads(rsp.text)["hooks"]
-        except KeyError as e:
-            sys.stderr.write(json.dumps(json.loads(rsp.text), indent=2))
-            sys.stderr.write(f"{e}\n")
-            hooks = [
-                "192.30.252.0/22",
-                "185.199.108.0/22",
-                "140.82.112.0/20",
-                "143.55.64.0/20",
-                "2a0a:a440::/29",
-                "2606:50c0::/32",
-            ]
-        return hooks
-
-    def _refresh_from_github(self):
-        now = datetime.now()
-        if (
-            self._last_github_hook_ip_fetch is None
-            or (now - self._last_github_hook_ip_fetch).days > self._refresh_interval
-        ):
-            if self._last_github_hook_ip_fetch is not None:
-                print(
-                    "Refresh after",
-                    (now - self._last_github_hook_ip_fetch).days,
-                    "days",
+            with open(tmp_path, "w", encoding="utf-8") as cache_f:
+                json.dump(
+                    {
+                        "hooks": self._github_hook_subnets,
+                        "etag": self._etag,
+                        "fetched_at": self._last_fetch_time,
+                    },
+                    cache_f,
                 )
-            self._github_hook_subnets = self.get_github_webhook_subnets()
-            self._last_github_hook_ip_fetch = now
-            sys.stderr.write(f"Refreshed hook subnets:\n{self._github_hook_subnets}\n")
+            os.replace(tmp_path, self._cache_path)
+        except OSError as e:
+            sys.stderr.write(f"WARNING writing {self._cache_path}: {e}\n")
+
+    def _fetch_from_github(self):
+        """Fetch hook subnets with a conditional request. Raises on failure."""
+        headers = {"Accept": "application/vnd.github+json"}
+        if self._etag is not None:
+            headers["If-None-Match"] = self._etag
+        rsp = requests.get(
+            self.META_API_URL, headers=headers, timeout=self.META_API_TIMEOUT
+        )
+        if rsp.status_code == 304:
+            self._last_fetch_time = time.time()
+            self._save_cache()
+            return
+        if rsp.status_code != 200:
+            raise RuntimeError(f"GET {self.META_API_URL}: {rsp.status_code} {rsp.text}")
+        hooks = json.loads(rsp.text)["hooks"]
+        # swap in a new index so that concurrent checks see either the old or the new one
+        self._subnet_index = SubnetIndex(hooks + self._extra_subnets)
+        self._github_hook_subnets = hooks
+        self._etag = rsp.headers.get("ETag")
+        self._last_fetch_time = time.time()
+        self._save_cache()
+        sys.stderr.write(f"Refreshed hook subnets:\n{self._github_hook_subnets}\n")
+
+    def _refresh_loop(self):
+        num_failures = 0
+        while not self._stop_event.is_set():
+            if self._last_fetch_time is None:
+                wait = 0
+            else:
+                wait = self._last_fetch_time + self._refresh_interval - time.time()
+            if wait <= 0:
+                try:
+                    self._fetch_from_github()
+                    num_failures = 0
+                    continue
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    # keep serving with the stale subnets and retry with jittered backoff
+                    num_failures += 1
+                    wait = min(
+                        self.RETRY_MAX_DELAY,
+                        self.RETRY_MIN_DELAY * 2 ** (num_failures - 1),
+                    ) * random.uniform(0.5, 1.5)
+                    sys.stderr.write(
+                        f"Failed to refresh hook subnets ({num_failures}): {e}. "
+                        f"Retry in {wait:.0f}s\n"
+                    )
+            self._stop_event.wait(wait)
+
+    def stop(self):
+        """Stop the background refresher."""
+        self._stop_event.set()
+        if self._refresher is not None:
+            self._refresher.join()
 
     def check_from_github(self, client_ip_str: str):
-        self._refresh_from_github()
-        for subnet in self._github_hook_subnets:
-            subnet_ip, subnet_length = subnet.split("/", 1)
-            client_subnet = ipaddress.ip_network(
-                f"{client_ip_str}/{subnet_length}", strict=False
-            ).network_address
-            if str(client_subnet) == subnet_ip:
-                return True
-        return False
+        return client_ip_str in self._subnet_index
 
 
 class NotifyLarkRequestHandler(BaseHTTPRequestHandler):
@@ -93,35 +187,49 @@ class NotifyLarkRequestHandler(BaseHTTPRequestHandler):
 
     def __init__(
         self,
-        github_event_handler: GithubEventHandler,
+        webhook_ingestor: WebhookIngestor,
         github_ip_manager: GitHubHookIpManager,
         *args,
-        event_log_dir: str = EVENT_DIR,
-        always_log_event: bool = False,
         **kwargs,
     ):
-        self._github_event_handler = github_event_handler
-        self._event_log_dir = event_log_dir
-        self._always_log_event = always_log_event
+        self._webhook_ingestor = webhook_ingestor
         self._ip_manager = github_ip_manager
         if len(args) > 0:
             super().__init__(*args, **kwargs)
 
-    def _log_event(self, event_name: str, webhook_json: object, timestamp: datetime):
-        dir_name = f"{event_name}-{webhook_json['action']}"
-        os.makedirs(os.path.join(self._event_log_dir, dir_name), exist_ok=True)
-        with open(
-            os.path.join(
-                self._event_log_dir,
-                dir_name,
-                timestamp.strftime("%Y%m%d-%H%M%S.%f") + ".json",
-            ),
-            "w",
-            encoding="utf-8",
-        ) as event_output:
-            event_output.write(json.dumps(webhook_json, indent=2))
+    def _send_json(self, status: int, body: object, headers: dict = None):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _content_length(self) -> Optional[int]:
+        try:
+            length = int(self.headers["Content-Length"])
+        except (TypeError, ValueError):
+            return None
+        return length if length >= 0 else None
+
+    def _discard_body(self):
+        """Read the unused body, which would otherwise be parsed as the next request."""
+        remaining = self._content_length() or 0
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, DISCARD_CHUNK_SIZE))
+            if not chunk:
+                break
+            remaining -= len(chunk)
 
     def do_GET(self):  # pylint: disable=invalid-name, BaseHTTPRequestHandler interface
+        if self.path == "/stats" and self._ip_manager.check_from_github(
+            self.address_string()
+        ):
+            # only for the allowed subnets, as the stats expose the delivery state
+            self._send_json(200, self._webhook_ingestor.stats())
+            return
         if self.path == "/health":  # allow health check
             self.send_response(200)
         else:
@@ -139,17 +247,25 @@ class NotifyLarkRequestHandler(BaseHTTPRequestHandler):
             self.end_headers()
             return
 
-        now = datetime.now()
-        length = int(self.headers["Content-Length"])
         event = self.headers["X-GitHub-Event"]
-        webhook_json_str = self.rfile.read(length).decode("utf-8")
-        webhook_json = json.loads(webhook_json_str)
-        self.send_response(200)
-        self.send_header("Content-type", "text/html")
-        self.end_headers()
-        try:
-            self._github_event_handler.handle_event(event, webhook_json)
-            if self._always_log_event:
-                self._log_event(event, webhook_json, now)
-        except Exception:  # pylint: disable=broad-exception-caught
-            self._log_event(event, webhook_json, now)
+        delivery_id = self.headers["X-GitHub-Delivery"]
+        response = self._webhook_ingestor.precheck(event, delivery_id)
+        if response is None:
+            length = self._content_length()
+            if length is None:
+                self._webhook_ingestor.release(delivery_id)
+                # the end of the body is unknown, so the connection cannot be reused
+                self.close_connection = True
+                self._send_json(411, {"error": "Content-Length required"})
+                return
+            try:
+                response = self._webhook_ingestor.ingest(
+                    event, delivery_id, self.rfile.read(length)
+                )
+            except BaseException:
+                # e.g. the client disconnected, so that a redelivery is processed
+                self._webhook_ingestor.release(delivery_id)
+                raise
+        else:
+            self._discard_body()
+        self._send_json(*response)
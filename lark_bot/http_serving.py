@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Thread pool and pre-fork serving of the webhook HTTP server."""
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+from typing import Callable, Dict
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+RESPAWN_DELAY = 1  # seconds to wait before restarting a worker process that died
+
+
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTPServer handling connections on a fixed pool of num_threads threads, so that a
+    slow request (e.g. an event processed inline with its post to lark) does not hold
+    up the others. A connection is only accepted once a thread is free, so connections
+    beyond the pool wait in the listen backlog instead of piling up in the process.
+
+    With reuse_port, several processes can listen on the same port (SO_REUSEPORT) and
+    the kernel spreads the connections among them.
+    """
+
+    request_queue_size = 128  # listen backlog, 5 in socketserver
+
+    def __init__(
+        self,
+        server_address,
+        request_handler_class,
+        num_threads: int = 1,
+        reuse_port: bool = False,
+    ) -> None:
+        if num_threads <= 0:
+            raise ValueError(f"num_threads must be positive, got {num_threads}")
+        self._reuse_port = reuse_port
+        self._pool = None
+        if num_threads > 1:
+            self._pool = ThreadPoolExecutor(num_threads, thread_name_prefix="http")
+            self._free_threads = threading.Semaphore(num_threads)
+        super().__init__(server_address, request_handler_class)
+
+    def server_bind(self):
+        if self._reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        if self._pool is None:
+            super().process_request(request, client_address)
+            return
+        # block the accept loop until a thread is free
+        self._free_threads.acquire()
+        self._pool.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:  # pylint: disable=broad-exception-caught
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._free_threads.release()
+
+    def server_close(self):
+        """Stop accepting connections and finish the ones being handled."""
+        super().server_close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+
+def serve_forked(num_workers: int, serve_worker: Callable[[int], None]):
+    """
+    Run serve_worker(index) in num_workers forked processes, restarting a process that
+    dies, until SIGTERM or Ctrl-C is received, which is forwarded to the workers as
+    SIGTERM. serve_worker should build all its state (threads, sessions, caches) itself,
+    as threads do not survive the fork.
+    """
+    workers: Dict[int, int] = {}  # pid -> index
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            # only stop on the SIGTERM forwarded by the parent
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            exit_code = 0
+            try:
+                serve_worker(index)
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else 0
+            except BaseException:  # pylint: disable=broad-exception-caught
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exit_code)  # pylint: disable=protected-access
+        workers[pid] = index
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(num_workers):
+        spawn(index)
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = workers.pop(pid, None)
+        if index is None or stopping:
+            continue
+        sys.stderr.write(
+            f"Worker {index} (pid {pid}) exited with status {status}. Restart it\n"
+        )
+        time.sleep(RESPAWN_DELAY)
+        if not stopping:
+            spawn(index)
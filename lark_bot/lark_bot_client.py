@@ -17,56 +17,198 @@
 """Client to push message to lark bot."""
 
 from lark_bot.events import BaseGithubEvent
+from lark_bot.lark_delivery import LarkDelivery, RateLimiter, DEFAULT_MAX_RETRIES
+from lark_bot.lark_outbox import LarkOutbox
 import requests
-from typing import List
+import sys
+import threading
+from functools import partial
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, NamedTuple
 
 GET_TIMEOUT = 5
 POST_TIMEOUT = 5
+CONNECT_TIMEOUT = 3
+DEFAULT_POOL_SIZE = 10
+
+
+class Notification(NamedTuple):
+    """Content of a notification card, detached from the event that produced it."""
+
+    event_name: str
+    title: str
+    link_title: str
+    link_url: str
+    message: str
+
+    @classmethod
+    def from_event(cls, event: BaseGithubEvent):
+        return cls(
+            event.event_name,
+            event.notification_title(),
+            event.link_title(),
+            event.link_url(),
+            event.notification_message(),
+        )
+
+
+def build_card(notification: Notification, user_ids: List[str]) -> Dict:
+    """Lark message of a notification card that @s the users."""
+    mentions = " ".join([f"<at id={user_id}></at>" for user_id in user_ids])
+    if len(mentions) == 0:
+        mentions = "General Notification."
+    return {
+        "msg_type": "interactive",
+        "card": {
+            "type": "template",
+            "data": {
+                # Card builder: https://open.larksuite.com/tool/cardbuilder?templateId=ctp_AAHvgR0HTy2t
+                "template_id": "ctp_AAHvgR0HTy2t",
+                "template_variable": {
+                    # the "GitHub:" prefix is needed to meet the keyword requirement
+                    "notification_title": f"GitHub: {notification.title}",
+                    "mentions": mentions,
+                    "link_title": notification.link_title,
+                    "link_url": notification.link_url,
+                    "message": notification.message,
+                },
+            },
+        },
+    }
 
 
 class LarkBotClient:
-    """Cleint to push message to the Lark bot"""
+    """
+    Cleint to push message to the Lark bot.
+
+    Requests go through one pooled keep-alive session, which is safe to share across
+    threads, so that a notification reuses an open connection instead of doing a new
+    TCP and TLS handshake. With http2=True, httpx is used if installed (pip install
+    httpx[http2]). Messages are rate limited and retried, see LarkDelivery.
+    With outbox_dir, messages are persisted until delivered and replayed after a
+    restart, see LarkOutbox.
+    """
 
     def __init__(
         self,
         lark_bot_url: str,
         get_time_out: int = GET_TIMEOUT,
         post_time_out: int = POST_TIMEOUT,
+        connect_time_out: int = CONNECT_TIMEOUT,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        http2: bool = False,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        outbox_dir: str = None,
+        rate_limiter: RateLimiter = None,
     ) -> None:
         self._lark_bot_url = lark_bot_url
         self._get_time_out = get_time_out
         self._post_time_out = post_time_out
+        self._connect_time_out = connect_time_out
+        self._session = None
+        # exceptions of _send when lark cannot be reached
+        self._transport_errors = (requests.RequestException,)
+        if http2:
+            self._session = self._create_http2_session(pool_size)
+        if self._session is None:
+            self._session = self._create_session(pool_size)
+            # requests takes a (connect, read) timeout per request
+            self._post_kwargs = {"timeout": (connect_time_out, post_time_out)}
+        else:
+            self._post_kwargs = {}
+        self._delivery = LarkDelivery(
+            self._send,
+            rate_limiter=rate_limiter,
+            max_retries=max_retries,
+            transport_errors=self._transport_errors,
+        )
+        self._outbox = None
+        if outbox_dir is not None:
+            self._outbox = LarkOutbox(outbox_dir)
+            threading.Thread(
+                target=self._replay_outbox, name="lark-outbox-replay", daemon=True
+            ).start()
+
+    @classmethod
+    def _create_session(cls, pool_size: int) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _create_http2_session(self, pool_size: int):
+        try:
+            import httpx  # pylint: disable=import-outside-toplevel
+
+            self._transport_errors = (httpx.HTTPError, httpx.InvalidURL)
+            return httpx.Client(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size
+                ),
+                timeout=httpx.Timeout(
+                    self._post_time_out, connect=self._connect_time_out
+                ),
+            )
+        except ImportError as e:
+            sys.stderr.write(f"WARNING: {e}. Fall back to HTTP/1.1\n")
+            return None
+
+    def close(self):
+        # stop the acks of the delivery thread before closing the outbox
+        self._delivery.close()
+        if self._outbox is not None:
+            self._outbox.close()
+        self._session.close()
+
+    def _replay_outbox(self):
+        for message_id, data in self._outbox.pending():
+            self._delivery.deliver(data, partial(self._outbox.ack, message_id))
+
+    def stats(self) -> Dict[str, int]:
+        """Delivery counters, see LarkDelivery.stats."""
+        return self._delivery.stats()
+
+    def _send(self, data: Dict):
+        return self._session.post(self._lark_bot_url, json=data, **self._post_kwargs)
 
     def post_to_lark(self, event: BaseGithubEvent, user_ids: List[str]):
+        return self.post_notification(Notification.from_event(event), user_ids)
+
+    def post_notification(self, notification: "Notification", user_ids: List[str]):
         print(
-            f"[LarkBotClient] Post event {event.event_name} {event.notification_title()} to lark"
+            f"[LarkBotClient] Post event {notification.event_name} {notification.title} to lark"
         )
-        mentions = " ".join([f"<at id={user_id}></at>" for user_id in user_ids])
-        if len(mentions) == 0:
-            mentions = "General Notification."
-        data = {
-            "msg_type": "interactive",
-            "card": {
-                "type": "template",
-                "data": {
-                    # Card builder: https://open.larksuite.com/tool/cardbuilder?templateId=ctp_AAHvgR0HTy2t
-                    "template_id": "ctp_AAHvgR0HTy2t",
-                    "template_variable": {
-                        # the "GitHub:" prefix is needed to meet the keyword requirement
-                        "notification_title": f"GitHub: {event.notification_title()}",
-                        "mentions": mentions,
-                        "link_title": event.link_title(),
-                        "link_url": event.link_url(),
-                        "message": event.notification_message(),
-                    },
-                },
-            },
-        }
-        response = requests.post(self._lark_bot_url, json=data, timeout=POST_TIMEOUT)
-        # print(json.dumps(data, indent=2))
-        if response.status_code != 200:
-            print(
-                f"Push {event.event_name} to lark notification: {response.status_code}"
-            )
-            print(response.text)
-        return response.status_code
+        data = build_card(notification, user_ids)
+        ack = None
+        if self._outbox is not None:
+            # persisted before sending, acked once lark accepts or rejects the message
+            ack = partial(self._outbox.ack, self._outbox.put(data))
+        status_code = self._delivery.deliver(data, ack)
+        if status_code is not None and status_code != 200:
+            print(f"Push {notification.event_name} to lark notification: {status_code}")
+        return status_code
+
+
+class DryRunLarkBotClient:
+    """Prints the notifications instead of posting them, e.g. to replay events."""
+
+    def __init__(self) -> None:
+        self._posted = 0
+
+    def post_to_lark(self, event: BaseGithubEvent, user_ids: List[str]):
+        return self.post_notification(Notification.from_event(event), user_ids)
+
+    def post_notification(self, notification: Notification, user_ids: List[str]):
+        self._posted += 1
+        print(
+            f"[DryRunLarkBotClient] {notification.event_name} {notification.title} "
+            f"to {user_ids}: {notification.link_url}"
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {"posted": self._posted}
+
+    def close(self):
+        pass
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Rate limited, retried delivery of messages to the Lark bot."""
+
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+
+import requests
+
+# Lark custom bot limits: https://open.larksuite.com/document/client-docs/bot-v3/add-custom-bot
+LARK_RATE_PER_SECOND = 5
+LARK_RATE_PER_MINUTE = 100
+# Lark error codes in a 200 response that are worth retrying
+RETRIABLE_LARK_CODES = {
+    9499,  # too many requests
+    11232,  # frequency limited
+}
+
+DEFAULT_MAX_RETRIES = 3
+RETRY_MIN_DELAY = 1  # seconds
+RETRY_MAX_DELAY = 30  # seconds
+DEFAULT_MAX_PENDING = 1000
+
+
+class TokenBucket:
+    """
+    Token bucket that allows `rate` requests per second with bursts up to `capacity`.
+    reserve() does not block, so the bucket can also be used from asyncio code.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._last_refill) * self._rate
+        )
+        self._last_refill = now
+
+    def reserve(self) -> float:
+        """Take a token. Returns the seconds to wait before the token can be used."""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self._rate
+
+    def try_take(self) -> bool:
+        """Take a token if one is available now."""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def give_back(self):
+        """Return a token taken by try_take."""
+        with self._lock:
+            self._tokens = min(self._capacity, self._tokens + 1)
+
+
+class RateLimiter:
+    """Combination of token buckets, e.g. a per-second and a per-minute limit."""
+
+    def __init__(self, buckets: List[TokenBucket]) -> None:
+        self._buckets = buckets
+
+    @classmethod
+    def for_lark_bot(cls, num_processes: int = 1):
+        """num_processes: processes posting to the same bot, which share its limits"""
+        per_second = LARK_RATE_PER_SECOND / num_processes
+        per_minute = LARK_RATE_PER_MINUTE / num_processes
+        return cls(
+            [
+                TokenBucket(per_second, max(1, per_second)),
+                TokenBucket(per_minute / 60, max(1, per_minute)),
+            ]
+        )
+
+    def reserve(self) -> float:
+        return max((bucket.reserve() for bucket in self._buckets), default=0)
+
+    def try_acquire(self) -> bool:
+        """Take a token of every bucket if all have one now. Never blocks."""
+        taken = []
+        for bucket in self._buckets:
+            if not bucket.try_take():
+                for taken_bucket in taken:
+                    taken_bucket.give_back()
+                return False
+            taken.append(bucket)
+        return True
+
+    def acquire(self):
+        """Block until a request is allowed."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Stop sending after `failure_threshold` consecutive failures. After `reset_timeout`
+    seconds one probe request is allowed: its success closes the breaker, its failure
+    opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30) -> None:
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._num_failures = 0
+        self._opened_at = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if (
+                self._state == self.OPEN
+                and time.monotonic() - self._opened_at >= self._reset_timeout
+            ):
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def seconds_until_retry(self) -> float:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return 0
+            return max(0, self._opened_at + self._reset_timeout - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._num_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._num_failures += 1
+            if (
+                self._state == self.HALF_OPEN
+                or self._num_failures >= self._failure_threshold
+            ):
+                if self._state == self.CLOSED:
+                    sys.stderr.write("[CircuitBreaker] Open circuit to lark\n")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class SentResponse(NamedTuple):
+    """The parts of a lark response read by is_success/is_retriable/retry_delay."""
+
+    status_code: int
+    text: str
+    headers: Dict[str, str]
+
+
+def is_retriable(response: requests.Response) -> bool:
+    if response.status_code == 429 or response.status_code >= 500:
+        return True
+    if response.status_code != 200:
+        return False
+    try:
+        return json.loads(response.text).get("code") in RETRIABLE_LARK_CODES
+    except (ValueError, AttributeError):
+        return False
+
+
+def is_success(response: requests.Response) -> bool:
+    if response.status_code != 200:
+        return False
+    try:
+        return json.loads(response.text).get("code", 0) == 0
+    except (ValueError, AttributeError):
+        return True
+
+
+def retry_delay(num_attempts: int, response: requests.Response = None) -> float:
+    """Jittered exponential backoff, or the Retry-After header if lark sends one."""
+    if response is not None and response.headers.get("Retry-After", "").isdigit():
+        return float(response.headers["Retry-After"])
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_MIN_DELAY * 2**num_attempts))
+
+
+class DeliveryPolicy:
+    """
+    The decisions shared by LarkDelivery and AsyncLarkBotClient, which only differ in
+    how they send and wait: whether an attempt may be made, what a response or a
+    transport error means for the message and the circuit breaker, how long to back
+    off, and the delivery counters.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate_limiter: RateLimiter = None,
+        circuit_breaker: CircuitBreaker = None,
+    ) -> None:
+        """name: prefix of the logged messages"""
+        self._name = name
+        self.rate_limiter = rate_limiter or RateLimiter.for_lark_bot()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self._counters = {"sent": 0, "retried": 0, "failed": 0, "dropped": 0}
+        self._counter_lock = threading.Lock()
+
+    def _count(self, counter: str):
+        with self._counter_lock:
+            self._counters[counter] += 1
+
+    def stats(self, pending: int) -> Dict[str, object]:
+        with self._counter_lock:
+            stats = dict(self._counters)
+        stats["pending"] = pending
+        stats["circuit"] = self.circuit_breaker.state
+        return stats
+
+    def wait_before_attempt(self, attempt: int) -> Optional[float]:
+        """
+        Seconds to wait for the rate limit before the attempt-th attempt (from 0), or
+        None if the circuit breaker does not allow a request now, see circuit_wait.
+        """
+        if not self.circuit_breaker.allow_request():
+            return None
+        if attempt > 0:
+            self._count("retried")
+        return self.rate_limiter.reserve()
+
+    def circuit_wait(self) -> float:
+        """Seconds to wait before the circuit breaker may allow a request again."""
+        return max(RETRY_MIN_DELAY, self.circuit_breaker.seconds_until_retry())
+
+    def on_response(self, response: requests.Response) -> Optional[bool]:
+        """
+        Returns True if lark accepted the message, False if it rejected it, None if
+        the message is worth retrying.
+        """
+        if is_success(response):
+            self.circuit_breaker.record_success()
+            self._count("sent")
+            return True
+        if not is_retriable(response):
+            # lark is up but rejects the message, e.g. keyword or signature mismatch
+            self.circuit_breaker.record_success()
+            self._count("failed")
+            sys.stderr.write(
+                f"[{self._name}] Lark rejected message: "
+                f"{response.status_code} {response.text}\n"
+            )
+            return False
+        self.circuit_breaker.record_failure()
+        return None
+
+    def on_transport_error(self, error: Exception) -> None:
+        """Lark could not be reached, the message is worth retrying."""
+        sys.stderr.write(f"[{self._name}] {error!r}\n")
+        self.circuit_breaker.record_failure()
+
+    def on_failed(self, error: Exception):
+        """A message failed for a reason no retry would fix, e.g. it cannot be encoded."""
+        self._count("failed")
+        sys.stderr.write(f"[{self._name}] Failed message: {error!r}\n")
+
+    def on_dropped(self, ack: Callable):
+        """The oldest pending message is dropped as the pending queue is full."""
+        self._count("dropped")
+        sys.stderr.write(f"[{self._name}] Pending queue full, drop a message\n")
+        if ack is not None:
+            # the message is given up, so that it is not kept in the outbox forever
+            ack()
+
+
+class LarkDelivery:
+    """
+    Deliver messages with rate limiting, retries and a circuit breaker.
+
+    deliver() never waits: a message is sent right away if the rate limit allows it
+    and the circuit is closed, and is otherwise, or if sending it fails, kept in a
+    bounded pending queue. A background thread sends the pending messages in order,
+    waiting for the rate limit and retrying with backoff until lark recovers. The
+    oldest pending message is dropped, and acked, when the queue is full.
+
+    close() stops the background thread. Messages still pending are not acked, so
+    they are resent from the outbox after a restart if there is one.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Dict], requests.Response],
+        rate_limiter: RateLimiter = None,
+        circuit_breaker: CircuitBreaker = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        transport_errors: Tuple[Type[Exception], ...] = (requests.RequestException,),
+    ) -> None:
+        """transport_errors: exceptions raised by send when lark cannot be reached"""
+        self._send = send
+        self._policy = DeliveryPolicy("LarkDelivery", rate_limiter, circuit_breaker)
+        self._max_retries = max_retries
+        self._max_pending = max_pending
+        self._transport_errors = transport_errors
+        self._pending = deque()
+        self._pending_cv = threading.Condition()
+        self._stop_event = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._flush_pending, name="lark-delivery", daemon=True
+        )
+        self._flusher.start()
+
+    def stats(self) -> Dict[str, int]:
+        return self._policy.stats(len(self._pending))
+
+    def _send_once(self, payload: Dict):
+        """Returns (delivered, response). delivered is None if worth retrying later."""
+        try:
+            response = self._send(payload)
+        except self._transport_errors as e:
+            self._policy.on_transport_error(e)
+            return None, None
+        return self._policy.on_response(response), response
+
+    def _try_send(self, payload: Dict):
+        """
+        Send with retries, waiting for the rate limit and the backoff in between.
+        Returns (delivered, response) as _send_once. Only called by the flusher thread.
+        """
+        response = None
+        for attempt in range(self._max_retries + 1):
+            if self._stop_event.is_set():
+                return None, response
+            wait = self._policy.wait_before_attempt(attempt)
+            if wait is None or (wait > 0 and self._stop_event.wait(wait)):
+                return None, response
+            delivered, response = self._send_once(payload)
+            if delivered is not None:
+                return delivered, response
+            if attempt < self._max_retries:
+                self._stop_event.wait(retry_delay(attempt, response))
+        return None, response
+
+    def _add_pending(self, payload: Dict, ack: Callable, front: bool = False):
+        with self._pending_cv:
+            if front:
+                self._pending.appendleft((payload, ack))
+            else:
+                self._pending.append((payload, ack))
+            dropped = len(self._pending) > self._max_pending
+            if dropped:
+                _, dropped_ack = self._pending.popleft()
+            self._pending_cv.notify()
+        if dropped:
+            self._policy.on_dropped(dropped_ack)
+
+    def deliver(self, payload: Dict, ack: Callable = None) -> int:
+        """
+        Send the payload if lark can take it now, otherwise queue it for the background
+        thread. ack is called once the message is delivered or rejected by lark.
+        Returns the response status code, or None if the message was queued unsent.
+        """
+        if (
+            # closed, the message is resent from the outbox after a restart if any
+            self._stop_event.is_set()
+            # keep the order with messages waiting for lark to recover
+            or len(self._pending) > 0
+            # the background thread probes lark once the circuit may close again
+            or self._policy.circuit_breaker.state != CircuitBreaker.CLOSED
+            or not self._policy.rate_limiter.try_acquire()
+        ):
+            self._add_pending(payload, ack)
+            return None
+        delivered, response = self._send_once(payload)
+        if delivered is None:
+            self._add_pending(payload, ack)
+        elif ack is not None:
+            ack()
+        return None if response is None else response.status_code
+
+    def _flush_one(self, payload: Dict, ack: Callable):
+        delivered, _ = self._try_send(payload)
+        if delivered is None:
+            self._add_pending(payload, ack, front=True)
+            self._stop_event.wait(self._policy.circuit_wait())
+        elif ack is not None:
+            ack()
+
+    def _flush_pending(self):
+        while True:
+            with self._pending_cv:
+                while len(self._pending) == 0 and not self._stop_event.is_set():
+                    self._pending_cv.wait()
+                if self._stop_event.is_set():
+                    return
+                payload, ack = self._pending.popleft()
+            try:
+                self._flush_one(payload, ack)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # e.g. a message that cannot be encoded, which no retry would fix
+                self._policy.on_failed(e)
+
+    def close(self):
+        """Stop the background thread, interrupting its waits."""
+        with self._pending_cv:
+            self._stop_event.set()
+            self._pending_cv.notify()
+        self._flusher.join()
+        if len(self._pending) > 0:
+            sys.stderr.write(
+                f"[LarkDelivery] {len(self._pending)} pending messages not delivered\n"
+            )
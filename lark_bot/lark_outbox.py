@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Durable outbox of lark messages that are not yet delivered."""
+
+import glob
+import json
+import os
+import sys
+import threading
+from typing import Dict, List, Tuple
+
+DEFAULT_SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+DEFAULT_FSYNC_INTERVAL = 0.2  # seconds
+
+
+class LarkOutbox:
+    """
+    Append-only log of messages for at-least-once delivery.
+
+    put() appends the message to the current segment file and ack() appends an ack
+    record once the message is delivered. Writes are flushed to the OS right away and
+    fsynced in batches by a background thread every fsync_interval seconds, so no
+    message pays for a synchronous fsync.
+
+    Segments are rolled over at segment_max_bytes and deleted, oldest first, once all
+    their messages are acked. On startup the unacked messages are collected for replay
+    and rewritten into a fresh segment.
+    """
+
+    def __init__(
+        self,
+        outbox_dir: str,
+        segment_max_bytes: int = DEFAULT_SEGMENT_MAX_BYTES,
+        fsync_interval: float = DEFAULT_FSYNC_INTERVAL,
+    ) -> None:
+        self._outbox_dir = outbox_dir
+        self._segment_max_bytes = segment_max_bytes
+        self._fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._segment_of = {}  # unacked message id -> segment number
+        self._num_unacked = {}  # segment number -> number of unacked messages
+        self._segment = None
+        self._segment_no = 0
+        self._next_id = 0
+        self._dirty = False
+
+        os.makedirs(outbox_dir, exist_ok=True)
+        self._pending = self._recover()
+
+        self._stop_event = threading.Event()
+        self._syncer = threading.Thread(
+            target=self._sync_loop, name="lark-outbox-fsync", daemon=True
+        )
+        self._syncer.start()
+
+    def _segment_path(self, segment_no: int) -> str:
+        return os.path.join(self._outbox_dir, f"outbox-{segment_no:08d}.log")
+
+    def _recover(self) -> List[Tuple[int, Dict]]:
+        segment_paths = sorted(glob.glob(os.path.join(self._outbox_dir, "outbox-*.log")))
+        messages = {}
+        for path in segment_paths:
+            self._segment_no = max(
+                self._segment_no, int(os.path.basename(path)[len("outbox-") : -4])
+            )
+            with open(path, "r", encoding="utf-8") as segment:
+                for line in segment:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # torn write of the last record before a crash
+                        sys.stderr.write(f"[LarkOutbox] Skip corrupted record in {path}\n")
+                        continue
+                    if "ack" in record:
+                        messages.pop(record["ack"], None)
+                    else:
+                        messages[record["id"]] = record["payload"]
+                        self._next_id = max(self._next_id, record["id"] + 1)
+
+        # compact: rewrite the unacked messages to a new segment and drop the old ones
+        self._open_segment(self._segment_no + 1)
+        pending = sorted(messages.items())
+        for message_id, payload in pending:
+            self._append({"id": message_id, "payload": payload})
+            self._segment_of[message_id] = self._segment_no
+            self._num_unacked[self._segment_no] += 1
+        self._sync()
+        for path in segment_paths:
+            os.remove(path)
+        if len(pending) > 0:
+            sys.stderr.write(f"[LarkOutbox] {len(pending)} messages to replay\n")
+        return pending
+
+    def _open_segment(self, segment_no: int):
+        if self._segment is not None:
+            self._segment.flush()
+            os.fsync(self._segment.fileno())
+            self._segment.close()
+        self._segment_no = segment_no
+        self._num_unacked[segment_no] = 0
+        self._segment = open(self._segment_path(segment_no), "a", encoding="utf-8")
+
+    def _append(self, record: Dict):
+        self._segment.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._segment.flush()
+        self._dirty = True
+
+    def pending(self) -> List[Tuple[int, Dict]]:
+        """Messages left unacked by the previous run, as (message id, payload)."""
+        return self._pending
+
+    def put(self, payload: Dict) -> int:
+        """Append a message and return its id."""
+        with self._lock:
+            if self._segment.tell() >= self._segment_max_bytes:
+                self._open_segment(self._segment_no + 1)
+            message_id = self._next_id
+            self._next_id += 1
+            self._append({"id": message_id, "payload": payload})
+            self._segment_of[message_id] = self._segment_no
+            self._num_unacked[self._segment_no] += 1
+        return message_id
+
+    def ack(self, message_id: int):
+        with self._lock:
+            segment_no = self._segment_of.pop(message_id, None)
+            if segment_no is None:
+                return
+            self._num_unacked[segment_no] -= 1
+            self._append({"ack": message_id})
+            self._compact()
+
+    def _compact(self):
+        # delete oldest first, so that an ack is never removed before the message it acks
+        for segment_no in sorted(self._num_unacked):
+            if segment_no == self._segment_no or self._num_unacked[segment_no] > 0:
+                break
+            os.remove(self._segment_path(segment_no))
+            del self._num_unacked[segment_no]
+
+    def _sync(self):
+        self._dirty = False
+        os.fsync(self._segment.fileno())
+
+    def _sync_loop(self):
+        while not self._stop_event.wait(self._fsync_interval):
+            with self._lock:
+                if not self._dirty:
+                    continue
+                self._dirty = False
+                # fsync a duplicate of the fd outside the lock, in case of rollover
+                fd = os.dup(self._segment.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def close(self):
+        self._stop_event.set()
+        self._syncer.join()
+        with self._lock:
+            self._sync()
+            self._segment.close()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local stand-in of a lark custom bot webhook, for offline load and latency tests."""
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+import json
+import random
+import threading
+import time
+
+from lark_bot.lark_delivery import LARK_RATE_PER_MINUTE, LARK_RATE_PER_SECOND
+
+# lark error codes, in a 200 response
+CODE_PARAMS_INVALID = 19002
+CODE_KEYWORD_MISMATCH = 19024
+CODE_FREQUENCY_LIMITED = 11232
+
+TEMPLATE_VARIABLES = [
+    "notification_title",
+    "mentions",
+    "link_title",
+    "link_url",
+    "message",
+]
+# keyword the bot is set up with, see lark_bot_client.build_card
+KEYWORD = "GitHub"
+DEFAULT_MAX_MESSAGES = 10000
+
+
+def validate_card(message: object) -> Optional[str]:
+    """Why the message is not a card LarkBotClient sends, None if it is."""
+    if not isinstance(message, dict) or message.get("msg_type") != "interactive":
+        return "msg_type is not interactive"
+    card = message.get("card")
+    if not isinstance(card, dict) or card.get("type") != "template":
+        return "card is not a template card"
+    data = card.get("data")
+    if not isinstance(data, dict) or not isinstance(data.get("template_id"), str):
+        return "card has no template_id"
+    variables = data.get("template_variable")
+    if not isinstance(variables, dict):
+        return "card has no template_variable"
+    for name in TEMPLATE_VARIABLES:
+        if not isinstance(variables.get(name), str):
+            return f"template variable {name} is not a string"
+    return None
+
+
+class MockLarkRequestHandler(BaseHTTPRequestHandler):
+    """Answers posts like a lark bot webhook, with the faults set on the server."""
+
+    protocol_version = "HTTP/1.1"
+    # answer the headers and body without waiting for the client to ack the headers
+    disable_nagle_algorithm = True
+    server: "MockLarkServer"
+
+    def _send_json(self, status: int, body: object, headers: Dict[str, str] = None):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):  # pylint: disable=invalid-name, BaseHTTPRequestHandler interface
+        if self.path == "/messages":
+            self._send_json(200, self.server.messages())
+        elif self.path == "/stats":
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_DELETE(self):  # pylint: disable=invalid-name, BaseHTTPRequestHandler interface
+        if self.path == "/messages":
+            self.server.reset()
+            self._send_json(200, {})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):  # pylint: disable=invalid-name, BaseHTTPRequestHandler interface
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        outcome = self.server.draw_outcome()
+        if outcome == "drop":
+            # close the connection without a response, like a reset by a proxy
+            self.close_connection = True
+            self.server.count(outcome)
+            return
+        time.sleep(self.server.draw_latency())
+        if outcome == "server_error":
+            self.server.count(outcome)
+            self._send_json(503, {"error": "mock server error"})
+            return
+        if outcome == "too_many_requests":
+            self.server.count(outcome)
+            self._send_json(429, {"error": "too many requests"}, {"Retry-After": "1"})
+            return
+        if outcome == "frequency_limited" or not self.server.allow_request():
+            self.server.count("frequency_limited")
+            self._send_json(
+                200, {"code": CODE_FREQUENCY_LIMITED, "msg": "frequency limited"}
+            )
+            return
+
+        try:
+            message = json.loads(body)
+            error = validate_card(message)
+        except ValueError as e:
+            message, error = None, f"invalid json: {e}"
+        if error is not None:
+            self.server.count("invalid")
+            self._send_json(200, {"code": CODE_PARAMS_INVALID, "msg": error})
+            return
+        variables = message["card"]["data"]["template_variable"]
+        if KEYWORD not in variables["notification_title"]:
+            self.server.count("invalid")
+            self._send_json(
+                200, {"code": CODE_KEYWORD_MISMATCH, "msg": "Key Words Not Found"}
+            )
+            return
+        self.server.record(message)
+        self._send_json(200, {"code": 0, "msg": "success", "data": {}})
+
+    def log_message(self, *_):
+        pass
+
+
+class MockLarkServer(ThreadingHTTPServer):
+    """
+    Lark bot webhook stand-in that validates and records the cards posted to it.
+
+    Each post is answered after latency seconds (plus up to jitter seconds) and fails
+    with the given probabilities: dropped connection, 503, 429 with Retry-After, or a
+    frequency limited lark error. With rate_limit, posts beyond the lark custom bot
+    limits (per second and per minute) are answered as frequency limited, as lark does.
+
+    The last max_messages accepted cards are kept. GET /messages returns them, DELETE
+    /messages clears them, GET /stats returns the counts of each outcome.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        server_address,
+        latency: float = 0,
+        jitter: float = 0,
+        drop_rate: float = 0,
+        server_error_rate: float = 0,
+        too_many_requests_rate: float = 0,
+        frequency_limited_rate: float = 0,
+        rate_limit: bool = False,
+        max_messages: int = DEFAULT_MAX_MESSAGES,
+        record_file: str = None,
+    ) -> None:
+        """record_file: file to append the recorded cards to, as json lines"""
+        super().__init__(server_address, MockLarkRequestHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self._faults = [
+            ("drop", drop_rate),
+            ("server_error", server_error_rate),
+            ("too_many_requests", too_many_requests_rate),
+            ("frequency_limited", frequency_limited_rate),
+        ]
+        self._rate_limit = rate_limit
+        self._accepted_times = deque()  # monotonic times of the posts in the last minute
+        self._lock = threading.Lock()
+        self._messages = deque(maxlen=max_messages)
+        self._counters: Dict[str, int] = {}
+        self._record = None
+        if record_file is not None:
+            self._record = open(record_file, "a", encoding="utf-8")
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/hook"
+
+    def draw_outcome(self) -> str:
+        """The fault to simulate for a post, "ok" if none."""
+        draw = random.random()
+        for outcome, rate in self._faults:
+            if draw < rate:
+                return outcome
+            draw -= rate
+        return "ok"
+
+    def draw_latency(self) -> float:
+        return self.latency + random.uniform(0, self.jitter)
+
+    def allow_request(self) -> bool:
+        """Whether the post is within the rate limits. Rejected posts are not counted."""
+        if not self._rate_limit:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            while self._accepted_times and now - self._accepted_times[0] >= 60:
+                self._accepted_times.popleft()
+            last_second = sum(1 for t in reversed(self._accepted_times) if now - t < 1)
+            if (
+                len(self._accepted_times) >= LARK_RATE_PER_MINUTE
+                or last_second >= LARK_RATE_PER_SECOND
+            ):
+                return False
+            self._accepted_times.append(now)
+            return True
+
+    def count(self, outcome: str):
+        with self._lock:
+            self._counters[outcome] = self._counters.get(outcome, 0) + 1
+
+    def record(self, message: Dict):
+        with self._lock:
+            self._counters["ok"] = self._counters.get("ok", 0) + 1
+            self._messages.append(message)
+            if self._record is not None:
+                self._record.write(json.dumps(message) + "\n")
+                self._record.flush()
+
+    def messages(self) -> List[Dict]:
+        with self._lock:
+            return list(self._messages)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        with self._lock:
+            self._messages.clear()
+            self._counters.clear()
+
+    def serve_in_background(self) -> threading.Thread:
+        thread = threading.Thread(
+            target=self.serve_forever, name="mock-lark-server", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def server_close(self):
+        super().server_close()
+        if self._record is not None:
+            self._record.close()
+
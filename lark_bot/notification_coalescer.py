@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Merge related notifications into one lark card."""
+
+import sys
+import threading
+import time
+from typing import Callable, Dict, Hashable, List
+
+from lark_bot.lark_bot_client import Notification
+
+DEFAULT_MAX_NOTIFICATIONS = 10
+MAX_DELAY_WINDOWS = 5  # by default, a busy buffer is flushed after at most this many windows
+
+
+class _Buffer:
+    """Notifications about one subject waiting to be merged."""
+
+    __slots__ = ("notifications", "user_ids", "first_time", "last_time", "window")
+
+    def __init__(self, now: float, window: float) -> None:
+        self.notifications = []
+        self.user_ids = {}  # ordered set
+        self.first_time = now
+        self.last_time = now
+        self.window = window
+
+
+def merge_notifications(notifications: List[Notification]) -> Notification:
+    if len(notifications) == 1:
+        return notifications[0]
+    first = notifications[0]
+    return Notification(
+        first.event_name,
+        f"{first.title} (+{len(notifications) - 1} updates)",
+        first.link_title,
+        first.link_url,
+        "\n\n".join(notification.message for notification in notifications),
+    )
+
+
+def digest_notifications(notifications: List[Notification]) -> Notification:
+    if len(notifications) == 1:
+        return notifications[0]
+    first = notifications[0]
+    lines = []
+    for notification in notifications:
+        summary = notification.message.split("\n", 1)[0]
+        lines.append(
+            f"- [{notification.link_title}]({notification.link_url}) "
+            f"**{notification.title}**: {summary}"
+        )
+    return Notification(
+        "digest",
+        f"Digest of {len(notifications)} notifications",
+        first.link_title,
+        first.link_url,
+        "\n".join(lines),
+    )
+
+
+class NotificationCoalescer:
+    """
+    Buffer notifications per subject (repository and issue/PR number) and post them
+    as one card once no related notification arrives for `window` seconds.
+
+    A buffer is also flushed when it holds max_notifications, or when it has been
+    open for max_delay_windows windows, so a busy issue still gets timely updates.
+    The merged card mentions every recipient of the merged notifications.
+
+    With max_delay_windows=1 and a per-recipient key, this posts a digest every window.
+    """
+
+    def __init__(
+        self,
+        post_notification: Callable[[Notification, List[str]], object],
+        window: float,
+        max_notifications: int = DEFAULT_MAX_NOTIFICATIONS,
+        max_delay_windows: int = MAX_DELAY_WINDOWS,
+        merge: Callable[[List[Notification]], Notification] = merge_notifications,
+    ) -> None:
+        self._post_notification = post_notification
+        self._window = window
+        self._max_delay_windows = max_delay_windows
+        self._max_notifications = max_notifications
+        self._merge = merge
+        self._buffers: Dict[Hashable, _Buffer] = {}
+        self._cv = threading.Condition()
+        self._closed = False
+        self._flusher = threading.Thread(
+            target=self._flush_loop, name="notification-coalescer", daemon=True
+        )
+        self._flusher.start()
+
+    def add(
+        self,
+        key: Hashable,
+        notification: Notification,
+        user_ids: List[str],
+        window: float = None,
+    ):
+        """window overrides the default window if the key has no buffered notification."""
+        now = time.monotonic()
+        with self._cv:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = self._buffers[key] = _Buffer(now, window or self._window)
+                self._cv.notify()
+            buffer.notifications.append(notification)
+            buffer.user_ids.update(dict.fromkeys(user_ids))
+            buffer.last_time = now
+            if len(buffer.notifications) < self._max_notifications:
+                return
+            del self._buffers[key]
+        self._post(buffer)
+
+    def _post(self, buffer: _Buffer):
+        try:
+            self._post_notification(
+                self._merge(buffer.notifications), list(buffer.user_ids)
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # keep the flusher thread alive for the other buffers
+            sys.stderr.write(f"[NotificationCoalescer] Failed to post: {e!r}\n")
+
+    def _deadline(self, buffer: _Buffer) -> float:
+        return min(
+            buffer.last_time + buffer.window,
+            buffer.first_time + buffer.window * self._max_delay_windows,
+        )
+
+    def _flush_loop(self):
+        while True:
+            with self._cv:
+                if self._closed:
+                    return
+                now = time.monotonic()
+                due = [
+                    key
+                    for key, buffer in self._buffers.items()
+                    if self._deadline(buffer) <= now
+                ]
+                to_post = [self._buffers.pop(key) for key in due]
+                if len(to_post) == 0:
+                    timeout = None
+                    if len(self._buffers) > 0:
+                        timeout = min(map(self._deadline, self._buffers.values())) - now
+                    self._cv.wait(timeout)
+                    continue
+            for buffer in to_post:
+                self._post(buffer)
+
+    def close(self):
+        """Post all buffered notifications."""
+        with self._cv:
+            self._closed = True
+            to_post = list(self._buffers.values())
+            self._buffers.clear()
+            self._cv.notify()
+        self._flusher.join()
+        for buffer in to_post:
+            self._post(buffer)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Decode webhook payloads into the fields that the event classes read."""
+
+import json
+from typing import Any, Dict, List, Optional, TypedDict
+
+from lark_bot import events
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(body: bytes) -> object:
+    """Decode the whole payload, with orjson if installed."""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def _schema(name: str, fields: Optional[Dict], optional: bool = True):
+    """TypedDict type of BaseGithubEvent.payload_fields, unknown fields are skipped."""
+    if fields is None:
+        return Any
+    if isinstance(fields, list):
+        return Optional[List[_schema(name, fields[0], optional=False)]]
+    schema = TypedDict(
+        name,
+        {key: _schema(f"{name}_{key}", value) for key, value in fields.items()},
+        total=False,
+    )
+    return Optional[schema] if optional else schema
+
+
+class PayloadDecoder:
+    """
+    Decode a payload into dicts of only the payload_fields of its event class, which
+    saves building python objects for the rest of the payload (repositories, users,
+    etc.). Needs msgspec (pip install msgspec), otherwise or with partial=False, and
+    for events without payload_fields, the whole payload is decoded.
+    """
+
+    def __init__(self, partial: bool = True) -> None:
+        self.partial = partial and msgspec is not None
+        self._decoders = {}  # event name -> msgspec decoder, None to decode all
+
+    def _decoder(self, event_name: str):
+        if event_name not in self._decoders:
+            event_class = events.get_event_class(event_name)
+            fields = None if event_class is None else event_class.payload_fields
+            self._decoders[event_name] = (
+                None
+                if fields is None
+                else msgspec.json.Decoder(
+                    _schema(event_class.__name__ + "Payload", fields, optional=False)
+                )
+            )
+        return self._decoders[event_name]
+
+    def decode(self, event_name: str, body: bytes) -> object:
+        """Raises ValueError if the body is not valid json."""
+        decoder = self._decoder(event_name) if self.partial else None
+        if decoder is not None:
+            try:
+                return decoder.decode(body)
+            except msgspec.ValidationError:
+                pass  # a field of an unexpected type, decode the payload as is
+        return loads(body)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Index of IP subnets for fast membership checks."""
+
+import ipaddress
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Iterable, List, Tuple
+
+DEFAULT_CACHE_SIZE = 1024
+
+
+def _merge_ranges(ranges: List[Tuple[int, int]]) -> Tuple[List[int], List[int]]:
+    """Merge overlapping/adjacent [start, end] ranges into sorted start and end lists."""
+    starts, ends = [], []
+    for start, end in sorted(ranges):
+        if ends and start <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+class SubnetIndex:
+    """
+    Subnets parsed once into sorted integer ranges per IP version.
+    A lookup is a binary search, and the results for recently checked IPs are cached.
+    The index is immutable after construction, so it can be shared across threads.
+    """
+
+    def __init__(
+        self, subnets: Iterable[str], cache_size: int = DEFAULT_CACHE_SIZE
+    ) -> None:
+        ranges = {4: [], 6: []}
+        for subnet in subnets:
+            network = ipaddress.ip_network(subnet, strict=False)
+            ranges[network.version].append(
+                (int(network.network_address), int(network.broadcast_address))
+            )
+        self._tables = {version: _merge_ranges(r) for version, r in ranges.items()}
+        self._num_subnets = sum(len(r) for r in ranges.values())
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._num_subnets
+
+    def _lookup(self, ip_str: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(ip_str)
+        except ValueError:
+            return False
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        starts, ends = self._tables[ip.version]
+        value = int(ip)
+        i = bisect_right(starts, value) - 1
+        return i >= 0 and value <= ends[i]
+
+    def __contains__(self, ip_str: str) -> bool:
+        with self._cache_lock:
+            result = self._cache.get(ip_str)
+            if result is not None:
+                self._cache.move_to_end(ip_str)
+                return result
+        result = self._lookup(ip_str)
+        with self._cache_lock:
+            self._cache[ip_str] = result
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return result
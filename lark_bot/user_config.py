@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Per-user notification config"""
+
+import json
+from dataclasses import dataclass, field, fields, replace
+from typing import Dict, FrozenSet, Iterator, Tuple
+
+from lark_bot.events import InvolveReason
+
+# conclusions of a github workflow run
+WORKFLOW_RUN_CONCLUSIONS = (
+    "action_required",
+    "cancelled",
+    "failure",
+    "neutral",
+    "skipped",
+    "stale",
+    "startup_failure",
+    "success",
+    "timed_out",
+)
+
+
+def _key(json_key: str, reason: bool = False):
+    return {"json_key": json_key, "reason": reason}
+
+
+@dataclass(frozen=True, slots=True)
+class UserConfig:
+    """
+    Immutable user config. Keys missing in the user's json config file take the
+    defaults below. Instances are hashable and safe to share across threads.
+    """
+
+    # PR reviewed by bots
+    bot_pr_review: bool = field(default=False, metadata=_key("bot_pr_review"))
+    # PR reviewed by others
+    pr_review: bool = field(default=True, metadata=_key("pr_review"))
+    # workflow run completed with these conclusions for PR
+    workflow_run_complete: FrozenSet[str] = field(
+        default=frozenset({"failure"}),
+        metadata=_key(InvolveReason.WORKFLOW_RUN_COMPLETE, reason=True),
+    )
+    # assigned to issue
+    assignee: bool = field(
+        default=True, metadata=_key(InvolveReason.ASSIGNEE, reason=True)
+    )
+    # @ed in issue body
+    ated_in_issue: bool = field(
+        default=True, metadata=_key(InvolveReason.ATED_IN_ISSUE, reason=True)
+    )
+    # @ed in issue comment
+    ated_in_comment: bool = field(
+        default=True, metadata=_key(InvolveReason.ATED_IN_COMMENT, reason=True)
+    )
+    # requested to review PR
+    reviewer: bool = field(
+        default=True, metadata=_key(InvolveReason.REVIEWER, reason=True)
+    )
+    # seconds to batch notifications into one digest, 0 to disable
+    digest_interval: float = field(default=0, metadata=_key("digest_interval"))
+    # reasons to notify right away in digest mode
+    digest_bypass: FrozenSet[str] = field(
+        default=frozenset({f"{InvolveReason.WORKFLOW_RUN_COMPLETE}.failure"}),
+        metadata=_key("digest_bypass"),
+    )
+
+    def reason_settings(self) -> Iterator[Tuple[str, object]]:
+        """(reason, setting) of the configs that enable notification reasons."""
+        for f in fields(self):
+            if f.metadata["reason"]:
+                yield f.metadata["json_key"], getattr(self, f.name)
+
+    @classmethod
+    def from_json(cls, config_json: Dict, source: str = "config") -> "UserConfig":
+        """
+        Layer config_json over the defaults. Unknown keys and values of the wrong type
+        are reported and ignored.
+        """
+        if not isinstance(config_json, dict):
+            print(f"WARNING: {source} is not a json object. Using default config")
+            return DEFAULT_CONFIG
+        overrides = {}
+        for f in fields(cls):
+            json_key = f.metadata["json_key"]
+            if json_key not in config_json:
+                continue
+            value = config_json[json_key]
+            default = f.default
+            if isinstance(default, bool):
+                valid = isinstance(value, bool)
+            elif isinstance(default, frozenset):
+                if isinstance(value, str) and f.metadata["reason"]:
+                    # e.g. "failure": the conclusions in the string, as matched before
+                    # configs were compiled
+                    value = [c for c in WORKFLOW_RUN_CONCLUSIONS if c in value]
+                valid = isinstance(value, list) and all(isinstance(v, str) for v in value)
+                value = frozenset(value) if valid else value
+            else:
+                valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+                valid = valid and value >= 0
+            if valid:
+                overrides[f.name] = value
+            else:
+                print(f"WARNING: invalid value of {json_key} in {source}: {value!r}")
+
+        unknown_keys = set(config_json) - set(_JSON_KEYS)
+        if len(unknown_keys) > 0:
+            print(f"WARNING: unknown keys in {source}: {sorted(unknown_keys)}")
+        if len(overrides) == 0:
+            return DEFAULT_CONFIG
+        return replace(DEFAULT_CONFIG, **overrides)
+
+    @classmethod
+    def load(cls, config_path: str) -> "UserConfig":
+        try:
+            with open(config_path, "r", encoding="utf-8") as config_f:
+                return cls.from_json(json.load(config_f), config_path)
+        except FileNotFoundError as e:
+            print(f"WARNING: {e}. Using default config")
+        except json.JSONDecodeError as e:
+            print(f"WARNING reading {config_path}: {e}. Using default config")
+        return DEFAULT_CONFIG
+
+
+DEFAULT_CONFIG = UserConfig()
+_JSON_KEYS = [f.metadata["json_key"] for f in fields(UserConfig)]
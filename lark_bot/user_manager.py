@@ -18,88 +18,334 @@
 
 
 from lark_bot.events import BaseGithubEvent, InvolveReason
-from typing import List
-import json
+from lark_bot.user_config import UserConfig, DEFAULT_CONFIG
+from lark_bot.user_store import UserEntry, UserStore, open_user_store
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Collection, Dict, FrozenSet, List, Optional, Tuple, Union
+import os
+import threading
 
 
-BOTS = ["coderabbitai[bot]", "coderabbitai"]
+DEFAULT_RELOAD_INTERVAL = 5  # seconds
+PARALLEL_LOAD_THRESHOLD = 16  # config files to load before using a thread pool
+MAX_LOAD_THREADS = 8
+MAX_UNKNOWN_LOGINS = 10000  # unknown logins remembered to report each only once
 
-DEFAULT_CONFIG = {
-    "bot_pr_review": False,  # PR reviewed by bots
-    "pr_review": True,  # PR reviewed by others
-    InvolveReason.WORKFLOW_RUN_COMPLETE: {
-        "failure"
-    },  # workflow run completed with failure for PR
-    InvolveReason.ASSIGNEE: True,  # assigned to issue
-    InvolveReason.ATED_IN_ISSUE: True,  # @ed in issue body
-    InvolveReason.ATED_IN_COMMENT: True,  # @ed in issue comment
-    InvolveReason.REVIEWER: True,  # requested to review PR
-}
+BOTS = frozenset(["coderabbitai[bot]", "coderabbitai"])
+
+# pseudo reason: creator of a PR reviewed by someone else
+PR_REVIEWED = "pull_request_review.creator"
+
+
+def expand_reasons(reasons: List[InvolveReason], event_name: str) -> FrozenSet[str]:
+    """Reasons of an event as keys to look up in NotifyRule."""
+    if event_name == "pull_request_review" and InvolveReason.CREATOR in reasons:
+        return frozenset(reasons) | {PR_REVIEWED}
+    return frozenset(reasons)
+
+
+class NotifyRule:
+    """
+    A user config compiled into sets of reason keys for which the user is notified,
+    so that the decision for an event is a set intersection.
+    Rules are cached per config, so users with the same config share one rule.
+    """
+
+    __slots__ = (
+        "human_sender_reasons",
+        "bot_sender_reasons",
+        "digest_interval",
+        "digest_bypass",
+    )
+
+    def __init__(self, config: UserConfig) -> None:
+        enabled = set()
+        for reason, setting in config.reason_settings():
+            if setting is True:
+                enabled.add(reason)
+            elif isinstance(setting, frozenset):
+                # e.g. workflow_run_complete: ["failure"] -> workflow_run_complete.failure
+                enabled.update(f"{reason}.{detail}" for detail in setting)
+
+        self.human_sender_reasons = frozenset(
+            enabled | {PR_REVIEWED} if config.pr_review else enabled
+        )
+        # events sent by bots are only notified if bot_pr_review is enabled
+        self.bot_sender_reasons = frozenset(
+            enabled | {PR_REVIEWED} if config.bot_pr_review else ()
+        )
+        self.digest_interval = config.digest_interval
+        self.digest_bypass = config.digest_bypass
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def of(cls, config: UserConfig) -> "NotifyRule":
+        return cls(config)
+
+    def notify(self, reason_keys: FrozenSet[str], sender_is_bot: bool) -> bool:
+        enabled = self.bot_sender_reasons if sender_is_bot else self.human_sender_reasons
+        return not enabled.isdisjoint(reason_keys)
+
+    def digest_interval_for(self, reason_keys: FrozenSet[str]) -> float:
+        """Seconds to hold a notification for the digest, 0 to notify right away."""
+        if self.digest_interval <= 0 or not self.digest_bypass.isdisjoint(reason_keys):
+            return 0
+        return self.digest_interval
 
 
 class User:
     """User representing github user and lark user."""
 
-    def __init__(self, github_login_name: str, user_id: str, config_path: str = None):
+    __slots__ = (
+        "github_login_name",
+        "user_id",
+        "config_path",
+        "config",
+        "rule",
+        "github_id",
+        "email",
+    )
+
+    def __init__(
+        self,
+        github_login_name: str,
+        user_id: str,
+        config_path: str = None,
+        config: UserConfig = None,
+        github_id: int = None,
+        email: str = None,
+    ):
+        """config: config loaded from config_path, loaded here if None"""
         self.github_login_name = github_login_name
         self.user_id = user_id
-        self._config_path = config_path
-        self.config = DEFAULT_CONFIG
-        try:
-            if config_path is not None:
-                with open(self._config_path, "r", encoding="utf-8") as config_f:
-                    config_json = json.load(config_f)
-                    for k, v in config_json.items():
-                        if k in DEFAULT_CONFIG:
-                            self.config.update({k: v})
-        except FileNotFoundError as e:
-            print(f"WARNING: {e}. Using default config")
-            self.config = DEFAULT_CONFIG
-        except json.JSONDecodeError as e:
-            print(f"WARNING reading {config_path}: {e}. Using default config")
-            self.config = DEFAULT_CONFIG
+        self.config_path = config_path
+        if config is None:
+            config = DEFAULT_CONFIG if config_path is None else UserConfig.load(config_path)
+        self.config = config
+        self.rule = NotifyRule.of(config)
+        self.github_id = github_id
+        self.email = email
 
-    def notify(self, reasons: List[InvolveReason], event: BaseGithubEvent):
-        to_notify = False
-        if event.get_sender() in BOTS and self.config["bot_pr_review"] is not True:
-            return None
+    def entry(self) -> UserEntry:
+        return UserEntry(
+            self.github_login_name,
+            self.user_id,
+            self.config_path,
+            self.github_id,
+            self.email,
+        )
 
-        for reason in reasons:
-            if reason in self.config and self.config[reason] is True:
-                to_notify = True
-                break
-            if len(reason.rsplit(".", 1)) == 2:
-                reason_main, detail = reason.rsplit(".", 1)
-                if reason_main in self.config and detail in self.config[reason_main]:
-                    to_notify = True
-                    break
-        if not to_notify and InvolveReason.CREATOR in reasons:
-            if event.event_name == "pull_request_review":
-                if event.get_sender() in BOTS:
-                    if self.config["bot_pr_review"]:
-                        to_notify = True
-                elif self.config["pr_review"]:
-                    to_notify = True
-
-        if to_notify:
+    def notify(self, reasons: List[InvolveReason], event: BaseGithubEvent):
+        if self.rule.notify(
+            expand_reasons(reasons, event.event_name), event.get_sender() in BOTS
+        ):
             return self.user_id
         return None
 
 
+class UserDirectory:
+    """
+    Users indexed by github login, github user id and email. Logins and emails are
+    matched case-insensitively, as github does. Unknown logins are remembered, so
+    that they are reported once instead of on every event.
+    """
+
+    def __init__(self, users: List[User]) -> None:
+        self.by_login: Dict[str, User] = {}
+        self.by_github_id: Dict[int, User] = {}
+        self.by_email: Dict[str, User] = {}
+        for user in users:
+            self.by_login[user.github_login_name.lower()] = user
+            if user.github_id is not None:
+                self.by_github_id[int(user.github_id)] = user
+            if user.email:
+                self.by_email[user.email.lower()] = user
+        self._unknown_logins = set()
+
+    @classmethod
+    def validate(cls, entry: UserEntry) -> UserEntry:
+        """
+        The entry with its github id as an int. Raises ValueError if a field cannot be
+        indexed, e.g. a github id that is not a number.
+        """
+        if not isinstance(entry.github_login_name, str) or not entry.github_login_name:
+            raise ValueError(f"invalid github login {entry.github_login_name!r}")
+        if entry.email is not None and not isinstance(entry.email, str):
+            raise ValueError(f"invalid email of {entry.github_login_name}: {entry.email!r}")
+        if entry.github_id is None:
+            return entry
+        try:
+            if isinstance(entry.github_id, bool):
+                raise ValueError()
+            return entry._replace(github_id=int(entry.github_id))
+        except (TypeError, ValueError):
+            raise ValueError(
+                f"invalid github_id of {entry.github_login_name}: {entry.github_id!r}"
+            ) from None
+
+    def __len__(self) -> int:
+        return len(self.by_login)
+
+    def find(self, github_login_name: str) -> Optional[User]:
+        return self.by_login.get(github_login_name.lower())
+
+    def is_new_unknown(self, github_login_name: str) -> bool:
+        """Whether the unknown login is seen for the first time since the load."""
+        key = github_login_name.lower()
+        if key in self._unknown_logins:
+            return False
+        if len(self._unknown_logins) < MAX_UNKNOWN_LOGINS:
+            self._unknown_logins.add(key)
+        return True
+
+
 class UserManager:
-    """Manage user configs and notify users."""
+    """
+    Manage user configs and notify users.
+
+    Users are read from a UserStore, see open_user_store for the supported formats.
+    With reload_interval > 0, a background thread polls the modification time of the
+    store and the per-user config files, and reloads the users when one changes.
+    Only users whose entry or config file changed are rebuilt. The new UserDirectory
+    is swapped in as a whole, so a request sees either the old or the new users.
+    """
 
-    def __init__(self, user_config_path: str) -> None:
-        self._user_config_path = user_config_path
+    def __init__(
+        self,
+        user_config_path: Union[str, UserStore],
+        reload_interval: float = DEFAULT_RELOAD_INTERVAL,
+    ) -> None:
+        if isinstance(user_config_path, UserStore):
+            self._store = user_config_path
+        else:
+            self._store = open_user_store(user_config_path)
+        self._user_config_path = self._store.path
+        self._directory = UserDirectory([])
+        self._file_mtimes = {}  # store and config file path -> mtime when loaded
         self._read_users_from_file()
 
+        self._stop_event = threading.Event()
+        self._reloader = None
+        if reload_interval > 0:
+            self._reloader = threading.Thread(
+                target=self._reload_loop,
+                args=(reload_interval,),
+                name="user-reloader",
+                daemon=True,
+            )
+            self._reloader.start()
+
+    @classmethod
+    def _mtime(cls, path: str) -> Optional[float]:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
     def _read_users_from_file(self):
-        self._user_map = {}
-        with open(self._user_config_path, "r", encoding="utf-8") as user_file:
-            for line in user_file:
-                line = line.strip()
-                splits = line.split(" ", 3)
-                self._user_map.update({splits[0]: User(*splits)})
+        old_users = self._directory.by_login
+        old_file_mtimes = self._file_mtimes
+        file_mtimes = {path: self._mtime(path) for path in self._store.watched_paths()}
+        entries = {}
+        for entry in self._store.load():
+            try:
+                entry = UserDirectory.validate(entry)
+            except ValueError as e:
+                # skipped, as an invalid line of the store or value of a UserConfig
+                print(f"WARNING: skip user in {self._user_config_path}: {e}")
+                continue
+            # later entries of the same login win
+            entries[entry.github_login_name.lower()] = entry
+            if entry.config_path is not None:
+                file_mtimes[entry.config_path] = self._mtime(entry.config_path)
+
+        # users whose entry and config file are unchanged are reused as is
+        users = {}
+        for key, entry in entries.items():
+            user = old_users.get(key)
+            if (
+                user is not None
+                and user.entry() == entry
+                and file_mtimes.get(entry.config_path)
+                == old_file_mtimes.get(entry.config_path)
+            ):
+                users[key] = user
+
+        # each changed config file is loaded once, even if shared by several users
+        configs = self._load_configs(
+            {
+                entry.config_path
+                for key, entry in entries.items()
+                if key not in users and entry.config_path is not None
+            }
+        )
+        for key, entry in entries.items():
+            if key not in users:
+                users[key] = User(
+                    entry.github_login_name,
+                    entry.user_id,
+                    entry.config_path,
+                    DEFAULT_CONFIG
+                    if entry.config_path is None
+                    else configs[entry.config_path],
+                    entry.github_id,
+                    entry.email,
+                )
+        self._directory = UserDirectory(list(users.values()))
+        self._file_mtimes = file_mtimes
+
+    @classmethod
+    def _load_configs(cls, config_paths) -> Dict[str, UserConfig]:
+        if len(config_paths) <= PARALLEL_LOAD_THRESHOLD:
+            return {path: UserConfig.load(path) for path in config_paths}
+        with ThreadPoolExecutor(
+            max_workers=MAX_LOAD_THREADS, thread_name_prefix="user-config"
+        ) as executor:
+            return dict(
+                zip(config_paths, executor.map(UserConfig.load, config_paths))
+            )
+
+    def _files_changed(self) -> bool:
+        return any(
+            self._mtime(path) != mtime for path, mtime in self._file_mtimes.items()
+        )
+
+    def _reload_loop(self, reload_interval: float):
+        while not self._stop_event.wait(reload_interval):
+            if not self._files_changed():
+                continue
+            try:
+                self._read_users_from_file()
+                print(f"Reloaded {len(self._directory)} users from {self._user_config_path}")
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"WARNING: failed to reload {self._user_config_path}: {e}")
+
+    def close(self):
+        self._stop_event.set()
+        if self._reloader is not None:
+            self._reloader.join()
+
+    def known_logins(self) -> Collection[str]:
+        """Lowercased github logins of the current users."""
+        return self._directory.by_login.keys()
+
+    def get_user(
+        self,
+        github_login_name: str = None,
+        github_id: int = None,
+        email: str = None,
+    ) -> Optional[User]:
+        """Look up a user by any of the given keys, in the order of the arguments."""
+        directory = self._directory
+        user = None
+        if github_login_name is not None:
+            user = directory.find(github_login_name)
+        if user is None and github_id is not None:
+            user = directory.by_github_id.get(int(github_id))
+        if user is None and email is not None:
+            user = directory.by_email.get(email.lower())
+        return user
 
     def notify_user(
         self,
@@ -107,8 +353,41 @@ class UserManager:
         reasons: List[InvolveReason],
         event: BaseGithubEvent,
     ) -> str:
-        if github_login_name in self._user_map:
-            return self._user_map[github_login_name].notify(reasons, event)
+        user = self._directory.find(github_login_name)
+        if user is not None:
+            return user.notify(reasons, event)
         raise RuntimeError(
             f"GitHub user {github_login_name} is not in the config path {self._user_config_path}"
         )
+
+    def notify_users(
+        self,
+        involved_users: Dict[str, List[InvolveReason]],
+        event: BaseGithubEvent,
+    ) -> List[Tuple[str, float]]:
+        """
+        Decide the notification of all involved users of an event in one pass.
+        Returns (lark user id, digest interval) of each user to notify, see
+        NotifyRule.digest_interval_for. Bots and unknown users are skipped, an unknown
+        user is reported once per load of the users.
+        """
+        sender_is_bot = event.get_sender() in BOTS
+        directory = self._directory
+        to_notify = []
+        for github_login_name, reasons in involved_users.items():
+            if github_login_name in BOTS:
+                continue
+            user = directory.find(github_login_name)
+            if user is None:
+                if directory.is_new_unknown(github_login_name):
+                    print(
+                        f"GitHub user {github_login_name} is not in the config path "
+                        f"{self._user_config_path}"
+                    )
+                continue
+            reason_keys = expand_reasons(reasons, event.event_name)
+            if user.rule.notify(reason_keys, sender_is_bot):
+                to_notify.append(
+                    (user.user_id, user.rule.digest_interval_for(reason_keys))
+                )
+        return to_notify
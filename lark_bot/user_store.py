@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sources of the github user to lark user mapping."""
+
+from typing import List, NamedTuple, Optional
+import json
+import os
+import sqlite3
+
+
+class UserEntry(NamedTuple):
+    """One github user to lark user mapping, as stored in a UserStore."""
+
+    github_login_name: str
+    user_id: str  # lark user id
+    config_path: Optional[str] = None
+    github_id: Optional[int] = None
+    email: Optional[str] = None
+
+
+class UserStore:
+    """Interface of a source of user entries."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self) -> List[UserEntry]:
+        """Interface to read all user entries. Later entries of the same github user win."""
+        pass
+
+    def watched_paths(self) -> List[str]:
+        """Files whose modification means the entries need to be reloaded."""
+        return [self.path]
+
+
+class FlatFileUserStore(UserStore):
+    """
+    Text file with a line per user: github login, lark user id and an optional path to
+    the user's json config, separated by spaces.
+    """
+
+    def load(self) -> List[UserEntry]:
+        entries = []
+        with open(self.path, "r", encoding="utf-8") as user_file:
+            for line in user_file:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                splits = line.split(" ", 3)
+                if len(splits) < 2:
+                    print(f"WARNING: skip invalid line in {self.path}: {line}")
+                    continue
+                entries.append(UserEntry(*splits[:3]))
+        return entries
+
+
+class JsonLinesUserStore(UserStore):
+    """
+    File with a json object per line, keyed by the UserEntry field names, e.g.
+    {"github_login_name": "octocat", "user_id": "ou_xxx", "github_id": 583231,
+    "email": "octocat@example.com", "config_path": "octocat.json"}
+    """
+
+    def load(self) -> List[UserEntry]:
+        entries = []
+        with open(self.path, "r", encoding="utf-8") as user_file:
+            for line_no, line in enumerate(user_file, 1):
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                try:
+                    record = json.loads(line)
+                    entries.append(
+                        UserEntry(
+                            record["github_login_name"],
+                            record["user_id"],
+                            record.get("config_path"),
+                            record.get("github_id"),
+                            record.get("email"),
+                        )
+                    )
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    print(f"WARNING: skip invalid line {line_no} in {self.path}: {e}")
+        return entries
+
+
+class SqliteUserStore(UserStore):
+    """
+    SQLite database with a table of the UserEntry columns, e.g.
+    CREATE TABLE users (github_login_name TEXT PRIMARY KEY, user_id TEXT NOT NULL,
+    config_path TEXT, github_id INTEGER, email TEXT)
+    """
+
+    def __init__(self, path: str, table: str = "users") -> None:
+        super().__init__(path)
+        self._table = table
+
+    def load(self) -> List[UserEntry]:
+        # read only, so that the bot never creates or locks the database for writing
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(
+                "SELECT github_login_name, user_id, config_path, github_id, email "
+                f'FROM "{self._table}" WHERE github_login_name IS NOT NULL '
+                "AND user_id IS NOT NULL"
+            ).fetchall()
+        finally:
+            conn.close()
+        return [UserEntry(*row) for row in rows]
+
+    def watched_paths(self) -> List[str]:
+        # in WAL mode, committed writes land in the -wal file until a checkpoint
+        return [self.path, self.path + "-wal"]
+
+
+def open_user_store(path: str) -> UserStore:
+    """Pick the store by file extension: .jsonl, .db/.sqlite/.sqlite3, else flat file."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".jsonl":
+        return JsonLinesUserStore(path)
+    if extension in (".db", ".sqlite", ".sqlite3"):
+        return SqliteUserStore(path)
+    return FlatFileUserStore(path)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Server-independent processing of github webhook deliveries."""
+
+import os
+import re
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from lark_bot.delivery_dedupe import DeliveryDedupeCache
+from lark_bot.event_log_writer import EventLogWriter
+from lark_bot.events import DISCARDED_EVENTS
+from lark_bot.event_worker_pool import (
+    EventWorkerPool,
+    DEFAULT_MAX_QUEUE_SIZE,
+    RETRY_AFTER,
+)
+from lark_bot.github_event_handler import GithubEventHandler
+from lark_bot.payload_decoder import PayloadDecoder
+
+# response status code, json body and extra headers
+Response = Tuple[int, Dict, Dict[str, str]]
+
+EVENT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "event_log"
+)
+
+# github puts the action first in the payload, e.g. {"action":"completed",...
+_LEADING_ACTION = re.compile(rb'\A\s*\{\s*"action"\s*:\s*"([A-Za-z_]+)"')
+_ACTION_SCAN_BYTES = 64
+MAX_REPORTED_EVENTS = 1000  # unhandled event names remembered to report each once
+
+
+def peek_action(body: bytes) -> Optional[str]:
+    """The action of a webhook payload without parsing it, None if not found."""
+    match = _LEADING_ACTION.match(body[:_ACTION_SCAN_BYTES])
+    return None if match is None else match.group(1).decode()
+
+
+class WebhookIngestor:
+    """
+    Process a github webhook delivery and decide the response to the webhook request.
+
+    A server calls precheck() with the request headers first, and only reads the body
+    and calls ingest() if precheck() returns None. If the body cannot be read, the
+    server calls release() instead.
+
+    The event is queued to an EventWorkerPool and acknowledged with 202 right away, or
+    rejected with 503 and a Retry-After header when the queue is full. With
+    num_workers == 0 the event is instead handled inline before responding.
+    Deliveries already seen in the dedupe cache are acknowledged without processing,
+    or answered 409 with a Retry-After header while the first copy is still being
+    processed, as it may yet fail.
+    Unless every event is logged, events that are never notified are acknowledged
+    from the X-GitHub-Event header, or from the action at the start of the body,
+    without parsing the body. An event name the bot does not handle is reported
+    the first time it is received. Only the payload fields read by the event are decoded
+    if msgspec is installed, see PayloadDecoder.
+    """
+
+    def __init__(
+        self,
+        github_event_handler: GithubEventHandler,
+        event_log_dir: str = EVENT_DIR,
+        always_log_event: bool = False,
+        num_workers: int = 1,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+        dedupe_cache: DeliveryDedupeCache = None,
+        event_log_compression: str = None,
+    ) -> None:
+        """event_log_compression: None, "gzip" or "zstd", see EventLogWriter"""
+        self._github_event_handler = github_event_handler
+        self._event_log = EventLogWriter(event_log_dir, compression=event_log_compression)
+        self._always_log_event = always_log_event
+        self._dedupe_cache = dedupe_cache or DeliveryDedupeCache()
+        # events are logged from the raw body, so they can be partially decoded
+        self._decoder = PayloadDecoder()
+        self._ignored_events = 0
+        self._reported_events = set()
+        self._counter_lock = threading.Lock()
+        self._worker_pool = None
+        if num_workers > 0:
+            self._worker_pool = EventWorkerPool(
+                self.process_event, num_workers, max_queue_size
+            )
+
+    def process_event(
+        self,
+        event_name: str,
+        delivery_id: str,
+        webhook_json: object,
+        timestamp: datetime,
+        body: bytes = None,
+    ) -> bool:
+        """
+        Handle the event and log it. Returns False if the event handler raises.
+        body: the payload webhook_json was decoded from, logged instead of webhook_json
+        as it may be partially decoded. None to log webhook_json.
+        """
+        try:
+            self._github_event_handler.handle_event(event_name, webhook_json)
+            if self._always_log_event:
+                self._event_log.write(
+                    event_name, delivery_id, timestamp, webhook_json, body
+                )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            sys.stderr.write(f"Error handling event: {e}\n")
+            self._event_log.write(
+                event_name, delivery_id, timestamp, webhook_json, body, error=repr(e)
+            )
+            self._forget_delivery(delivery_id)
+            return False
+        self._complete_delivery(delivery_id)
+        return True
+
+    def _complete_delivery(self, delivery_id: str):
+        if delivery_id is not None:
+            self._dedupe_cache.complete(delivery_id)
+
+    def _forget_delivery(self, delivery_id: str):
+        if delivery_id is not None:
+            self._dedupe_cache.discard(delivery_id)
+
+    def release(self, delivery_id: str):
+        """
+        Forget a delivery that passed precheck() but was not ingested, e.g. as its
+        body could not be read, so that a redelivery is processed.
+        """
+        self._forget_delivery(delivery_id)
+
+    def _count_ignored(self):
+        with self._counter_lock:
+            self._ignored_events += 1
+
+    def _report_unhandled(self, event_name: str):
+        """Report an unhandled event the first time, as it may be a missing handler."""
+        if event_name in DISCARDED_EVENTS:
+            return
+        with self._counter_lock:
+            if event_name in self._reported_events:
+                return
+            if len(self._reported_events) < MAX_REPORTED_EVENTS:
+                self._reported_events.add(event_name)
+        sys.stderr.write(f"Unhandled event {event_name}, ignore events of the name\n")
+
+    def precheck(self, event_name: str, delivery_id: str) -> Optional[Response]:
+        """Returns the response if the delivery can be answered from the headers alone."""
+        if (
+            not self._always_log_event
+            and event_name is not None
+            and not self._github_event_handler.is_event_handled(event_name)
+        ):
+            self._count_ignored()
+            self._report_unhandled(event_name)
+            return 200, {"status": "ignored"}, {}
+        if delivery_id is not None and not self._dedupe_cache.add(delivery_id):
+            if self._dedupe_cache.is_in_flight(delivery_id):
+                print(f"Delivery {delivery_id} of {event_name} is in progress")
+                return 409, {"status": "in progress"}, {"Retry-After": str(RETRY_AFTER)}
+            print(f"Skip duplicate delivery {delivery_id} of {event_name}")
+            return 200, {"status": "duplicate"}, {}
+        return None
+
+    def ingest(self, event_name: str, delivery_id: str, body: bytes) -> Response:
+        """Returns the response status code, json body and extra headers."""
+        now = datetime.now()
+        action = None if self._always_log_event else peek_action(body)
+        if action is not None and self._github_event_handler.is_action_discarded(
+            event_name, action
+        ):
+            self._count_ignored()
+            self._complete_delivery(delivery_id)
+            return 200, {"status": "ignored"}, {}
+        try:
+            webhook_json = self._decoder.decode(event_name, body)
+        except ValueError as e:
+            self._forget_delivery(delivery_id)
+            return 400, {"error": f"Invalid json: {e}"}, {}
+
+        # the raw body is only kept to log every event, an error is logged with the
+        # decoded fields, so that queued events do not hold whole payloads
+        if not self._always_log_event:
+            body = None
+        if self._worker_pool is None:
+            if self.process_event(event_name, delivery_id, webhook_json, now, body):
+                return 200, {"status": "success"}, {}
+            return 200, {"status": "error"}, {}
+
+        if self._worker_pool.submit(event_name, delivery_id, webhook_json, now, body):
+            return 202, {"status": "queued"}, {}
+        sys.stderr.write(f"Event queue is full, reject {event_name}. Return 503.\n")
+        self._forget_delivery(delivery_id)
+        return 503, {"error": "Event queue is full"}, {"Retry-After": str(RETRY_AFTER)}
+
+    def stats(self) -> Dict[str, object]:
+        stats = self._github_event_handler.stats()
+        stats["deliveries"] = self._dedupe_cache.stats()
+        stats["ignored_events"] = self._ignored_events
+        stats["event_log"] = self._event_log.stats()
+        if self._worker_pool is not None:
+            stats["queued_events"] = self._worker_pool.qsize()
+        return stats
+
+    def shutdown(self):
+        """Process the queued events before exit."""
+        if self._worker_pool is not None:
+            self._worker_pool.shutdown()
+        self._github_event_handler.close()
+        self._dedupe_cache.close()
+        self._event_log.close()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Archive the event log, query the archive and replay archived events."""
+
+from lark_bot.event_archive import EventArchive
+from lark_bot.github_event_handler import GithubEventHandler
+from lark_bot.lark_bot_client import DryRunLarkBotClient, LarkBotClient
+from lark_bot.payload_decoder import loads
+from lark_bot.webhook_ingestor import EVENT_DIR
+
+from argparse import ArgumentParser
+import sys
+
+
+def add_filter_args(parser: ArgumentParser):
+    parser.add_argument("--delivery", help="X-GitHub-Delivery id")
+    parser.add_argument("--repo", help="Repository full name, e.g. owner/repo")
+    parser.add_argument("--number", type=int, help="Issue or PR number")
+    parser.add_argument("--event", help="Event name, e.g. pull_request")
+    parser.add_argument("--action", help="Event action, e.g. opened")
+    parser.add_argument("--sender", help="Github login of the sender")
+    parser.add_argument("--since", help="ISO-8601 time, e.g. 2024-06-24T07:00")
+    parser.add_argument("--until", help="ISO-8601 time, exclusive")
+    parser.add_argument("--limit", type=int)
+
+
+def get_args():
+    parser = ArgumentParser(description="Github event archive")
+    parser.add_argument("archive", help="SQLite file of the archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser(
+        "import", help="Archive the new events of the event log directory"
+    )
+    import_parser.add_argument(
+        "event_log_dir", nargs="?", default=EVENT_DIR, help="Event log directory"
+    )
+
+    list_parser = commands.add_parser("list", help="Print the matching events")
+    add_filter_args(list_parser)
+
+    replay_parser = commands.add_parser(
+        "replay", help="Process the matching events with GithubEventHandler"
+    )
+    add_filter_args(replay_parser)
+    replay_parser.add_argument(
+        "-u",
+        "--user_config_file",
+        default="user_list",
+        help="File path to the lark user id list. A .jsonl or .db/.sqlite file is "
+        "read as json lines or SQLite, see lark_bot.user_store",
+    )
+    replay_parser.add_argument(
+        "--live",
+        metavar="LARK_BOT_URL",
+        help="Post the notifications to this lark bot. If not set, they are printed.",
+    )
+    return parser.parse_args()
+
+
+def query(archive: EventArchive, args):
+    return archive.query(
+        delivery_id=args.delivery,
+        repo=args.repo,
+        number=args.number,
+        event_name=args.event,
+        action=args.action,
+        sender=args.sender,
+        since=args.since,
+        until=args.until,
+        limit=args.limit,
+    )
+
+
+def replay(archive: EventArchive, args):
+    if args.live is None:
+        lark_bot_client, lark_bot_url = DryRunLarkBotClient(), ""
+    else:
+        lark_bot_client, lark_bot_url = LarkBotClient(args.live), args.live
+    event_handler = GithubEventHandler(
+        args.user_config_file, lark_bot_url, lark_bot_client=lark_bot_client
+    )
+    replayed, failed = 0, 0
+    try:
+        for event in query(archive, args):
+            print(f"== {event.time} {event.event_name} {event.action} {event.delivery_id}")
+            try:
+                event_handler.handle_event(event.event_name, loads(archive.payload(event.id)))
+                replayed += 1
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                sys.stderr.write(f"Error handling event {event.id}: {e}\n")
+                failed += 1
+    finally:
+        event_handler.close()
+    print(f"Replayed {replayed} events, {failed} failed")
+
+
+if __name__ == "__main__":
+    main_args = get_args()
+    event_archive = EventArchive(main_args.archive)
+    try:
+        if main_args.command == "import":
+            print(f"Archived {event_archive.import_dir(main_args.event_log_dir)} events")
+        elif main_args.command == "list":
+            for archived in query(event_archive, main_args):
+                error = "" if archived.error is None else f" error: {archived.error}"
+                print(
+                    f"{archived.time} {archived.event_name} {archived.action} "
+                    f"{archived.repo}#{archived.number} {archived.sender} "
+                    f"{archived.delivery_id}{error}"
+                )
+        else:
+            replay(event_archive, main_args)
+    finally:
+        event_archive.close()
@@ -16,17 +16,24 @@
 
 """Start the server that processes github webhook events and send lark notifications."""
 
+import os
+import signal
 import sys
 
+from lark_bot.delivery_dedupe import DeliveryDedupeCache
+from lark_bot.event_worker_pool import DEFAULT_MAX_QUEUE_SIZE
 from lark_bot.github_webhook_request_handler import (
     NotifyLarkRequestHandler,
     GitHubHookIpManager,
 )
 from lark_bot.github_event_handler import GithubEventHandler
+from lark_bot.http_serving import PooledHTTPServer, serve_forked
+from lark_bot.lark_bot_client import LarkBotClient, DEFAULT_POOL_SIZE
+from lark_bot.lark_delivery import RateLimiter
+from lark_bot.webhook_ingestor import WebhookIngestor, EVENT_DIR
 
 from argparse import ArgumentParser
 from functools import partial
-from http.server import HTTPServer
 
 
 def get_args():
@@ -36,27 +43,151 @@ def get_args():
         "-u",
         "--user_config_file",
         default="user_list",
-        help="File path to the lark user id list",
+        help="File path to the lark user id list. A .jsonl or .db/.sqlite file is "
+        "read as json lines or SQLite, see lark_bot.user_store",
     )
     parser.add_argument("-p", "--port", type=int, default=9002, help="Server port")
     parser.add_argument("-l", "--log_event", default=False, action="store_true")
+    parser.add_argument(
+        "-e", "--event_log_dir", default=EVENT_DIR, help="Directory to log events"
+    )
+    parser.add_argument(
+        "--event_log_compression",
+        choices=["gzip", "zstd"],
+        default=None,
+        help="Compress the event log segments, zstd requires zstandard",
+    )
+    parser.add_argument(
+        "--event_workers",
+        type=int,
+        default=1,
+        help="Number of background threads processing events. The request is "
+        "acknowledged with 202 once the event is queued. If 0, events are "
+        "processed before responding to github.",
+    )
+    parser.add_argument(
+        "--event_queue_size",
+        type=int,
+        default=DEFAULT_MAX_QUEUE_SIZE,
+        help="Max number of queued events before responding 503 to github",
+    )
+    parser.add_argument(
+        "--allow_subnet",
+        action="append",
+        default=[],
+        help="Subnet (CIDR) allowed to post events in addition to github hooks, "
+        "e.g. a github enterprise or proxy range. Can be repeated.",
+    )
+    parser.add_argument(
+        "--lark_http2",
+        default=False,
+        action="store_true",
+        help="Post to lark over HTTP/2, requires httpx[http2]",
+    )
+    parser.add_argument(
+        "--no_lark_rate_limit",
+        default=False,
+        action="store_true",
+        help="Do not rate limit lark messages, e.g. to benchmark against a local "
+        "lark stand-in. Lark rejects messages over its limits.",
+    )
+    parser.add_argument(
+        "--lark_outbox_dir",
+        default=None,
+        help="Directory to persist lark messages until they are delivered, so that "
+        "they are resent after a restart",
+    )
+    parser.add_argument(
+        "--delivery_cache_file",
+        default=None,
+        help="File to persist seen X-GitHub-Delivery ids, so that redeliveries are "
+        "still skipped after a restart",
+    )
+    parser.add_argument(
+        "--coalesce_window",
+        type=float,
+        default=0,
+        help="Seconds to wait for related updates of an issue/PR to merge them into "
+        "one lark card. If 0, every update is posted right away.",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of threads handling requests in each process",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of server processes sharing the port (SO_REUSEPORT). Each "
+        "process loads the user list and keeps its own dedupe cache and lark outbox, "
+        "and is given an equal share of the lark rate limit.",
+    )
     return parser.parse_args()
 
 
-if __name__ == "__main__":
-    main_args = get_args()
-    server_address = ("", main_args.port)
+def serve(args, worker: int = None):
+    """
+    Serve until SIGTERM or Ctrl-C.
+    worker: index of the forked server process, None if not forked.
+    """
+    outbox_dir = args.lark_outbox_dir
+    delivery_cache_file = args.delivery_cache_file
+    if worker is not None:
+        # persist per worker, so that a restarted worker resumes its own messages
+        if outbox_dir is not None:
+            outbox_dir = os.path.join(outbox_dir, f"worker-{worker}")
+        if delivery_cache_file is not None:
+            delivery_cache_file = f"{delivery_cache_file}.{worker}"
+
     event_handler = GithubEventHandler(
-        main_args.user_config_file, main_args.lark_bot_url
+        args.user_config_file,
+        args.lark_bot_url,
+        lark_bot_client=LarkBotClient(
+            args.lark_bot_url,
+            pool_size=max(DEFAULT_POOL_SIZE, args.event_workers, args.threads),
+            http2=args.lark_http2,
+            outbox_dir=outbox_dir,
+            rate_limiter=RateLimiter([])
+            if args.no_lark_rate_limit
+            else RateLimiter.for_lark_bot(args.workers),
+        ),
+        coalesce_window=args.coalesce_window,
     )
-    ip_manager = GitHubHookIpManager()
-    handler = partial(
-        NotifyLarkRequestHandler,
+    ingestor = WebhookIngestor(
         event_handler,
-        ip_manager,
-        always_log_event=main_args.log_event,
+        event_log_dir=args.event_log_dir,
+        always_log_event=args.log_event,
+        event_log_compression=args.event_log_compression,
+        num_workers=args.event_workers,
+        max_queue_size=args.event_queue_size,
+        dedupe_cache=DeliveryDedupeCache(persist_path=delivery_cache_file),
+    )
+    ip_manager = GitHubHookIpManager(extra_subnets=args.allow_subnet)
+    handler = partial(NotifyLarkRequestHandler, ingestor, ip_manager)
+
+    # exit serve_forever on SIGTERM (e.g. docker stop) so that queued events are drained
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    httpd = PooledHTTPServer(
+        ("", args.port),
+        handler,
+        num_threads=args.threads,
+        reuse_port=worker is not None,
     )
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        ingestor.shutdown()
+
 
+if __name__ == "__main__":
+    main_args = get_args()
     sys.stderr.write(f"Serve at port {main_args.port}\n")
-    httpd = HTTPServer(server_address, handler)
-    httpd.serve_forever()
+    if main_args.workers > 1:
+        serve_forked(main_args.workers, partial(serve, main_args))
+    else:
+        serve(main_args)
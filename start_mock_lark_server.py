@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Start a mock lark bot webhook, to run the bot backend without posting to lark."""
+
+import signal
+import sys
+
+from lark_bot.mock_lark_server import MockLarkServer, DEFAULT_MAX_MESSAGES
+
+from argparse import ArgumentParser
+
+
+def get_args():
+    parser = ArgumentParser(description="Mock Lark Bot Webhook")
+    parser.add_argument("-p", "--port", type=int, default=9003, help="Server port")
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Seconds to wait before answering"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0, help="Up to this many extra seconds of latency"
+    )
+    parser.add_argument(
+        "--drop_rate",
+        type=float,
+        default=0,
+        help="Fraction of posts whose connection is closed without a response",
+    )
+    parser.add_argument(
+        "--server_error_rate", type=float, default=0, help="Fraction of posts answered 503"
+    )
+    parser.add_argument(
+        "--too_many_requests_rate",
+        type=float,
+        default=0,
+        help="Fraction of posts answered 429 with Retry-After",
+    )
+    parser.add_argument(
+        "--frequency_limited_rate",
+        type=float,
+        default=0,
+        help="Fraction of posts answered with the lark frequency limited error",
+    )
+    parser.add_argument(
+        "--rate_limit",
+        default=False,
+        action="store_true",
+        help="Answer posts beyond the lark custom bot limits as frequency limited",
+    )
+    parser.add_argument(
+        "--max_messages",
+        type=int,
+        default=DEFAULT_MAX_MESSAGES,
+        help="Number of accepted cards kept for GET /messages",
+    )
+    parser.add_argument(
+        "--record_file", default=None, help="File to append the accepted cards to"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main_args = get_args()
+    server = MockLarkServer(
+        ("", main_args.port),
+        latency=main_args.latency,
+        jitter=main_args.jitter,
+        drop_rate=main_args.drop_rate,
+        server_error_rate=main_args.server_error_rate,
+        too_many_requests_rate=main_args.too_many_requests_rate,
+        frequency_limited_rate=main_args.frequency_limited_rate,
+        rate_limit=main_args.rate_limit,
+        max_messages=main_args.max_messages,
+        record_file=main_args.record_file,
+    )
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    sys.stderr.write(f"Mock lark bot at http://localhost:{main_args.port}/hook\n")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        sys.stderr.write(f"{server.stats()}\n")
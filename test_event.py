@@ -31,7 +31,8 @@ def get_args():
         "-u",
         "--user_config_file",
         default="user_list",
-        help="File path to the lark user id list",
+        help="File path to the lark user id list. A .jsonl or .db/.sqlite file is "
+        "read as json lines or SQLite, see lark_bot.user_store",
     )
     return parser.parse_args()
 
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fixtures shared by the tests"""
+
+import pytest
+
+from lark_bot.mock_lark_server import MockLarkServer
+
+
+@pytest.fixture
+def sink():
+    """A MockLarkServer serving in the background."""
+    sink = MockLarkServer(("127.0.0.1", 0))
+    sink.serve_in_background()
+    yield sink
+    sink.shutdown()
+    sink.server_close()
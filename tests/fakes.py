@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fakes shared by the tests"""
+
+import threading
+
+
+class FakeEventHandler:
+    """Records the handled events, blocking until release is set."""
+
+    def __init__(self) -> None:
+        self.handled = []
+        self.release = threading.Event()
+
+    @classmethod
+    def is_event_handled(cls, event_name: str) -> bool:
+        return event_name not in ("ping", "check_run")
+
+    @classmethod
+    def is_action_discarded(cls, event_name: str, action: str) -> bool:
+        return False
+
+    def handle_event(self, event_name: str, webhook_json: object):
+        self.release.wait(5)
+        self.handled.append((event_name, webhook_json["action"]))
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class AllowedIps:
+    """GitHubHookIpManager stand-in, allowing every address or none."""
+
+    def __init__(self, allowed: bool) -> None:
+        self.allowed = allowed
+
+    def check_from_github(self, _: str) -> bool:
+        return self.allowed
+
+
+class StopAfter:
+    """Stands in for the stop event of a background loop, recording its waits."""
+
+    def __init__(self, num_waits: int) -> None:
+        self.num_waits = num_waits
+        self.waits = []
+
+    def is_set(self) -> bool:
+        return len(self.waits) >= self.num_waits
+
+    def wait(self, timeout: float) -> bool:
+        self.waits.append(timeout)
+        return self.is_set()
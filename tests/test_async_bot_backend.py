@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the asyncio server and AsyncLarkBotClient, which require aiohttp"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+# pylint: disable=wrong-import-position
+from aiohttp.test_utils import TestClient, TestServer
+
+from async_bot_backend import create_app
+from lark_bot.async_lark_bot_client import AsyncLarkBotClient
+from lark_bot.lark_bot_client import Notification
+from lark_bot.webhook_ingestor import WebhookIngestor
+from fakes import AllowedIps, FakeEventHandler
+
+
+def test_webhook_and_stats(tmp_path, sink):
+    handler = FakeEventHandler()
+    handler.release.set()
+    ingestor = WebhookIngestor(handler, event_log_dir=str(tmp_path), num_workers=0)
+    ip_manager = AllowedIps(True)
+
+    async def run():
+        app = create_app(ingestor, ip_manager, AsyncLarkBotClient(sink.url))
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post(
+                "/",
+                data=b'{"action": "opened"}',
+                headers={"X-GitHub-Event": "issues", "X-GitHub-Delivery": "d1"},
+            )
+            assert response.status == 200
+            assert await response.json() == {"status": "success"}
+            assert (await client.get("/stats")).status == 200
+            ip_manager.allowed = False
+            assert (await client.get("/stats")).status == 403
+            response = await client.post("/", data=b"{}")
+            assert response.status == 403
+
+    asyncio.run(run())
+    assert handler.handled == [("issues", "opened")]
+
+
+def test_client_delivers_queued_messages_on_close(sink):
+    async def run():
+        client = AsyncLarkBotClient(sink.url, pool_size=2)
+        await client.start()
+        for i in range(3):
+            # posted from a thread, as the coalescer and the event workers do
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                client.post_notification,
+                Notification("issues", f"[GitHub] {i}", "link", "https://github.com", ""),
+                ["ou_1"],
+            )
+        await client.aclose()
+        return client.stats()
+
+    stats = asyncio.run(run())
+    assert stats["sent"] == 3
+    assert sink.stats() == {"ok": 3}
+
+
+def test_delivery_released_when_the_body_read_fails(tmp_path, sink):
+    handler = FakeEventHandler()
+    handler.release.set()
+    ingestor = WebhookIngestor(handler, event_log_dir=str(tmp_path), num_workers=0)
+
+    async def run():
+        app = create_app(ingestor, AllowedIps(True), AsyncLarkBotClient(sink.url))
+        async with TestClient(TestServer(app)) as client:
+            _, writer = await asyncio.open_connection("127.0.0.1", client.port)
+            writer.write(
+                b"POST / HTTP/1.1\r\nHost: localhost\r\nX-GitHub-Event: issues\r\n"
+                b"X-GitHub-Delivery: d1\r\nContent-Length: 1000\r\n\r\n{\"action\""
+            )
+            await writer.drain()
+            await asyncio.sleep(0.1)
+            writer.close()
+            for _ in range(100):
+                if ingestor.stats()["deliveries"]["in_flight"] == 0:
+                    break
+                await asyncio.sleep(0.02)
+            # the redelivery is processed rather than answered 409 "in progress"
+            response = await client.post(
+                "/",
+                data=b'{"action": "opened"}',
+                headers={"X-GitHub-Event": "issues", "X-GitHub-Delivery": "d1"},
+            )
+            assert response.status == 200
+
+    asyncio.run(run())
+    assert handler.handled == [("issues", "opened")]
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of DeliveryDedupeCache"""
+
+from lark_bot import delivery_dedupe
+from lark_bot.delivery_dedupe import DeliveryDedupeCache
+
+
+def count_lines(path) -> int:
+    with open(path, "r", encoding="utf-8") as f:
+        return sum(1 for _ in f)
+
+
+def test_redelivery_in_flight():
+    cache = DeliveryDedupeCache()
+    assert cache.add("a")
+    assert not cache.add("a")
+    assert cache.is_in_flight("a")
+    cache.complete("a")
+    assert not cache.add("a")
+    assert not cache.is_in_flight("a")
+
+
+def test_discarded_delivery_is_processed_again():
+    cache = DeliveryDedupeCache()
+    assert cache.add("a")
+    cache.discard("a")
+    assert cache.add("a")
+
+
+def test_only_completed_deliveries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "deliveries")
+    cache = DeliveryDedupeCache(persist_path=path)
+    cache.add("done")
+    cache.complete("done")
+    cache.add("failed")
+    cache.complete("failed")
+    cache.discard("failed")
+    cache.add("in flight")
+    cache.close()
+
+    cache = DeliveryDedupeCache(persist_path=path)
+    assert not cache.add("done")
+    assert cache.add("failed")
+    assert cache.add("in flight")
+    cache.close()
+
+
+def test_persist_file_is_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(delivery_dedupe, "MIN_COMPACT_LINES", 10)
+    path = str(tmp_path / "deliveries")
+    cache = DeliveryDedupeCache(persist_path=path, max_size=5)
+    for n in range(100):
+        cache.add(str(n))
+        cache.complete(str(n))
+        assert count_lines(path) <= 10
+    cache.close()
+
+    cache = DeliveryDedupeCache(persist_path=path, max_size=5)
+    assert not cache.add("99")
+    assert cache.add("90")
+    cache.close()
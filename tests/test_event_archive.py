@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of EventArchive"""
+
+import json
+import os
+from datetime import datetime
+
+from lark_bot.event_archive import EventArchive
+from lark_bot.event_log_writer import EventLogWriter
+
+
+def issue_payload(number: int, action: str) -> dict:
+    return {
+        "action": action,
+        "issue": {"number": number},
+        "repository": {"full_name": "octo/repo"},
+        "sender": {"login": "octocat"},
+    }
+
+
+def test_imports_incrementally_and_queries(tmp_path):
+    log_dir = str(tmp_path / "event_log")
+    writer = EventLogWriter(log_dir)
+    writer.write("issues", "d1", datetime(2024, 6, 24, 7), issue_payload(1, "opened"))
+    writer.write("issues", "d2", datetime(2024, 6, 24, 8), issue_payload(2, "opened"))
+    writer.close()
+    # an event of the older one file per event layout
+    os.makedirs(os.path.join(log_dir, "issues-closed"))
+    with open(
+        os.path.join(log_dir, "issues-closed", "20240624-090000.000000.json"), "w"
+    ) as f:
+        json.dump(issue_payload(1, "closed"), f)
+
+    archive = EventArchive(str(tmp_path / "events.db"))
+    try:
+        assert archive.import_dir(log_dir) == 3
+        assert archive.import_dir(log_dir) == 0
+
+        events = list(archive.query(repo="octo/repo", number=1))
+        assert [(e.action, e.time) for e in events] == [
+            ("opened", "2024-06-24T07:00:00"),
+            ("closed", "2024-06-24T09:00:00"),
+        ]
+        assert [e.delivery_id for e in archive.query(since="2024-06-24T08")] == [
+            "d2",
+            None,
+        ]
+        (event,) = archive.query(delivery_id="d2")
+        assert json.loads(archive.payload(event.id)) == issue_payload(2, "opened")
+    finally:
+        archive.close()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of EventLogWriter"""
+
+import glob
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from lark_bot.event_log_writer import EventLogWriter, read_segment
+
+TIMESTAMP = datetime(2024, 6, 24, 7, 14)
+
+
+def read_records(event_log_dir: str):
+    records = []
+    for path in sorted(glob.glob(os.path.join(event_log_dir, "events-*"))):
+        records += [json.loads(line) for line in read_segment(path)]
+    return records
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_writes_json_lines(tmp_path, compression):
+    writer = EventLogWriter(str(tmp_path), compression=compression)
+    payload = {"action": "opened", "sender": {"login": "octocat"}}
+    assert writer.write("issues", "d1", TIMESTAMP, payload)
+    # a raw body is logged as is if compact, re-serialized otherwise
+    assert writer.write("issues", "d2", TIMESTAMP, {}, body=b'{"action":"closed"}\n')
+    assert writer.write("issues", "d3", TIMESTAMP, {}, body=b'{\n"action": "edited"}')
+    assert writer.write("ping", None, TIMESTAMP, {}, error="RuntimeError()")
+    writer.close()
+    assert not writer.write("issues", "d4", TIMESTAMP, payload)
+
+    records = read_records(str(tmp_path))
+    assert [r["delivery"] for r in records] == ["d1", "d2", "d3", None]
+    assert records[0] == {
+        "time": TIMESTAMP.isoformat(),
+        "event": "issues",
+        "action": "opened",
+        "delivery": "d1",
+        "payload": payload,
+    }
+    assert records[1]["payload"] == {"action": "closed"}
+    assert records[2]["payload"] == {"action": "edited"}
+    assert records[3]["error"] == "RuntimeError()"
+    assert writer.stats() == {"written": 4, "dropped": 1, "pending": 0}
+
+
+def test_rolls_over_segments(tmp_path):
+    writer = EventLogWriter(str(tmp_path), segment_max_bytes=100)
+    for i in range(5):
+        writer.write("issues", str(i), TIMESTAMP, {"padding": "x" * 100})
+    writer.close()
+    assert len(glob.glob(os.path.join(tmp_path, "events-*.jsonl"))) == 5
+    assert [r["delivery"] for r in read_records(str(tmp_path))] == [
+        str(i) for i in range(5)
+    ]
+
+
+def test_rejects_unknown_compression(tmp_path):
+    with pytest.raises(ValueError):
+        EventLogWriter(str(tmp_path), compression="lz4")
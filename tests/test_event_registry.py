@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the event class registry"""
+
+from lark_bot import events
+from lark_bot.events.registry import EVENT_MODULES
+
+
+def test_every_listed_module_registers_its_event():
+    for event_name in EVENT_MODULES:
+        event_class = events.get_event_class(event_name)
+        assert issubclass(event_class, events.BaseGithubEvent), event_name
+
+
+def test_unhandled_events():
+    assert events.get_event_class("ping") is None
+    for event_name in events.DISCARDED_EVENTS:
+        assert events.get_event_class(event_name) is None
+
+
+def test_lazy_class_attributes():
+    assert events.IssuesEvent is events.get_event_class("issues")
+    assert events.WorkflowRunEvent is events.get_event_class("workflow_run")
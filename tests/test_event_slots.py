@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests that events keep the fields they need rather than the webhook payload"""
+
+import json
+import os
+
+import pytest
+
+from benchmark_skip_notification import FIXTURE_EVENTS
+from lark_bot import events
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data")
+
+
+def containers(value):
+    """ids of the dicts and lists in a decoded json value."""
+    if isinstance(value, dict):
+        yield id(value)
+        for item in value.values():
+            yield from containers(item)
+    elif isinstance(value, list):
+        yield id(value)
+        for item in value:
+            yield from containers(item)
+
+
+def slot_values(event: events.BaseGithubEvent):
+    for cls in type(event).__mro__:
+        for slot in cls.__dict__.get("__slots__", ()):
+            if hasattr(event, slot):
+                yield slot, getattr(event, slot)
+
+
+@pytest.mark.parametrize("fixture", sorted(FIXTURE_EVENTS))
+def test_events_do_not_keep_the_payload(fixture):
+    event_name = FIXTURE_EVENTS[fixture]
+    event_class = events.get_event_class(event_name)
+    if event_class is None:
+        pytest.skip(f"{event_name} is not notified")
+    with open(os.path.join(DATA_DIR, fixture), "r", encoding="utf-8") as f:
+        webhook_json = json.load(f)
+    event = event_class(event_name, webhook_json)
+
+    assert not hasattr(event, "__dict__")
+    assert not hasattr(event, "_webhook_json")
+    with pytest.raises(AttributeError):
+        event.payload = webhook_json
+    payload_ids = set(containers(webhook_json))
+    for slot, value in slot_values(event):
+        assert id(value) not in payload_ids, slot
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of EventWorkerPool and the acknowledgement of WebhookIngestor"""
+
+import json
+import os
+import threading
+import time
+
+from lark_bot.event_log_writer import read_segment
+from lark_bot.event_worker_pool import EventWorkerPool
+from lark_bot.webhook_ingestor import WebhookIngestor
+from fakes import FakeEventHandler
+
+
+def test_pool_rejects_when_full():
+    release = threading.Event()
+    processed = []
+
+    def process(item):
+        release.wait(5)
+        processed.append(item)
+
+    pool = EventWorkerPool(process, num_workers=1, max_queue_size=1)
+    assert pool.submit(1)
+    # wait for the worker to take the first item, so that the queue is empty
+    while pool.qsize() > 0:
+        time.sleep(0.01)
+    assert pool.submit(2)
+    assert not pool.submit(3)
+    release.set()
+    pool.shutdown()
+    assert processed == [1, 2]
+    assert not pool.submit(4)
+
+
+def test_ingestor_acknowledges_before_processing(tmp_path):
+    handler = FakeEventHandler()
+    ingestor = WebhookIngestor(handler, event_log_dir=str(tmp_path))
+    assert ingestor.precheck("issues", "delivery-1") is None
+    status, body, _ = ingestor.ingest("issues", "delivery-1", b'{"action": "opened"}')
+    assert (status, body) == (202, {"status": "queued"})
+    assert handler.handled == []
+    handler.release.set()
+    ingestor.shutdown()
+    assert handler.handled == [("issues", "opened")]
+
+
+def test_ingestor_inline(tmp_path):
+    handler = FakeEventHandler()
+    handler.release.set()
+    ingestor = WebhookIngestor(handler, event_log_dir=str(tmp_path), num_workers=0)
+    status, body, _ = ingestor.ingest("issues", "delivery-1", b'{"action": "opened"}')
+    assert (status, body) == (200, {"status": "success"})
+    assert handler.handled == [("issues", "opened")]
+    ingestor.shutdown()
+
+
+def test_ingestor_reports_unhandled_events_once(tmp_path, capsys):
+    ingestor = WebhookIngestor(FakeEventHandler(), event_log_dir=str(tmp_path))
+    for delivery_id in ("delivery-1", "delivery-2"):
+        status, body, _ = ingestor.precheck("ping", delivery_id)
+        assert (status, body) == (200, {"status": "ignored"})
+    assert ingestor.precheck("check_run", "delivery-3")[0] == 200
+    assert capsys.readouterr().err.count("Unhandled event") == 1
+    assert ingestor.stats()["ignored_events"] == 3
+    ingestor.shutdown()
+
+
+class FailingEventHandler(FakeEventHandler):
+    def handle_event(self, event_name: str, webhook_json: object):
+        raise RuntimeError("failed")
+
+
+def test_failed_event_logged_from_decoded_fields(tmp_path):
+    ingestor = WebhookIngestor(FailingEventHandler(), event_log_dir=str(tmp_path))
+    body = b'{"action": "opened", "padding": "x"}'
+    assert ingestor.ingest("issues", "delivery-1", body)[0] == 202
+    ingestor.shutdown()
+    (segment,) = [os.path.join(tmp_path, name) for name in os.listdir(tmp_path)]
+    (line,) = list(read_segment(segment))
+    logged = json.loads(line)
+    assert logged["error"] == "RuntimeError('failed')"
+    assert logged["payload"]["action"] == "opened"
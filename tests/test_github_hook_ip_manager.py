@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of GitHubHookIpManager, with the github meta API stubbed"""
+
+import json
+import time
+from typing import Dict, NamedTuple
+
+import pytest
+
+from lark_bot import github_webhook_request_handler
+from lark_bot.github_webhook_request_handler import GitHubHookIpManager
+from fakes import StopAfter
+
+DAY = 24 * 3600
+HOOKS = ["192.0.2.0/24"]
+NEW_HOOKS = ["198.51.100.0/24"]
+
+
+class MetaResponse(NamedTuple):
+    status_code: int
+    text: str
+    headers: Dict[str, str]
+
+
+class FakeMetaApi:
+    """Stands in for requests.get, answering with the queued responses."""
+
+    def __init__(self, *responses) -> None:
+        self.responses = list(responses)
+        self.requests = []  # headers of each request
+
+    def __call__(self, url, headers, timeout):
+        self.requests.append(dict(headers))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def meta(hooks, etag: str) -> MetaResponse:
+    return MetaResponse(200, json.dumps({"hooks": hooks}), {"ETag": etag})
+
+
+def stub_meta_api(monkeypatch, *responses) -> FakeMetaApi:
+    meta_api = FakeMetaApi(*responses)
+    monkeypatch.setattr(github_webhook_request_handler.requests, "get", meta_api)
+    return meta_api
+
+
+def refresh(manager: GitHubHookIpManager, num_waits: int):
+    """Run the refresher on this thread until it has waited num_waits times."""
+    manager._stop_event = StopAfter(num_waits)
+    manager._refresh_loop()
+    return manager._stop_event.waits
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "github_hook_subnets.json")
+
+
+def write_cache(cache_path: str, fetched_at: float):
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump({"hooks": HOOKS, "etag": '"v1"', "fetched_at": fetched_at}, f)
+
+
+def read_cache(cache_path: str) -> dict:
+    with open(cache_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_first_fetch_is_cached(monkeypatch, cache_path):
+    meta_api = stub_meta_api(monkeypatch, meta(HOOKS, '"v1"'))
+    manager = GitHubHookIpManager(cache_path=cache_path, background_refresh=False)
+    # the defaults are used until the first fetch
+    assert manager.check_from_github("192.30.252.1")
+    assert not manager.check_from_github("192.0.2.1")
+
+    waits = refresh(manager, 1)
+    assert "If-None-Match" not in meta_api.requests[0]
+    assert manager.check_from_github("192.0.2.1")
+    assert not manager.check_from_github("192.30.252.1")
+    assert waits == [pytest.approx(DAY, abs=5)]
+    cache = read_cache(cache_path)
+    assert cache["hooks"] == HOOKS and cache["etag"] == '"v1"'
+
+
+def test_fresh_cache_is_not_refetched(monkeypatch, cache_path):
+    write_cache(cache_path, time.time() - 3600)
+    meta_api = stub_meta_api(monkeypatch)
+    manager = GitHubHookIpManager(cache_path=cache_path, background_refresh=False)
+    assert manager.check_from_github("192.0.2.1")
+    assert refresh(manager, 1) == [pytest.approx(DAY - 3600, abs=5)]
+    assert not meta_api.requests
+
+
+def test_not_modified_keeps_the_stale_cache(monkeypatch, cache_path):
+    fetched_at = time.time() - 2 * DAY
+    write_cache(cache_path, fetched_at)
+    meta_api = stub_meta_api(monkeypatch, MetaResponse(304, "", {}))
+    manager = GitHubHookIpManager(cache_path=cache_path, background_refresh=False)
+    # the stale subnets are used at startup, before they are revalidated
+    assert manager.check_from_github("192.0.2.1")
+    subnet_index = manager._subnet_index
+
+    waits = refresh(manager, 1)
+    assert meta_api.requests[0]["If-None-Match"] == '"v1"'
+    assert manager._subnet_index is subnet_index
+    assert manager.check_from_github("192.0.2.1")
+    assert waits == [pytest.approx(DAY, abs=5)]
+    cache = read_cache(cache_path)
+    assert cache["hooks"] == HOOKS and cache["fetched_at"] > fetched_at
+
+
+def test_fetch_errors_back_off_and_keep_the_allowlist(monkeypatch, cache_path):
+    write_cache(cache_path, time.time() - 2 * DAY)
+    stub_meta_api(
+        monkeypatch,
+        github_webhook_request_handler.requests.ConnectionError("unreachable"),
+        MetaResponse(503, "unavailable", {}),
+        meta(NEW_HOOKS, '"v2"'),
+    )
+    jitters = []
+
+    def uniform(low, high):
+        jitters.append((low, high))
+        return high
+
+    monkeypatch.setattr(github_webhook_request_handler.random, "uniform", uniform)
+    manager = GitHubHookIpManager(cache_path=cache_path, background_refresh=False)
+
+    min_delay = GitHubHookIpManager.RETRY_MIN_DELAY
+    assert refresh(manager, 2) == [min_delay * 1.5, min_delay * 2 * 1.5]
+    assert jitters == [(0.5, 1.5)] * 2
+    assert manager.check_from_github("192.0.2.1")
+    assert read_cache(cache_path)["hooks"] == HOOKS
+
+    # the failures are forgotten once a fetch succeeds
+    assert refresh(manager, 1) == [pytest.approx(DAY, abs=5)]
+    assert manager.check_from_github("198.51.100.1")
+    assert not manager.check_from_github("192.0.2.1")
+
+
+def test_background_refresher(monkeypatch, cache_path):
+    write_cache(cache_path, time.time() - 2 * DAY)
+    meta_api = stub_meta_api(monkeypatch, meta(NEW_HOOKS, '"v2"'))
+    manager = GitHubHookIpManager(cache_path=cache_path)
+    try:
+        deadline = time.time() + 5
+        while not manager.check_from_github("198.51.100.1") and time.time() < deadline:
+            time.sleep(0.01)
+        assert manager.check_from_github("198.51.100.1")
+    finally:
+        # the refresher waits a day for the next fetch, until stopped
+        manager.stop()
+    assert not manager._refresher.is_alive()
+    assert len(meta_api.requests) == 1
+    assert read_cache(cache_path)["etag"] == '"v2"'
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of PooledHTTPServer and the lark rate limit of forked servers"""
+
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+from lark_bot.http_serving import PooledHTTPServer
+from lark_bot.lark_delivery import RateLimiter
+
+RELEASE = threading.Event()
+
+
+class BlockingHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        RELEASE.wait(5)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *_):
+        pass
+
+
+class CountingServer(PooledHTTPServer):
+    accepted = 0
+
+    def verify_request(self, request, client_address) -> bool:
+        self.accepted += 1
+        return True
+
+
+def test_connections_wait_for_a_free_thread():
+    RELEASE.clear()
+    httpd = CountingServer(("127.0.0.1", 0), BlockingHandler, num_threads=2)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    clients = []
+    try:
+        for _ in range(4):
+            client = socket.create_connection(("127.0.0.1", httpd.server_port))
+            client.sendall(b"GET / HTTP/1.0\r\n\r\n")
+            clients.append(client)
+        time.sleep(0.3)
+        # two are handled, the third waits for a thread, the fourth is not accepted
+        assert httpd.accepted == 3
+        RELEASE.set()
+        for client in clients:
+            client.settimeout(5)
+            assert client.recv(1024).startswith(b"HTTP/1.0 200")
+        assert httpd.accepted == 4
+    finally:
+        RELEASE.set()
+        for client in clients:
+            client.close()
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def count_allowed(rate_limiter: RateLimiter) -> int:
+    allowed = 0
+    while rate_limiter.try_acquire():
+        allowed += 1
+    return allowed
+
+
+def test_forked_servers_share_the_lark_rate_limit():
+    assert count_allowed(RateLimiter.for_lark_bot()) == 5
+    assert count_allowed(RateLimiter.for_lark_bot(num_processes=2)) == 2
+    # at least one message at a time, at a lower rate
+    assert count_allowed(RateLimiter.for_lark_bot(num_processes=10)) == 1
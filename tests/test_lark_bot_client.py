@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of LarkBotClient"""
+
+import sys
+
+import requests
+
+from lark_bot.lark_bot_client import LarkBotClient, Notification
+from lark_bot.lark_delivery import RateLimiter
+
+
+def notification(title: str) -> Notification:
+    return Notification("issues", title, "link", "https://github.com", "message")
+
+
+def record_posts(monkeypatch):
+    """(session, timeout) of each post of a requests.Session."""
+    posts = []
+    post = requests.Session.post
+
+    def recording_post(session, url, **kwargs):
+        posts.append((session, kwargs.get("timeout")))
+        return post(session, url, **kwargs)
+
+    monkeypatch.setattr(requests.Session, "post", recording_post)
+    return posts
+
+
+def test_posts_reuse_one_pooled_session(monkeypatch, sink):
+    posts = record_posts(monkeypatch)
+    client = LarkBotClient(
+        sink.url, post_time_out=7, connect_time_out=2, rate_limiter=RateLimiter([])
+    )
+    try:
+        for i in range(3):
+            assert client.post_notification(notification(f"[GitHub] {i}"), []) == 200
+        assert [timeout for _, timeout in posts] == [(2, 7)] * 3
+        assert {id(session) for session, _ in posts} == {id(client._session)}
+        # the keep-alive connection is reused rather than reopened for every post
+        pools = client._session.get_adapter(sink.url).poolmanager.pools
+        assert [pools[key].num_connections for key in pools.keys()] == [1]
+    finally:
+        client.close()
+    assert len(sink.messages()) == 3
+
+
+def test_http2_falls_back_without_httpx(monkeypatch, sink, capsys):
+    # a None module makes "import httpx" raise ImportError
+    monkeypatch.setitem(sys.modules, "httpx", None)
+    posts = record_posts(monkeypatch)
+    client = LarkBotClient(sink.url, http2=True, rate_limiter=RateLimiter([]))
+    try:
+        assert isinstance(client._session, requests.Session)
+        assert client._transport_errors == (requests.RequestException,)
+        assert client.post_notification(notification("[GitHub] issue opened"), []) == 200
+        assert posts[0][1] == (3, 5)
+    finally:
+        client.close()
+    assert "Fall back to HTTP/1.1" in capsys.readouterr().err
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of LarkDelivery"""
+
+import threading
+import time
+
+import pytest
+
+from lark_bot import lark_delivery
+from lark_bot.lark_delivery import (
+    CircuitBreaker,
+    LarkDelivery,
+    RateLimiter,
+    SentResponse,
+    TokenBucket,
+)
+
+
+OK = SentResponse(200, '{"code": 0}', {})
+SERVER_ERROR = SentResponse(503, "", {})
+REJECTED = SentResponse(200, '{"code": 19024}', {})
+
+
+class TransportError(Exception):
+    pass
+
+
+class FakeLark:
+    """send() of LarkDelivery answering the given responses, then OK."""
+
+    def __init__(self, *responses) -> None:
+        self.responses = list(responses)
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, payload):
+        with self.lock:
+            self.sent.append(payload)
+            response = self.responses.pop(0) if self.responses else OK
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(lark_delivery, "RETRY_MIN_DELAY", 0.01)
+
+
+def test_try_acquire_does_not_take_partial_tokens():
+    per_second = TokenBucket(1, 1)
+    per_minute = TokenBucket(1 / 60, 2)
+    limiter = RateLimiter([per_second, per_minute])
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    # the per-minute token was given back as the per-second bucket was empty
+    assert per_minute.try_take()
+
+
+def test_deliver_does_not_wait_for_the_rate_limit():
+    lark = FakeLark()
+    acked = []
+    delivery = LarkDelivery(lark.send, rate_limiter=RateLimiter([TokenBucket(5, 1)]))
+    start = time.monotonic()
+    assert delivery.deliver({"n": 1}, lambda: acked.append(1)) == 200
+    assert delivery.deliver({"n": 2}, lambda: acked.append(2)) is None
+    assert delivery.deliver({"n": 3}, lambda: acked.append(3)) is None
+    assert time.monotonic() - start < 0.1
+    wait_for(lambda: len(acked) == 3)
+    assert acked == [1, 2, 3]
+    assert lark.sent == [{"n": 1}, {"n": 2}, {"n": 3}]
+
+
+def test_failed_message_is_retried_in_the_background():
+    lark = FakeLark(SERVER_ERROR, TransportError("reset"), SERVER_ERROR)
+    acked = []
+    delivery = LarkDelivery(
+        lark.send, rate_limiter=RateLimiter([]), transport_errors=(TransportError,)
+    )
+    assert delivery.deliver({"n": 1}, lambda: acked.append(1)) == 503
+    wait_for(lambda: acked == [1])
+    assert len(lark.sent) == 4
+    assert delivery.stats()["sent"] == 1
+
+
+def test_rejected_message_is_acked():
+    lark = FakeLark(REJECTED)
+    acked = []
+    delivery = LarkDelivery(lark.send, rate_limiter=RateLimiter([]))
+    assert delivery.deliver({"n": 1}, lambda: acked.append(1)) == 200
+    assert acked == [1]
+    assert delivery.stats()["failed"] == 1
+
+
+def test_flusher_survives_unexpected_errors():
+    lark = FakeLark(SERVER_ERROR, ValueError("cannot encode"))
+    acked = []
+    delivery = LarkDelivery(lark.send, rate_limiter=RateLimiter([]))
+    delivery.deliver({"n": 1}, lambda: acked.append(1))
+    delivery.deliver({"n": 2}, lambda: acked.append(2))
+    wait_for(lambda: acked == [2])
+    assert delivery.stats()["failed"] == 1
+
+
+def test_open_circuit_queues_without_sending():
+    lark = FakeLark()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.2)
+    breaker.record_failure()
+    acked = []
+    delivery = LarkDelivery(
+        lark.send, rate_limiter=RateLimiter([]), circuit_breaker=breaker
+    )
+    assert delivery.deliver({"n": 1}, lambda: acked.append(1)) is None
+    assert lark.sent == []
+    wait_for(lambda: acked == [1])
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_close_stops_the_flusher_without_acking():
+    lark = FakeLark(*[SERVER_ERROR] * 100)
+    acked = []
+    delivery = LarkDelivery(lark.send, rate_limiter=RateLimiter([]))
+    delivery.deliver({"n": 1}, lambda: acked.append(1))
+    start = time.monotonic()
+    delivery.close()
+    assert time.monotonic() - start < 1
+    num_sent = len(lark.sent)
+    assert delivery.deliver({"n": 2}, lambda: acked.append(2)) is None
+    assert len(lark.sent) == num_sent
+    assert acked == []
+
+
+def test_dropped_message_is_acked():
+    lark = FakeLark()
+    acked = []
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    delivery = LarkDelivery(
+        lark.send, rate_limiter=RateLimiter([]), circuit_breaker=breaker, max_pending=2
+    )
+    for n in range(3):
+        delivery.deliver({"n": n}, lambda n=n: acked.append(n))
+    assert acked == [0]
+    assert delivery.stats()["dropped"] == 1
+    delivery.close()
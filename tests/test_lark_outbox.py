@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of LarkOutbox"""
+
+import os
+
+from lark_bot.lark_bot_client import LarkBotClient, Notification
+from lark_bot.lark_outbox import LarkOutbox
+
+
+def test_unacked_messages_are_replayed(tmp_path):
+    outbox = LarkOutbox(str(tmp_path))
+    first = outbox.put({"n": 1})
+    outbox.put({"n": 2})
+    outbox.ack(first)
+    outbox.close()
+
+    outbox = LarkOutbox(str(tmp_path))
+    assert [payload for _, payload in outbox.pending()] == [{"n": 2}]
+    outbox.close()
+
+
+def test_acked_segments_are_deleted(tmp_path):
+    outbox = LarkOutbox(str(tmp_path), segment_max_bytes=1)
+    message_ids = [outbox.put({"n": n}) for n in range(5)]
+    assert len(os.listdir(tmp_path)) == 5
+    for message_id in message_ids:
+        outbox.ack(message_id)
+    assert len(os.listdir(tmp_path)) == 1
+    outbox.close()
+
+    outbox = LarkOutbox(str(tmp_path))
+    assert outbox.pending() == []
+    outbox.close()
+
+
+def test_torn_record_is_skipped(tmp_path):
+    outbox = LarkOutbox(str(tmp_path))
+    outbox.put({"n": 1})
+    outbox.close()
+    (segment,) = os.listdir(tmp_path)
+    with open(os.path.join(tmp_path, segment), "a", encoding="utf-8") as f:
+        f.write('{"id": 1, "payl')
+
+    outbox = LarkOutbox(str(tmp_path))
+    assert [payload for _, payload in outbox.pending()] == [{"n": 1}]
+    outbox.close()
+
+
+def test_client_keeps_undelivered_messages_on_close(tmp_path, capsys):
+    # nothing listens on port 1, so the message stays pending
+    client = LarkBotClient("http://127.0.0.1:1/hook", outbox_dir=str(tmp_path))
+    client.post_notification(Notification("issues", "title", "#1", "url", "text"), [])
+    client.close()
+    assert "closed file" not in capsys.readouterr().err
+
+    outbox = LarkOutbox(str(tmp_path))
+    assert len(outbox.pending()) == 1
+    outbox.close()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of MentionExtractor"""
+
+from lark_bot.events import InvolveReason, MentionExtractor, PullRequestReviewCommentEvent
+
+TEXT = """Thanks @octocat and @Hub-ot, cc @org/team and me@example.com
+> @quoted wrote
+`@inline` <!-- @commented -->
+```
+@fenced
+```
+@octocat again"""
+
+
+def test_scan_skips_code_quotes_emails_and_teams():
+    assert MentionExtractor.scan(TEXT) == ("octocat", "Hub-ot")
+
+
+def test_extractors_keep_their_known_logins():
+    known = MentionExtractor(known_logins=lambda: {"hub-ot"})
+    assert known.find(TEXT) == ["Hub-ot"]
+    assert MentionExtractor().find(TEXT) == ["octocat", "Hub-ot"]
+
+
+def test_event_uses_the_given_extractor():
+    webhook_json = {
+        "action": "created",
+        "sender": {"login": "octocat"},
+        "repository": {"full_name": "octo/repo"},
+        "pull_request": {"title": "t", "number": 1, "user": {"login": "creator"}},
+        "comment": {"html_url": "", "body": TEXT, "pull_request_review_id": 1},
+    }
+    extractor = MentionExtractor(known_logins=lambda: {"octocat"})
+    event = PullRequestReviewCommentEvent(
+        "pull_request_review_comment", webhook_json, extractor
+    )
+    assert event.involved_users() == {
+        "creator": [InvolveReason.CREATOR],
+        "octocat": [InvolveReason.ATED_IN_COMMENT],
+    }
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of MockLarkServer"""
+
+import requests
+
+from lark_bot.lark_bot_client import Notification, build_card
+from lark_bot.mock_lark_server import (
+    CODE_FREQUENCY_LIMITED,
+    CODE_KEYWORD_MISMATCH,
+    CODE_PARAMS_INVALID,
+    MockLarkServer,
+)
+
+
+def notification(title: str) -> Notification:
+    return Notification("issues", title, "link", "https://github.com", "message")
+
+
+def test_records_valid_cards(sink):
+    card = build_card(notification("[GitHub] issue opened"), ["ou_1"])
+    response = requests.post(sink.url, json=card, timeout=5)
+    assert response.json()["code"] == 0
+    assert sink.messages() == [card]
+    assert requests.get(sink.url.replace("/hook", "/stats"), timeout=5).json() == {
+        "ok": 1
+    }
+
+
+def test_rejects_invalid_cards(sink):
+    card = build_card(notification("issue opened"), ["ou_1"])
+    card["card"]["data"]["template_variable"]["notification_title"] = "issue opened"
+    assert requests.post(sink.url, json=card, timeout=5).json()["code"] == (
+        CODE_KEYWORD_MISMATCH
+    )
+    assert requests.post(sink.url, json={}, timeout=5).json()["code"] == (
+        CODE_PARAMS_INVALID
+    )
+    assert sink.messages() == []
+    assert sink.stats() == {"invalid": 2}
+
+
+def test_rate_limit():
+    sink = MockLarkServer(("127.0.0.1", 0), rate_limit=True)
+    sink.serve_in_background()
+    try:
+        card = build_card(notification("[GitHub] issue opened"), [])
+        codes = [
+            requests.post(sink.url, json=card, timeout=5).json()["code"]
+            for _ in range(6)
+        ]
+        assert codes == [0] * 5 + [CODE_FREQUENCY_LIMITED]
+    finally:
+        sink.shutdown()
+        sink.server_close()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of NotificationCoalescer"""
+
+import time
+
+from lark_bot.lark_bot_client import Notification
+from lark_bot.notification_coalescer import NotificationCoalescer, digest_notifications
+
+
+def notification(message: str) -> Notification:
+    return Notification("issues", "[GitHub] Issue", "repo#1", "https://github.com", message)
+
+
+def test_merges_related_notifications_after_the_window():
+    posted = []
+    coalescer = NotificationCoalescer(
+        lambda n, user_ids: posted.append((n, user_ids)), window=0.1
+    )
+    coalescer.add(("repo", 1), notification("opened"), ["ou_1"])
+    coalescer.add(("repo", 1), notification("labeled"), ["ou_2", "ou_1"])
+    coalescer.add(("repo", 2), notification("other"), ["ou_3"])
+    assert posted == []
+    deadline = time.monotonic() + 5
+    while len(posted) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    coalescer.close()
+    merged = {tuple(user_ids): n for n, user_ids in posted}
+    assert merged[("ou_1", "ou_2")].title == "[GitHub] Issue (+1 updates)"
+    assert merged[("ou_1", "ou_2")].message == "opened\n\nlabeled"
+    assert merged[("ou_3",)].message == "other"
+
+
+def test_flushes_full_buffers_and_on_close():
+    posted = []
+    coalescer = NotificationCoalescer(
+        lambda n, user_ids: posted.append(n), window=60, max_notifications=2
+    )
+    coalescer.add("key", notification("1"), [])
+    coalescer.add("key", notification("2"), [])
+    assert len(posted) == 1
+    coalescer.add("key", notification("3"), [])
+    coalescer.close()
+    assert [n.message for n in posted] == ["1\n\n2", "3"]
+
+
+def test_a_failed_post_does_not_stop_the_flusher():
+    posted = []
+
+    def post(n, _):
+        if n.message == "fail":
+            raise RuntimeError("lark down")
+        posted.append(n)
+
+    coalescer = NotificationCoalescer(post, window=0.05)
+    coalescer.add(1, notification("fail"), [])
+    time.sleep(0.2)
+    coalescer.add(2, notification("ok"), [])
+    deadline = time.monotonic() + 5
+    while not posted and time.monotonic() < deadline:
+        time.sleep(0.01)
+    coalescer.close()
+    assert [n.message for n in posted] == ["ok"]
+
+
+def test_digest():
+    digest = digest_notifications([notification("a\nmore"), notification("b")])
+    assert digest.title == "Digest of 2 notifications"
+    assert digest.message.splitlines() == [
+        "- [repo#1](https://github.com) **[GitHub] Issue**: a",
+        "- [repo#1](https://github.com) **[GitHub] Issue**: b",
+    ]
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of PayloadDecoder"""
+
+import os
+
+import pytest
+
+from benchmark_skip_notification import FIXTURE_EVENTS
+from lark_bot import events
+from lark_bot.payload_decoder import PayloadDecoder, loads
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data")
+
+
+def describe(event: events.BaseGithubEvent):
+    return (
+        event.involved_users(),
+        event.notification_title(),
+        event.link_title(),
+        event.link_url(),
+        event.notification_message(),
+        event.should_skip_notification(None),
+    )
+
+
+@pytest.mark.parametrize("fixture", sorted(FIXTURE_EVENTS))
+def test_partial_payload_builds_the_same_event(fixture):
+    event_name = FIXTURE_EVENTS[fixture]
+    event_class = events.get_event_class(event_name)
+    if event_class is None:
+        pytest.skip(f"{event_name} is not notified")
+    with open(os.path.join(DATA_DIR, fixture), "rb") as f:
+        body = f.read()
+    partial = PayloadDecoder().decode(event_name, body)
+    full = loads(body)
+    assert describe(event_class(event_name, partial)) == describe(
+        event_class(event_name, full)
+    )
+
+
+def test_invalid_json():
+    with pytest.raises(ValueError):
+        PayloadDecoder().decode("issues", b'{"action": ')
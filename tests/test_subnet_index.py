@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of SubnetIndex"""
+
+import ipaddress
+import random
+
+from lark_bot.subnet_index import SubnetIndex
+
+SUBNETS = ["192.30.252.0/22", "185.199.108.0/22", "185.199.110.0/23", "2a0a:a440::/29"]
+
+
+def test_membership():
+    index = SubnetIndex(SUBNETS)
+    assert "192.30.252.1" in index
+    assert "192.30.255.255" in index
+    assert "192.30.256.0" not in index  # not an ip
+    assert "192.31.0.0" not in index
+    assert "2a0a:a440::1" in index
+    assert "::ffff:185.199.109.1" in index  # ipv4-mapped
+    assert "not an ip" not in index
+
+
+def test_matches_ipaddress():
+    index = SubnetIndex(SUBNETS, cache_size=16)
+    networks = [ipaddress.ip_network(subnet) for subnet in SUBNETS]
+    rng = random.Random(7)
+    for _ in range(2000):
+        ip = ipaddress.IPv4Address(
+            rng.choice([0xC01EFC00, 0xB9C76C00]) + rng.randint(-512, 1536)
+        )
+        expected = any(ip in network for network in networks)
+        assert (str(ip) in index) == expected, ip
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the webhook payload timestamps"""
+
+import calendar
+import time
+
+from lark_bot.events.timestamps import parse_timestamp, updated_within
+
+
+def test_parse_timestamp():
+    expected = calendar.timegm(time.strptime("2024-06-24T07:14:08", "%Y-%m-%dT%H:%M:%S"))
+    assert parse_timestamp("2024-06-24T07:14:08Z") == expected
+    assert parse_timestamp("2024-06-24T15:14:08+08:00") == expected
+
+
+def test_updated_within():
+    assert updated_within("2024-06-24T07:14:08Z", "2024-06-24T07:14:10Z", 2)
+    assert not updated_within("2024-06-24T07:14:08Z", "2024-06-24T07:14:11Z", 2)
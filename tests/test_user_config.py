@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of UserConfig"""
+
+from lark_bot.user_config import DEFAULT_CONFIG, UserConfig
+
+
+def test_layers_over_the_defaults():
+    config = UserConfig.from_json(
+        {"pr_review": False, "workflow_run_complete": ["failure", "cancelled"]}
+    )
+    assert not config.pr_review
+    assert config.workflow_run_complete == frozenset({"failure", "cancelled"})
+    assert config.assignee == DEFAULT_CONFIG.assignee
+    # equal configs are equal and hashable, so that users can share a rule
+    assert config == UserConfig.from_json(
+        {"workflow_run_complete": ["cancelled", "failure"], "pr_review": False}
+    )
+    assert hash(config) != hash(DEFAULT_CONFIG)
+
+
+def test_string_workflow_conclusions():
+    config = UserConfig.from_json({"workflow_run_complete": "failure, timed_out"})
+    assert config.workflow_run_complete == frozenset({"failure", "timed_out"})
+
+
+def test_invalid_values_are_reported_and_ignored(capsys):
+    config = UserConfig.from_json(
+        {"assignee": "yes", "digest_interval": -1, "unknown": 1}, "octocat.json"
+    )
+    assert config is DEFAULT_CONFIG
+    out = capsys.readouterr().out
+    assert "invalid value of assignee in octocat.json" in out
+    assert "invalid value of digest_interval" in out
+    assert "unknown keys in octocat.json: ['unknown']" in out
+
+
+def test_load_falls_back_to_the_defaults(tmp_path):
+    assert UserConfig.load(str(tmp_path / "missing.json")) is DEFAULT_CONFIG
+    broken = tmp_path / "broken.json"
+    broken.write_text("{")
+    assert UserConfig.load(str(broken)) is DEFAULT_CONFIG
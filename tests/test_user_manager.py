@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the notification decision and the reload of UserManager"""
+
+import json
+import os
+import random
+
+from lark_bot.events import InvolveReason
+from lark_bot.user_config import WORKFLOW_RUN_CONCLUSIONS
+from lark_bot.user_manager import User, UserManager
+from fakes import StopAfter
+
+BOTS = ["coderabbitai[bot]", "coderabbitai"]
+BASELINE_DEFAULT_CONFIG = {
+    "bot_pr_review": False,
+    "pr_review": True,
+    InvolveReason.WORKFLOW_RUN_COMPLETE: {"failure"},
+    InvolveReason.ASSIGNEE: True,
+    InvolveReason.ATED_IN_ISSUE: True,
+    InvolveReason.ATED_IN_COMMENT: True,
+    InvolveReason.REVIEWER: True,
+}
+REASONS = [
+    InvolveReason.CREATOR,
+    InvolveReason.ATED_IN_ISSUE,
+    InvolveReason.ATED_IN_COMMENT,
+    InvolveReason.ASSIGNEE,
+    InvolveReason.REVIEWER,
+    InvolveReason.SENDER,
+] + [f"{InvolveReason.WORKFLOW_RUN_COMPLETE}.{c}" for c in WORKFLOW_RUN_CONCLUSIONS]
+EVENT_NAMES = ["issues", "issue_comment", "pull_request", "pull_request_review"]
+
+
+class FakeEvent:
+    def __init__(self, event_name: str, sender: str) -> None:
+        self.event_name = event_name
+        self._sender = sender
+
+    def get_sender(self) -> str:
+        return self._sender
+
+
+def baseline_notify(config_json, reasons, event: FakeEvent) -> bool:
+    """The per-call decision of User.notify before configs were compiled to rules."""
+    config = dict(BASELINE_DEFAULT_CONFIG)
+    config.update({k: v for k, v in config_json.items() if k in config})
+    to_notify = False
+    if event.get_sender() in BOTS and config["bot_pr_review"] is not True:
+        return False
+    for reason in reasons:
+        if reason in config and config[reason] is True:
+            to_notify = True
+            break
+        if len(reason.rsplit(".", 1)) == 2:
+            reason_main, detail = reason.rsplit(".", 1)
+            if reason_main in config and detail in config[reason_main]:
+                to_notify = True
+                break
+    if not to_notify and InvolveReason.CREATOR in reasons:
+        if event.event_name == "pull_request_review":
+            if event.get_sender() in BOTS:
+                if config["bot_pr_review"]:
+                    to_notify = True
+            elif config["pr_review"]:
+                to_notify = True
+    return to_notify
+
+
+def random_config(rng: random.Random):
+    config = {}
+    for key in BASELINE_DEFAULT_CONFIG:
+        if rng.random() < 0.5:
+            continue
+        if key == InvolveReason.WORKFLOW_RUN_COMPLETE:
+            conclusions = rng.sample(WORKFLOW_RUN_CONCLUSIONS, rng.randint(0, 3))
+            # a list, or a string as accepted by the baseline
+            config[key] = conclusions if rng.random() < 0.5 else ",".join(conclusions)
+        else:
+            config[key] = rng.random() < 0.5
+    return config
+
+
+def test_rules_match_the_baseline_decision(tmp_path):
+    rng = random.Random(20231017)
+    for i in range(500):
+        config_json = random_config(rng)
+        config_path = tmp_path / f"{i}.json"
+        config_path.write_text(json.dumps(config_json))
+        user = User("user", "lark_id", str(config_path))
+        for _ in range(20):
+            reasons = rng.sample(REASONS, rng.randint(0, 3))
+            event = FakeEvent(rng.choice(EVENT_NAMES), rng.choice(BOTS + ["octocat"]))
+            expected = baseline_notify(config_json, reasons, event)
+            assert (user.notify(reasons, event) is not None) == expected, (
+                config_json,
+                reasons,
+                event.event_name,
+                event.get_sender(),
+            )
+
+
+def test_notify_users(tmp_path):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"workflow_run_complete": "failure cancelled"}))
+    user_list = tmp_path / "user_list"
+    user_list.write_text(f"Alice ou_alice {config_path}\nBob ou_bob\n")
+    manager = UserManager(str(user_list), reload_interval=0)
+    cancelled = [f"{InvolveReason.WORKFLOW_RUN_COMPLETE}.cancelled"]
+    notified = manager.notify_users(
+        {"alice": cancelled, "Bob": cancelled, "carol": cancelled, "coderabbitai": []},
+        FakeEvent("workflow_run", "octocat"),
+    )
+    assert notified == [("ou_alice", 0)]
+
+
+def bump_mtime(path):
+    """Move the modification time on, as a rewrite within the mtime granularity may not."""
+    mtime = os.stat(path).st_mtime + 10
+    os.utime(path, (mtime, mtime))
+
+
+def reload_once(manager: UserManager):
+    """Run one poll of the reloader on this thread."""
+    manager._stop_event = StopAfter(2)
+    manager._reload_loop(0)
+
+
+def test_reload_swaps_the_directory(tmp_path, capsys):
+    config_path = tmp_path / "alice.json"
+    config_path.write_text(json.dumps({"pr_review": False}))
+    user_list = tmp_path / "user_list"
+    user_list.write_text(f"Alice ou_alice {config_path}\nBob ou_bob\n")
+    manager = UserManager(str(user_list), reload_interval=0)
+    directory = manager._directory
+    assert not manager.get_user("alice").config.pr_review
+
+    # nothing changed, nothing reloaded
+    reload_once(manager)
+    assert manager._directory is directory
+
+    config_path.write_text(json.dumps({"pr_review": True}))
+    user_list.write_text(f"Alice ou_alice2 {config_path}\nCarol ou_carol\n")
+    bump_mtime(config_path)
+    bump_mtime(user_list)
+    reload_once(manager)
+    assert manager._directory is not directory
+    alice = manager.get_user("alice")
+    assert alice.user_id == "ou_alice2" and alice.config.pr_review
+    assert manager.get_user("bob") is None
+    assert manager.get_user("carol").user_id == "ou_carol"
+    assert "Reloaded 2 users" in capsys.readouterr().out
+
+    # e.g. saved in the wrong encoding, the users loaded before are kept
+    directory = manager._directory
+    user_list.write_bytes(b"Alice ou_alice \xff\n")
+    bump_mtime(user_list)
+    reload_once(manager)
+    assert manager._directory is directory
+    assert manager.get_user("carol").user_id == "ou_carol"
+    assert "WARNING: failed to reload" in capsys.readouterr().out
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of the user store formats"""
+
+import json
+import sqlite3
+
+from lark_bot.user_manager import UserManager
+from lark_bot.user_store import (
+    FlatFileUserStore,
+    JsonLinesUserStore,
+    SqliteUserStore,
+    UserEntry,
+    open_user_store,
+)
+
+OCTOCAT = UserEntry("octocat", "ou_octo", None, 583231, "octocat@example.com")
+
+
+def test_open_user_store_by_extension():
+    assert isinstance(open_user_store("users.jsonl"), JsonLinesUserStore)
+    assert isinstance(open_user_store("users.DB"), SqliteUserStore)
+    assert isinstance(open_user_store("users.sqlite3"), SqliteUserStore)
+    assert isinstance(open_user_store("user_list"), FlatFileUserStore)
+
+
+def test_flat_file_skips_invalid_lines(tmp_path):
+    path = tmp_path / "user_list"
+    path.write_text("octocat ou_octo octocat.json\n\ninvalid\nhubot ou_hubot\n")
+    assert FlatFileUserStore(str(path)).load() == [
+        UserEntry("octocat", "ou_octo", "octocat.json"),
+        UserEntry("hubot", "ou_hubot"),
+    ]
+
+
+def test_json_lines_skips_invalid_lines(tmp_path):
+    path = tmp_path / "users.jsonl"
+    path.write_text(
+        json.dumps(OCTOCAT._asdict())
+        + "\n{not json\n"
+        + json.dumps({"github_login_name": "hubot"})
+        + "\n"
+    )
+    assert JsonLinesUserStore(str(path)).load() == [OCTOCAT]
+
+
+def test_sqlite_store(tmp_path):
+    path = str(tmp_path / "users.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE users (github_login_name TEXT PRIMARY KEY, user_id TEXT, "
+        "config_path TEXT, github_id INTEGER, email TEXT)"
+    )
+    conn.execute("INSERT INTO users VALUES (?, ?, ?, ?, ?)", OCTOCAT)
+    conn.execute("INSERT INTO users VALUES ('hubot', NULL, NULL, NULL, NULL)")
+    conn.commit()
+    conn.close()
+    store = SqliteUserStore(path)
+    assert store.load() == [OCTOCAT]
+    assert store.watched_paths() == [path, path + "-wal"]
+
+
+def test_user_manager_looks_up_by_any_key(tmp_path):
+    path = tmp_path / "users.jsonl"
+    path.write_text(json.dumps(OCTOCAT._asdict()) + "\n")
+    manager = UserManager(str(path), reload_interval=0)
+    assert manager.get_user("OctoCat").user_id == "ou_octo"
+    assert manager.get_user("unknown", github_id="583231").user_id == "ou_octo"
+    assert manager.get_user(email="OCTOCAT@example.com").user_id == "ou_octo"
+    assert manager.get_user("unknown") is None
+
+
+def test_user_manager_skips_invalid_entries(tmp_path, capsys):
+    path = tmp_path / "users.jsonl"
+    records = [
+        dict(OCTOCAT._asdict(), github_id="583231"),
+        {"github_login_name": "hubot", "user_id": "ou_hubot", "github_id": "hubot"},
+        {"github_login_name": "monalisa", "user_id": "ou_mona", "email": 1},
+        {"github_login_name": "", "user_id": "ou_empty"},
+    ]
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    manager = UserManager(str(path), reload_interval=0)
+    assert list(manager.known_logins()) == ["octocat"]
+    assert manager.get_user(github_id=583231).user_id == "ou_octo"
+    warnings = capsys.readouterr().out
+    assert "invalid github_id of hubot: 'hubot'" in warnings
+    assert "invalid email of monalisa: 1" in warnings
+    assert "invalid github login ''" in warnings
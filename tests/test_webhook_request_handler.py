@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#
+# Copyright 2023 Kasma
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests of NotifyLarkRequestHandler"""
+
+import http.client
+import json
+import socket
+import threading
+from functools import partial
+from http.server import HTTPServer
+
+import pytest
+
+from lark_bot.github_webhook_request_handler import NotifyLarkRequestHandler
+from lark_bot.webhook_ingestor import WebhookIngestor
+from fakes import AllowedIps, FakeEventHandler
+
+
+class KeepAliveRequestHandler(NotifyLarkRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+
+@pytest.fixture
+def ingestor(tmp_path):
+    handler = FakeEventHandler()
+    handler.release.set()
+    ingestor = WebhookIngestor(handler, event_log_dir=str(tmp_path))
+    yield ingestor
+    ingestor.shutdown()
+
+
+def start_server(request_handler_class, ingestor, ip_manager) -> HTTPServer:
+    httpd = HTTPServer(
+        ("127.0.0.1", 0), partial(request_handler_class, ingestor, ip_manager)
+    )
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def post(conn: http.client.HTTPConnection, event: str, delivery_id: str):
+    conn.request(
+        "POST",
+        "/",
+        json.dumps({"action": "opened", "padding": "x" * 100000}),
+        {"X-GitHub-Event": event, "X-GitHub-Delivery": delivery_id},
+    )
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_requests_answered_from_headers_keep_the_connection_usable(ingestor):
+    httpd = start_server(KeepAliveRequestHandler, ingestor, AllowedIps(True))
+    conn = http.client.HTTPConnection("127.0.0.1", httpd.server_port, timeout=5)
+    try:
+        assert post(conn, "ping", "1") == (200, {"status": "ignored"})
+        assert post(conn, "issues", "2")[0] == 202
+        # a redelivery, answered 409 if the first copy is still being processed
+        assert post(conn, "issues", "2")[0] in (200, 409)
+        assert post(conn, "issues", "3")[0] == 202
+    finally:
+        conn.close()
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def get_status(port: int, path: str) -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("GET", path)
+    status = conn.getresponse().status
+    conn.close()
+    return status
+
+
+def test_stats_require_an_allowed_ip(ingestor):
+    ip_manager = AllowedIps(True)
+    httpd = start_server(NotifyLarkRequestHandler, ingestor, ip_manager)
+    try:
+        assert get_status(httpd.server_port, "/stats") == 200
+        ip_manager.allowed = False
+        assert get_status(httpd.server_port, "/stats") == 403
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_delivery_without_content_length_is_released(ingestor):
+    httpd = start_server(KeepAliveRequestHandler, ingestor, AllowedIps(True))
+    try:
+        with socket.create_connection(("127.0.0.1", httpd.server_port), timeout=5) as s:
+            s.sendall(
+                b"POST / HTTP/1.1\r\nX-GitHub-Event: issues\r\n"
+                b"X-GitHub-Delivery: 1\r\n\r\n"
+            )
+            assert s.recv(1024).startswith(b"HTTP/1.1 411")
+        # the redelivery is processed rather than answered 409 "in progress"
+        conn = http.client.HTTPConnection("127.0.0.1", httpd.server_port, timeout=5)
+        try:
+            assert post(conn, "issues", "1")[0] == 202
+        finally:
+            conn.close()
+    finally:
+        httpd.shutdown()
+        httpd.server_close()